@@ -16,12 +16,17 @@
 import base64
 import json
 import logging
+import os
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from copy import deepcopy
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import copy, deepcopy
 from functools import partial
 from typing import Any, Union, Tuple
 
+import xxhash
+from cachetools import LRUCache
+
 from agent.component import component_class
 from agent.component.base import ComponentBase
 from api.db.services.file_service import FileService
@@ -29,6 +34,87 @@ from api.utils import get_uuid, hash_str2int
 from rag.prompts.prompts import chunks_format
 from rag.utils.redis_conn import REDIS_CONN
 
+CANVAS_PLAN_CACHE_SIZE = int(os.environ.get("CANVAS_PLAN_CACHE_SIZE", 256))
+# Components of all the canvases run on a shared pool, at most CANVAS_RUN_WORKERS at a time per run.
+CANVAS_WORKERS = int(os.environ.get("CANVAS_WORKERS", 64))
+CANVAS_RUN_WORKERS = int(os.environ.get("CANVAS_RUN_WORKERS", 5))
+canvas_executor = ThreadPoolExecutor(max_workers=CANVAS_WORKERS, thread_name_prefix="canvas")
+# Params holding what a run does rather than how the component is set up.
+RUN_PARAMS = ("inputs", "outputs", "debug_inputs")
+# Tool calls of a message are appended to a Redis stream, trimmed to about its last CANVAS_TRACE_MAXLEN ones.
+CANVAS_TRACE_MAXLEN = int(os.environ.get("CANVAS_TRACE_MAXLEN", 1000))
+CANVAS_TRACE_TTL = int(os.environ.get("CANVAS_TRACE_TTL", 60 * 10))
+
+
+def trace_key(task_id, message_id):
+    return f"{task_id}-{message_id}-trace"
+
+
+def group_traces(entries):
+    """Groups consecutive tool calls of the same component: [{"component_id", "trace": [...]}]."""
+    res = []
+    for e in entries:
+        e = dict(e)
+        cpn_id = e.pop("component_id")
+        if not res or res[-1]["component_id"] != cpn_id:
+            res.append({"component_id": cpn_id, "trace": []})
+        res[-1]["trace"].append(e)
+    return res
+
+
+class CanvasPlan:
+    """
+    The validated params of the components of a DSL, leaving out the run params.
+
+    Building a canvas used to update and check a new param object for every
+    component on every request. Plans are cached by the hash of the components
+    without their run params, which runs don't change, so a canvas only
+    deep-copies its params from the plan and sets the run params of its DSL.
+    """
+    _cache = LRUCache(maxsize=CANVAS_PLAN_CACHE_SIZE)
+    _lock = threading.Lock()
+
+    def __init__(self, components, names):
+        cpn_nms = set([cpn["obj"]["component_name"] for cpn in components.values()])
+        assert "Begin" in cpn_nms, "There have to be an 'Begin' component."
+
+        self.params = {}
+        for k, cpn in components.items():
+            param = component_class(cpn["obj"]["component_name"] + "Param")()
+            param.update(cpn["obj"]["params"])
+            try:
+                param.check()
+            except Exception as e:
+                raise ValueError(names.get(k, "") + f": {e}")
+            self.params[k] = (cpn["obj"]["component_name"], param)
+
+    @classmethod
+    def compile(cls, components, names):
+        static = {}
+        for k, cpn in components.items():
+            params = {p: v for p, v in cpn["obj"]["params"].items() if p not in RUN_PARAMS}
+            static[k] = {"component_name": cpn["obj"]["component_name"], "params": params}
+        version = xxhash.xxh64(json.dumps(static, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        with cls._lock:
+            plan = cls._cache.get(version)
+        if plan is None:
+            plan = CanvasPlan(deepcopy({k: {"obj": cpn} for k, cpn in static.items()}), names)
+            with cls._lock:
+                cls._cache[version] = plan
+        return plan
+
+    def instantiate(self, canvas, components):
+        """Component objects of `canvas`, with the run params of `components`."""
+        objs = {}
+        for k, cpn in components.items():
+            component_name, param = self.params[k]
+            param = deepcopy(param)
+            for p in RUN_PARAMS:
+                if p in cpn["obj"]["params"]:
+                    setattr(param, p, cpn["obj"]["params"][p])
+            objs[k] = component_class(component_name)(canvas, k, param)
+        return objs
+
 
 class Canvas:
     """
@@ -71,7 +157,7 @@ class Canvas:
     }
     """
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None):
+    def __init__(self, dsl: Union[str, dict], tenant_id=None, task_id=None):
         self.path = []
         self.history = []
         self.components = {}
@@ -82,7 +168,8 @@ class Canvas:
             "sys.conversation_turns": 0,
             "sys.files": []
         }
-        self.dsl = json.loads(dsl) if dsl else {
+        # A dict is taken as is, e.g. a DSL column just read from the database.
+        self.dsl = (json.loads(dsl) if isinstance(dsl, str) else dsl) if dsl else {
             "components": {
                 "begin": {
                     "obj": {
@@ -111,28 +198,17 @@ class Canvas:
         self.load()
 
     def load(self):
-        self.components = self.dsl["components"]
-        cpn_nms = set([])
-        for k, cpn in self.components.items():
-            cpn_nms.add(cpn["obj"]["component_name"])
-
-        assert "Begin" in cpn_nms, "There have to be an 'Begin' component."
-
-        for k, cpn in self.components.items():
-            cpn_nms.add(cpn["obj"]["component_name"])
-            param = component_class(cpn["obj"]["component_name"] + "Param")()
-            param.update(cpn["obj"]["params"])
-            try:
-                param.check()
-            except Exception as e:
-                raise ValueError(self.get_component_name(k) + f": {e}")
-
-            cpn["obj"] = component_class(cpn["obj"]["component_name"])(self, k, param)
-
-        self.path = self.dsl["path"]
-        self.history = self.dsl["history"]
+        self.component_names = {n["id"]: n["data"]["name"] for n in self.dsl.get("graph", {}).get("nodes", [])}
+        plan = CanvasPlan.compile(self.dsl["components"], self.component_names)
+        objs = plan.instantiate(self, self.dsl["components"])
+        self.components = {k: {**cpn, "obj": objs[k]} for k, cpn in self.dsl["components"].items()}
+        self.ancestors = {}
+
+        # Copied: runs append to them, and they'd change the caller's DSL in place otherwise, failed runs included.
+        self.path = copy(self.dsl["path"])
+        self.history = copy(self.dsl["history"])
         if "globals" in self.dsl:
-            self.globals = self.dsl["globals"]
+            self.globals = copy(self.dsl["globals"])
         else:
             self.globals = {
             "sys.query": "",
@@ -141,8 +217,8 @@ class Canvas:
             "sys.files": []
         }
             
-        self.retrieval = self.dsl["retrieval"]
-        self.memory = self.dsl.get("memory", [])
+        self.retrieval = copy(self.dsl["retrieval"])
+        self.memory = copy(self.dsl.get("memory", []))
 
     def __str__(self):
         self.dsl["path"] = self.path
@@ -169,6 +245,31 @@ class Canvas:
                 dsl["components"][k][c] = deepcopy(cpn[c])
         return json.dumps(dsl, ensure_ascii=False)
 
+    def state(self) -> dict:
+        """What runs change: path, history, globals, references, memory and the run params of every component."""
+        return {
+            "path": self.path,
+            "history": self.history,
+            "globals": self.globals,
+            "task_id": self.task_id,
+            "retrieval": self.retrieval,
+            "memory": self.memory,
+            "components": {k: cpn["obj"]._param.as_dict(RUN_PARAMS) for k, cpn in self.components.items()},
+        }
+
+    def dump(self) -> dict:
+        """
+        The DSL this canvas was loaded from with its current state, like `json.loads(str(self))`
+        but only the run params are serialized: the rest of the DSL is shared, not copied.
+        """
+        state = self.state()
+        run_params = state.pop("components")
+        dsl = {**self.dsl, **state, "components": {}}
+        for k, cpn in self.dsl["components"].items():
+            params = {**cpn["obj"]["params"], **run_params[k]}
+            dsl["components"][k] = {**cpn, "obj": {**cpn["obj"], "params": params}}
+        return dsl
+
     def reset(self, mem=False):
         self.path = []
         if not mem:
@@ -198,10 +299,7 @@ class Canvas:
             logging.exception(e)
 
     def get_component_name(self, cid):
-        for n in self.dsl.get("graph", {}).get("nodes", []):
-            if cid == n["id"]:
-                return n["data"]["name"]
-        return ""
+        return self.component_names.get(cid, "")
 
     def run(self, **kwargs):
         st = time.perf_counter()
@@ -239,17 +337,11 @@ class Canvas:
         yield decorate("workflow_started", {"inputs": kwargs.get("inputs")})
         self.retrieval.append({"chunks": {}, "doc_aggs": {}})
 
-        def _run_batch(f, t):
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                thr = []
-                for i in range(f, t):
-                    cpn = self.get_component_obj(self.path[i])
-                    if cpn.component_name.lower() in ["begin", "userfillup"]:
-                        thr.append(executor.submit(cpn.invoke, inputs=kwargs.get("inputs", {})))
-                    else:
-                        thr.append(executor.submit(cpn.invoke, **cpn.get_input()))
-                for t in thr:
-                    t.result()
+        def _submit(i):
+            cpn = self.get_component_obj(self.path[i])
+            if cpn.component_name.lower() in ["begin", "userfillup"]:
+                return canvas_executor.submit(cpn.invoke, inputs=kwargs.get("inputs", {}))
+            return canvas_executor.submit(cpn.invoke, **cpn.get_input())
 
         def _node_finished(cpn_obj):
             return decorate("node_finished",{
@@ -263,12 +355,117 @@ class Canvas:
                            "created_at": cpn_obj.output("_created_time"),
                        })
 
+        def _blocked(i):
+            # A component waits while a running or waiting one may still lead to its upstream ones,
+            # and for its previous run if it's already in the path.
+            cpn_id = self.path[i]
+            running_ids = set([self.path[j] for j in running.values()])
+            if cpn_id in running_ids or cpn_id in [self.path[j] for j in waiting if j < i]:
+                return True
+            ancestors = self.get_ancestors(cpn_id)
+            return any(c in ancestors for c in running_ids) or any(self.path[j] in ancestors for j in waiting if j != i)
+
+        def _finished(i):
+            # post processing of components invocation
+            cpn = self.get_component(self.path[i])
+            cpn_obj = self.get_component_obj(self.path[i])
+            if cpn_obj.component_name.lower() == "message":
+                if isinstance(cpn_obj.output("content"), partial):
+                    _m = ""
+                    for m in cpn_obj.output("content")():
+                        if not m:
+                            continue
+                        if m == "<think>":
+                            yield decorate("message", {"content": "", "start_to_think": True})
+                        elif m == "</think>":
+                            yield decorate("message", {"content": "", "end_to_think": True})
+                        else:
+                            yield decorate("message", {"content": m})
+                            _m += m
+                    cpn_obj.set_output("content", _m)
+                else:
+                    yield decorate("message", {"content": cpn_obj.output("content")})
+                yield decorate("message_end", {"reference": self.get_reference()})
+
+                while partials:
+                    _cpn_obj = self.get_component_obj(partials[0])
+                    if isinstance(_cpn_obj.output("content"), partial):
+                        break
+                    yield _node_finished(_cpn_obj)
+                    partials.pop(0)
+
+            other_branch = False
+            if cpn_obj.error():
+                ex = cpn_obj.exception_handler()
+                if ex and ex["goto"]:
+                    self.path.extend(ex["goto"])
+                    other_branch = True
+                elif ex and ex["default_value"]:
+                    yield decorate("message", {"content": ex["default_value"]})
+                    yield decorate("message_end", {})
+                else:
+                    self.error = cpn_obj.error()
+
+            if cpn_obj.component_name.lower() != "iteration":
+                if isinstance(cpn_obj.output("content"), partial):
+                    if self.error:
+                        cpn_obj.set_output("content", None)
+                        yield _node_finished(cpn_obj)
+                    else:
+                        partials.append(self.path[i])
+                else:
+                    yield _node_finished(cpn_obj)
+
+            def _append_path(cpn_id):
+                nonlocal other_branch
+                if other_branch:
+                    return
+                if self.path[-1] == cpn_id:
+                    return
+                # Joins of branches run once, after the last one.
+                if cpn_id in self.path[scanned:] or cpn_id in [self.path[j] for j in waiting]:
+                    return
+                self.path.append(cpn_id)
+
+            def _extend_path(cpn_ids):
+                nonlocal other_branch
+                if other_branch:
+                    return
+                for cpn_id in cpn_ids:
+                    _append_path(cpn_id)
+
+            if cpn_obj.component_name.lower() == "iterationitem" and cpn_obj.end():
+                iter = cpn_obj.get_parent()
+                yield _node_finished(iter)
+                _extend_path(self.get_component(cpn["parent_id"])["downstream"])
+            elif cpn_obj.component_name.lower() in ["categorize", "switch"]:
+                _extend_path(cpn_obj.output("_next"))
+            elif cpn_obj.component_name.lower() == "iteration":
+                _append_path(cpn_obj.get_start())
+            elif not cpn["downstream"] and cpn_obj.get_parent():
+                _append_path(cpn_obj.get_parent().get_start())
+            else:
+                _extend_path(cpn["downstream"])
+
         self.error = ""
         idx = len(self.path) - 1
         partials = []
-        while idx < len(self.path):
-            to = len(self.path)
-            for i in range(idx, to):
+        # Positions in the path of the components waiting to run, and of the running ones by future.
+        waiting, running = [], {}
+        scanned, failed, user_fillup = idx, None, False
+        while True:
+            if any([self.get_component_obj(c).component_name.lower() == "userfillup" for c in self.path[max(scanned, idx + 1):]]):
+                user_fillup = True
+            waiting.extend(range(scanned, len(self.path)))
+            scanned = len(self.path)
+
+            # Once an error or a user input form shows up, the running components are only waited for.
+            while waiting and not self.error and not user_fillup and len(running) < CANVAS_RUN_WORKERS:
+                # Loops may block each other, the first waiting component then runs anyway.
+                i = next((i for i in waiting if not _blocked(i)), None if running else waiting[0])
+                if i is None:
+                    break
+                waiting.remove(i)
                 yield decorate("node_started", {
                     "inputs": None, "created_at": int(time.time()),
                     "component_id": self.path[i],
@@ -276,108 +473,36 @@ class Canvas:
                     "component_type": self.get_component_type(self.path[i]),
                     "thoughts": self.get_component_thoughts(self.path[i])
                 })
-            _run_batch(idx, to)
-
-            # post processing of components invocation
-            for i in range(idx, to):
-                cpn = self.get_component(self.path[i])
-                cpn_obj = self.get_component_obj(self.path[i])
-                if cpn_obj.component_name.lower() == "message":
-                    if isinstance(cpn_obj.output("content"), partial):
-                        _m = ""
-                        for m in cpn_obj.output("content")():
-                            if not m:
-                                continue
-                            if m == "<think>":
-                                yield decorate("message", {"content": "", "start_to_think": True})
-                            elif m == "</think>":
-                                yield decorate("message", {"content": "", "end_to_think": True})
-                            else:
-                                yield decorate("message", {"content": m})
-                                _m += m
-                        cpn_obj.set_output("content", _m)
-                    else:
-                        yield decorate("message", {"content": cpn_obj.output("content")})
-                    yield decorate("message_end", {"reference": self.get_reference()})
-
-                    while partials:
-                        _cpn_obj = self.get_component_obj(partials[0])
-                        if isinstance(_cpn_obj.output("content"), partial):
-                            break
-                        yield _node_finished(_cpn_obj)
-                        partials.pop(0)
-
-                other_branch = False
-                if cpn_obj.error():
-                    ex = cpn_obj.exception_handler()
-                    if ex and ex["goto"]:
-                        self.path.extend(ex["goto"])
-                        other_branch = True
-                    elif ex and ex["default_value"]:
-                        yield decorate("message", {"content": ex["default_value"]})
-                        yield decorate("message_end", {})
-                    else:
-                        self.error = cpn_obj.error()
-
-                if cpn_obj.component_name.lower() != "iteration":
-                    if isinstance(cpn_obj.output("content"), partial):
-                        if self.error:
-                            cpn_obj.set_output("content", None)
-                            yield _node_finished(cpn_obj)
-                        else:
-                            partials.append(self.path[i])
-                    else:
-                        yield _node_finished(cpn_obj)
+                running[_submit(i)] = i
+            if not running:
+                break
 
-                def _append_path(cpn_id):
-                    nonlocal other_branch
-                    if other_branch:
-                        return
-                    if self.path[-1] == cpn_id:
-                        return
-                    self.path.append(cpn_id)
-
-                def _extend_path(cpn_ids):
-                    nonlocal other_branch
-                    if other_branch:
-                        return
-                    for cpn_id in cpn_ids:
-                        _append_path(cpn_id)
-
-                if cpn_obj.component_name.lower() == "iterationitem" and cpn_obj.end():
-                    iter = cpn_obj.get_parent()
-                    yield _node_finished(iter)
-                    _extend_path(self.get_component(cpn["parent_id"])["downstream"])
-                elif cpn_obj.component_name.lower() in ["categorize", "switch"]:
-                    _extend_path(cpn_obj.output("_next"))
-                elif cpn_obj.component_name.lower() == "iteration":
-                    _append_path(cpn_obj.get_start())
-                elif not cpn["downstream"] and cpn_obj.get_parent():
-                    _append_path(cpn_obj.get_parent().get_start())
-                else:
-                    _extend_path(cpn["downstream"])
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for f in sorted(done, key=lambda f: running[f]):
+                i = running.pop(f)
+                f.result()
+                yield from _finished(i)
+                if self.error and failed is None:
+                    failed = i
+
+        if self.error:
+            logging.error(f"Runtime Error: {self.error}")
+            self.path = self.path[:failed]
+        elif user_fillup:
+            path = [self.path[i] for i in waiting if self.get_component_obj(self.path[i]).component_name.lower() == "userfillup"]
+            path.extend([self.path[i] for i in waiting if self.get_component_obj(self.path[i]).component_name.lower() != "userfillup"])
+            another_inputs = {}
+            tips = ""
+            for c in path:
+                o = self.get_component_obj(c)
+                if o.component_name.lower() == "userfillup":
+                    another_inputs.update(o.get_input_elements())
+                    if o.get_param("enable_tips"):
+                        tips = o.get_param("tips")
+            self.path = path
+            yield decorate("user_inputs", {"inputs": another_inputs, "tips": tips})
+            return
 
-            if self.error:
-                logging.error(f"Runtime Error: {self.error}")
-                break
-            idx = to
-
-            if any([self.get_component_obj(c).component_name.lower() == "userfillup" for c in self.path[idx:]]):
-                path = [c for c in self.path[idx:] if self.get_component(c)["obj"].component_name.lower() == "userfillup"]
-                path.extend([c for c in self.path[idx:] if self.get_component(c)["obj"].component_name.lower() != "userfillup"])
-                another_inputs = {}
-                tips = ""
-                for c in path:
-                    o = self.get_component_obj(c)
-                    if o.component_name.lower() == "userfillup":
-                        another_inputs.update(o.get_input_elements())
-                        if o.get_param("enable_tips"):
-                            tips = o.get_param("tips")
-                self.path = path
-                yield decorate("user_inputs", {"inputs": another_inputs, "tips": tips})
-                return
-
-        self.path = self.path[:idx]
         if not self.error:
             yield decorate("workflow_finished",
                        {
@@ -388,6 +513,19 @@ class Canvas:
                        })
             self.history.append(("assistant", self.get_component_obj(self.path[-1]).output()))
 
+    def get_ancestors(self, cpn_id) -> set[str]:
+        """The components leading to `cpn_id` through upstream links."""
+        if cpn_id not in self.ancestors:
+            ancestors, stack = set(), list(self.components.get(cpn_id, {}).get("upstream", []))
+            while stack:
+                c = stack.pop()
+                if c in ancestors or c not in self.components:
+                    continue
+                ancestors.add(c)
+                stack.extend(self.components[c].get("upstream", []))
+            self.ancestors[cpn_id] = ancestors
+        return self.ancestors[cpn_id]
+
     def get_component(self, cpn_id) -> Union[None, dict[str, Any]]:
         return self.components.get(cpn_id)
 
@@ -502,25 +640,12 @@ class Canvas:
         agent_ids = agent_id.split("-->")
         agent_name = self.get_component_name(agent_ids[0])
         path = agent_name if len(agent_ids) < 2 else agent_name+"-->"+"-->".join(agent_ids[1:])
-        try:
-            bin = REDIS_CONN.get(f"{self.task_id}-{self.message_id}-logs")
-            if bin:
-                obj = json.loads(bin.encode("utf-8"))
-                if obj[-1]["component_id"] == agent_ids[0]:
-                    obj[-1]["trace"].append({"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time})
-                else:
-                    obj.append({
-                    "component_id": agent_ids[0],
-                    "trace": [{"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time}]
-                })
-            else:
-                obj = [{
-                    "component_id": agent_ids[0],
-                    "trace": [{"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time}]
-                }]
-            REDIS_CONN.set_obj(f"{self.task_id}-{self.message_id}-logs", obj, 60*10)
-        except Exception as e:
-            logging.exception(e)
+        # One atomic append per call: concurrent tools can't overwrite each other's entries.
+        if not REDIS_CONN.stream_append(trace_key(self.task_id, self.message_id),
+                                        {"component_id": agent_ids[0], "path": path, "tool_name": func_name,
+                                         "arguments": params, "result": result, "elapsed_time": elapsed_time},
+                                        CANVAS_TRACE_MAXLEN, CANVAS_TRACE_TTL):
+            logging.warning(f"Trace of {path} calling {func_name} is lost.")
 
     def add_refernce(self, chunks: list[object], doc_infos: list[object]):
         if not self.retrieval:
@@ -0,0 +1,156 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Runs a fan-out/fan-in canvas made of sleeping components: Begin fans out to
+branches of different lengths and durations which all join in one Message.
+Compares the wall-clock time of `Canvas.run` with the one of the former
+loop, where each batch of the path waited for its slowest component before
+the next one started, run on the same canvas.
+
+    python agent/canvas_benchmark.py --branches 4 --seconds 0.2
+"""
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../')))
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import agent.component
+from agent.canvas import Canvas
+from agent.component.base import ComponentBase, ComponentParamBase
+
+
+class SleepParam(ComponentParamBase):
+    def __init__(self):
+        super().__init__()
+        self.seconds = 0.1
+        self.outputs = {"result": {"value": "", "type": "string"}}
+
+    def check(self):
+        self.check_nonnegative_number(self.seconds, "Seconds")
+
+
+class Sleep(ComponentBase):
+    component_name = "Sleep"
+
+    def _invoke(self, **kwargs):
+        time.sleep(self._param.seconds)
+        self.set_output("result", self._id)
+
+    def thoughts(self) -> str:
+        return ""
+
+
+# component_class() looks components up in agent.component.
+agent.component.Sleep = Sleep
+agent.component.SleepParam = SleepParam
+
+
+def fan_out_fan_in(branches, seconds):
+    components = {
+        "begin": {"obj": {"component_name": "Begin", "params": {}}, "downstream": [], "upstream": []},
+        "Message:join": {"obj": {"component_name": "Message", "params": {"content": ["done"]}}, "downstream": [], "upstream": []},
+    }
+    durations = {"begin": 0, "Message:join": 0}
+    for b in range(branches):
+        prev = "begin"
+        for d in range(b + 1):
+            cid = f"Sleep:{b}_{d}"
+            durations[cid] = seconds * ((b + d) % 3 + 1) / 2
+            components[cid] = {"obj": {"component_name": "Sleep", "params": {"seconds": durations[cid]}},
+                               "downstream": [], "upstream": [prev]}
+            components[prev]["downstream"].append(cid)
+            prev = cid
+        components[prev]["downstream"].append("Message:join")
+        components["Message:join"]["upstream"].append(prev)
+    dsl = {"components": components, "history": [], "path": [], "retrieval": [],
+           "globals": {"sys.query": "", "sys.user_id": "", "sys.conversation_turns": 0, "sys.files": []}}
+    return dsl, durations
+
+
+def legacy_run(canvas, **kwargs):
+    """The former loop of `Canvas.run`, down to what this canvas needs: batches of the path, 5 threads each."""
+    for k in canvas.components.keys():
+        canvas.components[k]["obj"].reset(True)
+    canvas.globals["sys.query"] = kwargs.get("query")
+    canvas.path = ["begin"]
+    finished = []
+
+    def _run_batch(f, t):
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            thr = []
+            for i in range(f, t):
+                cpn = canvas.get_component_obj(canvas.path[i])
+                if cpn.component_name.lower() in ["begin", "userfillup"]:
+                    thr.append(executor.submit(cpn.invoke, inputs=kwargs.get("inputs", {})))
+                else:
+                    thr.append(executor.submit(cpn.invoke, **cpn.get_input()))
+            for t in thr:
+                t.result()
+
+    idx = 0
+    while idx < len(canvas.path):
+        to = len(canvas.path)
+        _run_batch(idx, to)
+        for i in range(idx, to):
+            cpn = canvas.get_component(canvas.path[i])
+            cpn_obj = canvas.get_component_obj(canvas.path[i])
+            if isinstance(cpn_obj.output("content"), partial):
+                cpn_obj.set_output("content", "".join(m for m in cpn_obj.output("content")() if m))
+            finished.append(cpn_obj._id)
+            for cpn_id in cpn["downstream"]:
+                if canvas.path[-1] != cpn_id:
+                    canvas.path.append(cpn_id)
+        idx = to
+    return finished
+
+
+def main(args):
+    dsl, durations = fan_out_fan_in(args.branches, args.seconds)
+    print(f"{args.branches} branches, {len(durations) - 2} sleeping components, {sum(durations.values()):.2f}s of work")
+
+    canvas = Canvas(json.dumps(dsl), "benchmark")
+    st = time.perf_counter()
+    legacy = legacy_run(canvas, query="benchmark")
+    el0 = time.perf_counter() - st
+    print(f"Batch by batch : {el0:.2f}s, the join runs {legacy.count('Message:join')} time(s)")
+
+    canvas = Canvas(json.dumps(dsl), "benchmark")
+    st = time.perf_counter()
+    events = list(canvas.run(query="benchmark"))
+    el1 = time.perf_counter() - st
+    finished = [e["data"]["component_id"] for e in events if e["event"] == "node_finished"]
+    print(f"Canvas.run     : {el1:.2f}s, the join runs {finished.count('Message:join')} time(s), "
+          f"{el0 / max(el1, 1e-9):.1f}x faster")
+    print(f"Completion order: {' '.join(finished)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=4)
+    parser.add_argument('--seconds', type=float, help="unit of the sleeps", default=0.2)
+    main(parser.parse_args())
@@ -93,8 +93,8 @@ class ComponentParamBase(ABC):
     def __str__(self):
         return json.dumps(self.as_dict(), ensure_ascii=False)
 
-    def as_dict(self):
-        def _recursive_convert_obj_to_dict(obj):
+    def as_dict(self, attrs=None):
+        def _recursive_convert_obj_to_dict(obj, attrs=None):
             ret_dict = {}
             if isinstance(obj, dict):
                 for k,v in obj.items():
@@ -104,7 +104,7 @@ class ComponentParamBase(ABC):
                         ret_dict[k] = v
                 return ret_dict
 
-            for attr_name in list(obj.__dict__):
+            for attr_name in list(obj.__dict__) if attrs is None else attrs:
                 if attr_name in [_FEEDED_DEPRECATED_PARAMS, _DEPRECATED_PARAMS, _USER_FEEDED_PARAMS, _IS_RAW_CONF]:
                     continue
                 # get attr
@@ -119,7 +119,7 @@ class ComponentParamBase(ABC):
 
             return ret_dict
 
-        return _recursive_convert_obj_to_dict(self)
+        return _recursive_convert_obj_to_dict(self, attrs)
 
     def update(self, conf, allow_redundant=False):
         update_from_raw_conf = conf.get(_IS_RAW_CONF, True)
@@ -25,6 +25,7 @@ from api.db.services.llm_service import LLMBundle
 from api.db.services.tenant_llm_service import TenantLLMService
 from agent.component.base import ComponentBase, ComponentParamBase
 from api.utils.api_utils import timeout
+from api.utils.deadline_executor import check_deadline
 from rag.prompts import message_fit_in, citation_prompt
 from rag.prompts.prompts import tool_call_summary
 
@@ -204,6 +205,7 @@ class LLM(ComponentBase):
             prompt += "\nThe output MUST follow this JSON format:\n"+json.dumps(self._param.output_structure, ensure_ascii=False, indent=2)
             prompt += "\nRedundant information is FORBIDDEN."
             for _ in range(self._param.max_retries+1):
+                check_deadline()
                 _, msg = message_fit_in([{"role": "system", "content": prompt}, *msg], int(self.chat_mdl.max_length * 0.97))
                 error = ""
                 ans = self._generate(msg)
@@ -229,6 +231,7 @@ class LLM(ComponentBase):
             return
 
         for _ in range(self._param.max_retries+1):
+            check_deadline()
             _, msg = message_fit_in([{"role": "system", "content": prompt}, *msg], int(self.chat_mdl.max_length * 0.97))
             error = ""
             ans = self._generate(msg)
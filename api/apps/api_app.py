@@ -268,7 +268,7 @@ def completion():
                         canvas.history.append(("assistant", final_ans["content"]))
                         if final_ans.get("reference"):
                             canvas.reference.append(final_ans["reference"])
-                        cvs.dsl = json.loads(str(canvas))
+                        cvs.dsl = canvas.dump()
                         API4ConversationService.append_message(conv.id, conv.to_dict())
                     except Exception as e:
                         yield "data:" + json.dumps({"code": 500, "message": str(e),
@@ -287,7 +287,7 @@ def completion():
             canvas.messages.append({"role": "assistant", "content": final_ans["content"], "id": message_id})
             if final_ans.get("reference"):
                 canvas.reference.append(final_ans["reference"])
-            cvs.dsl = json.loads(str(canvas))
+            cvs.dsl = canvas.dump()
 
             result = {"answer": final_ans["content"], "reference": final_ans.get("reference", [])}
             fillin_conv(result)
@@ -778,7 +778,7 @@ def completion_faq():
             canvas.messages.append({"role": "assistant", "content": final_ans["content"], "id": message_id})
             if final_ans.get("reference"):
                 canvas.reference.append(final_ans["reference"])
-            cvs.dsl = json.loads(str(canvas))
+            cvs.dsl = canvas.dump()
 
             ans = {"answer": final_ans["content"], "reference": final_ans.get("reference", [])}
             data[0]["content"] += re.sub(r'##\d\$\$', '', ans["answer"])
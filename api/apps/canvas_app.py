@@ -33,7 +33,7 @@ from api.db.services.user_canvas_version import UserCanvasVersionService
 from api.settings import RetCode
 from api.utils import get_uuid
 from api.utils.api_utils import get_json_result, server_error_response, validate_request, get_data_error_result
-from agent.canvas import Canvas
+from agent.canvas import Canvas, group_traces, trace_key
 from peewee import MySQLDatabase, PostgresqlDatabase
 from api.db.db_models import APIToken
 import time
@@ -145,9 +145,6 @@ def run():
     if not e:
         return get_data_error_result(message="canvas not found.")
 
-    if not isinstance(cvs.dsl, str):
-        cvs.dsl = json.dumps(cvs.dsl, ensure_ascii=False)
-
     try:
         canvas = Canvas(cvs.dsl, current_user.id, req["id"])
     except Exception as e:
@@ -159,7 +156,7 @@ def run():
             for ans in canvas.run(query=query, files=files, user_id=user_id, inputs=inputs):
                 yield "data:" + json.dumps(ans, ensure_ascii=False) + "\n\n"
 
-            cvs.dsl = json.loads(str(canvas))
+            cvs.dsl = canvas.dump()
             UserCanvasService.update_by_id(req["id"], cvs.to_dict())
         except Exception as e:
             logging.exception(e)
@@ -189,7 +186,7 @@ def reset():
 
         canvas = Canvas(json.dumps(user_canvas.dsl), current_user.id)
         canvas.reset()
-        req["dsl"] = json.loads(str(canvas))
+        req["dsl"] = canvas.dump()
         UserCanvasService.update_by_id(req["id"], {"dsl": req["dsl"]})
         return get_json_result(data=req["dsl"])
     except Exception as e:
@@ -433,12 +430,17 @@ def setting():
 def trace():
     cvs_id = request.args.get("canvas_id")
     msg_id = request.args.get("message_id")
+    # With a cursor, only the tool calls after it are returned, along with the cursor to poll next.
+    cursor = request.args.get("cursor")
     try:
-        bin = REDIS_CONN.get(f"{cvs_id}-{msg_id}-logs")
-        if not bin:
+        entries = REDIS_CONN.stream_read(trace_key(cvs_id, msg_id), cursor or "0")
+        if cursor is not None:
+            return get_json_result(data={"cursor": entries[-1][0] if entries else cursor,
+                                         "trace": group_traces([e for _, e in entries or []])})
+        if not entries:
             return get_json_result(data={})
 
-        return get_json_result(data=json.loads(bin.encode("utf-8")))
+        return get_json_result(data=group_traces([e for _, e in entries]))
     except Exception as e:
         logging.exception(e)
 
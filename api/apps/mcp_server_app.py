@@ -26,7 +26,7 @@ from api.utils import get_uuid
 from api.utils.api_utils import get_data_error_result, get_json_result, server_error_response, validate_request, \
     get_mcp_tools
 from api.utils.web_utils import get_float, safe_json_parse
-from rag.utils.mcp_tool_call_conn import MCPToolCallSession, close_multiple_mcp_toolcall_sessions
+from rag.utils.mcp_tool_call_conn import MCP_SESSION_POOL, MCPToolCallSession, close_mcp_toolcall_sessions_in_background
 
 
 @manager.route("/list", methods=["POST"])  # noqa: F821
@@ -171,6 +171,7 @@ def update() -> Response:
 
         if not MCPServerService.filter_update([MCPServer.id == mcp_id, MCPServer.tenant_id == current_user.id], req):
             return get_data_error_result(message="Failed to updated MCP server.")
+        MCP_SESSION_POOL.evict(mcp_id)
 
         e, updated_mcp = MCPServerService.get_by_id(req["id"])
         if not e:
@@ -193,6 +194,8 @@ def rm() -> Response:
 
         if not MCPServerService.delete_by_ids(mcp_ids):
             return get_data_error_result(message=f"Failed to delete MCP servers {mcp_ids}")
+        for mcp_id in mcp_ids:
+            MCP_SESSION_POOL.evict(mcp_id)
 
         return get_json_result(data=True)
     except Exception as e:
@@ -310,7 +313,6 @@ def list_tools() -> Response:
     timeout = get_float(req, "timeout", 10)
 
     results = {}
-    tool_call_sessions = []
     try:
         for mcp_id in mcp_ids:
             e, mcp_server = MCPServerService.get_by_id(mcp_id)
@@ -320,8 +322,7 @@ def list_tools() -> Response:
 
                 cached_tools = mcp_server.variables.get("tools", {})
 
-                tool_call_session = MCPToolCallSession(mcp_server, mcp_server.variables)
-                tool_call_sessions.append(tool_call_session)
+                tool_call_session = MCP_SESSION_POOL.session(mcp_server, mcp_server.variables)
 
                 try:
                     tools = tool_call_session.get_tools(timeout)
@@ -340,9 +341,6 @@ def list_tools() -> Response:
         return get_json_result(data=results)
     except Exception as e:
         return server_error_response(e)
-    finally:
-        # PERF: blocking call to close sessions — consider moving to background thread or task queue
-        close_multiple_mcp_toolcall_sessions(tool_call_sessions)
 
 
 @manager.route("/test_tool", methods=["POST"])  # noqa: F821
@@ -361,18 +359,13 @@ def test_tool() -> Response:
     if not all([tool_name, arguments]):
         return get_data_error_result(message="Require provide tool name and arguments.")
 
-    tool_call_sessions = []
     try:
         e, mcp_server = MCPServerService.get_by_id(mcp_id)
         if not e or mcp_server.tenant_id != current_user.id:
             return get_data_error_result(message=f"Cannot find MCP server {mcp_id} for user {current_user.id}")
 
-        tool_call_session = MCPToolCallSession(mcp_server, mcp_server.variables)
-        tool_call_sessions.append(tool_call_session)
+        tool_call_session = MCP_SESSION_POOL.session(mcp_server, mcp_server.variables)
         result = tool_call_session.tool_call(tool_name, arguments, timeout)
-
-        # PERF: blocking call to close sessions — consider moving to background thread or task queue
-        close_multiple_mcp_toolcall_sessions(tool_call_sessions)
         return get_json_result(data=result)
     except Exception as e:
         return server_error_response(e)
@@ -431,8 +424,7 @@ def test_mcp() -> Response:
             tools = []
             return get_data_error_result(message=f"Test MCP error: {e}")
         finally:
-            # PERF: blocking call to close sessions — consider moving to background thread or task queue
-            close_multiple_mcp_toolcall_sessions([tool_call_session])
+            close_mcp_toolcall_sessions_in_background([tool_call_session])
 
         for tool in tools:
             tool_dict = tool.model_dump()
@@ -88,7 +88,7 @@ def create_agent_session(tenant_id, agent_id):
     canvas = Canvas(cvs.dsl, tenant_id, agent_id)
     canvas.reset()
 
-    cvs.dsl = json.loads(str(canvas))
+    cvs.dsl = canvas.dump()
     conv = {"id": session_id, "dialog_id": cvs.id, "user_id": user_id, "message": [{"role": "assistant", "content": canvas.get_prologue()}], "source": "agent", "dsl": cvs.dsl}
     API4ConversationService.save(**conv)
     conv["agent_id"] = conv.pop("dialog_id")
@@ -36,6 +36,10 @@ from rag.utils.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE
 from timeit import default_timer as timer
 
 from rag.utils.redis_conn import REDIS_CONN
+from api.utils.deadline_executor import DEADLINE_EXECUTOR
+from rag.utils.config_cache import CONFIG_CACHE
+from rag.utils.mcp_tool_call_conn import MCP_SESSION_POOL
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
 
 @manager.route("/version", methods=["GET"])  # noqa: F821
 @login_required
@@ -165,6 +169,10 @@ def status():
     except Exception:
         logging.exception("get task executor heartbeats failed!")
     res["task_executor_heartbeats"] = task_executor_heartbeats
+    res["retrieval_cache"] = RETRIEVAL_CACHE.stats()
+    res["config_cache"] = CONFIG_CACHE.stats()
+    res["mcp_sessions"] = MCP_SESSION_POOL.stats()
+    res["deadline_executor"] = DEADLINE_EXECUTOR.stats()
 
     return get_json_result(data=res)
 
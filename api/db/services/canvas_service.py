@@ -146,8 +146,6 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
         assert e, "Session not found!"
         if not conv.message:
             conv.message = []
-        if not isinstance(conv.dsl, str):
-            conv.dsl = json.dumps(conv.dsl, ensure_ascii=False)
         canvas = Canvas(conv.dsl, tenant_id, agent_id)
     else:
         e, cvs = UserCanvasService.get_by_id(agent_id)
@@ -186,7 +184,7 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
     conv.message.append({"role": "assistant", "content": txt, "created_at": time.time(), "id": message_id})
     conv.reference = canvas.get_reference()
     conv.errors = canvas.error
-    conv.dsl = str(canvas)
+    conv.dsl = canvas.dump()
     conv = conv.to_dict()
     API4ConversationService.append_message(conv["id"], conv)
 
@@ -14,7 +14,9 @@
 #  limitations under the License.
 #
 import binascii
+import concurrent.futures
 import logging
+import os
 import re
 import time
 from copy import deepcopy
@@ -23,7 +25,6 @@ from functools import partial
 from timeit import default_timer as timer
 
 import trio
-from langfuse import Langfuse
 from peewee import fn
 
 from agentic_reasoning import DeepResearcher
@@ -40,13 +41,22 @@ from api.utils import current_timestamp, datetime_format
 from graphrag.general.mind_map_extractor import MindMapExtractor
 from rag.app.resume import forbidden_select_fields4resume
 from rag.app.tag import label_question
-from rag.nlp.search import index_name
+from rag.nlp.search import StreamingCitations, index_name
 from rag.prompts import chunks_format, citation_prompt, cross_languages, full_question, kb_prompt, keyword_extraction, message_fit_in
 from rag.prompts.prompts import gen_meta_filter, PROMPT_JINJA_ENV, ASK_SUMMARY
 from rag.utils import num_tokens_from_string, rmSpace
+from rag.utils.config_cache import CONFIG_CACHE, kb_scopes, tenant_scopes
 from rag.utils.tavily_conn import Tavily
 
 
+CHAT_RETRIEVAL_THREADS = int(os.environ.get("CHAT_RETRIEVAL_THREADS", 16))
+KB_RETRIEVAL_TIMEOUT = float(os.environ.get("KB_RETRIEVAL_TIMEOUT", 60))
+WEB_SEARCH_TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", 20))
+KG_RETRIEVAL_TIMEOUT = float(os.environ.get("KG_RETRIEVAL_TIMEOUT", 60))
+# Shared, so that a source which timed out keeps its thread without blocking the chat.
+retrieval_executor = concurrent.futures.ThreadPoolExecutor(max_workers=CHAT_RETRIEVAL_THREADS, thread_name_prefix="chat_retrieval")
+
+
 class DialogService(CommonService):
     model = Dialog
 
@@ -218,6 +228,28 @@ def get_models(dialog):
     return kbs, embd_mdl, rerank_mdl, chat_mdl, tts_mdl
 
 
+def get_cached_models(dialog):
+    """`get_models`, shared by the chats with the same models through CONFIG_CACHE. Bundles are forked per chat."""
+    kb_ids = tuple(sorted(set(dialog.kb_ids)))
+    key = (dialog.tenant_id, dialog.llm_id, dialog.rerank_id, kb_ids, bool(dialog.prompt_config.get("tts")))
+    kbs, *models = CONFIG_CACHE.get("models", key, tenant_scopes(dialog.tenant_id) + kb_scopes(kb_ids), partial(get_models, dialog))
+    return kbs, *[mdl.fork() if mdl else None for mdl in models]
+
+
+def get_chat_model_config(tenant_id, llm_id):
+    def load():
+        if TenantLLMService.llm_id2llm_type(llm_id) == "image2text":
+            return TenantLLMService.get_model_config(tenant_id, LLMType.IMAGE2TEXT, llm_id)
+        return TenantLLMService.get_model_config(tenant_id, LLMType.CHAT, llm_id)
+
+    return CONFIG_CACHE.get("model_config", (tenant_id, llm_id), tenant_scopes(tenant_id), load)
+
+
+def get_field_map(kb_ids):
+    kb_ids = tuple(sorted(set(kb_ids)))
+    return CONFIG_CACHE.get("field_map", kb_ids, kb_scopes(kb_ids), partial(KnowledgebaseService.get_field_map, list(kb_ids)))
+
+
 BAD_CITATION_PATTERNS = [
     re.compile(r"\(\s*ID\s*[: ]*\s*(\d+)\s*\)"),  # (ID: 12)
     re.compile(r"\[\s*ID\s*[: ]*\s*(\d+)\s*\]"),  # [ID: 12]
@@ -304,6 +336,33 @@ def meta_filter(metas: dict, filters: list[dict]):
     return list(doc_ids)
 
 
+def retrieve_concurrently(sources: dict):
+    """
+    Runs the retrieval `sources`, {name: (function, timeout in seconds)}, at the same time.
+    Returns their results, None for the ones which timed out, and their latencies in ms.
+    Errors of a source are raised once every source is done.
+    """
+    def timed(func):
+        st = timer()
+        return func(), (timer() - st) * 1000
+
+    start = timer()
+    futures = {name: retrieval_executor.submit(timed, func) for name, (func, _) in sources.items()}
+    results, costs, error = {}, {}, None
+    for name, (_, tmo) in sources.items():
+        try:
+            results[name], costs[name] = futures[name].result(timeout=max(0.0, start + tmo - timer()))
+        except concurrent.futures.TimeoutError:
+            logging.warning(f"Retrieval from {name} timed out after {tmo}s, going on without it.")
+            results[name], costs[name] = None, (timer() - start) * 1000
+        except Exception as e:
+            results[name], costs[name] = None, (timer() - start) * 1000
+            error = error or e
+    if error:
+        raise error
+    return results, costs
+
+
 def chat(dialog, messages, stream=True, **kwargs):
     assert messages[-1]["role"] == "user", "The last content of this conversation is not from user."
     if not dialog.kb_ids and not dialog.prompt_config.get("tavily_api_key"):
@@ -313,27 +372,20 @@ def chat(dialog, messages, stream=True, **kwargs):
 
     chat_start_ts = timer()
 
-    if TenantLLMService.llm_id2llm_type(dialog.llm_id) == "image2text":
-        llm_model_config = TenantLLMService.get_model_config(dialog.tenant_id, LLMType.IMAGE2TEXT, dialog.llm_id)
-    else:
-        llm_model_config = TenantLLMService.get_model_config(dialog.tenant_id, LLMType.CHAT, dialog.llm_id)
+    llm_model_config = get_chat_model_config(dialog.tenant_id, dialog.llm_id)
 
     max_tokens = llm_model_config.get("max_tokens", 8192)
 
     check_llm_ts = timer()
 
-    langfuse_tracer = None
     trace_context = {}
-    langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=dialog.tenant_id)
-    if langfuse_keys:
-        langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
-        if langfuse.auth_check():
-            langfuse_tracer = langfuse
-            trace_id = langfuse_tracer.create_trace_id()
-            trace_context = {"trace_id": trace_id}
+    langfuse_tracer = TenantLangfuseService.get_tracer(dialog.tenant_id)
+    if langfuse_tracer:
+        trace_id = langfuse_tracer.create_trace_id()
+        trace_context = {"trace_id": trace_id}
 
     check_langfuse_tracer_ts = timer()
-    kbs, embd_mdl, rerank_mdl, chat_mdl, tts_mdl = get_models(dialog)
+    kbs, embd_mdl, rerank_mdl, chat_mdl, tts_mdl = get_cached_models(dialog)
     toolcall_session, tools = kwargs.get("toolcall_session"), kwargs.get("tools")
     if toolcall_session and tools:
         chat_mdl.bind_tools(toolcall_session, tools)
@@ -346,7 +398,7 @@ def chat(dialog, messages, stream=True, **kwargs):
         attachments = messages[-1]["doc_ids"]
 
     prompt_config = dialog.prompt_config
-    field_map = KnowledgebaseService.get_field_map(dialog.kb_ids)
+    field_map = get_field_map(dialog.kb_ids)
     # try to use sql if field mapping is good to go
     if field_map:
         logging.debug("Use SQL to retrieval:{}".format(questions[-1]))
@@ -391,6 +443,7 @@ def chat(dialog, messages, stream=True, **kwargs):
     thought = ""
     kbinfos = {"total": 0, "chunks": [], "doc_aggs": []}
     knowledges = []
+    retrieval_costs = {}
 
     if attachments is not None and "knowledge" in [p["key"] for p in prompt_config["parameters"]]:
         tenant_ids = list(set([kb.tenant_id for kb in kbs]))
@@ -419,8 +472,9 @@ def chat(dialog, messages, stream=True, **kwargs):
                 elif stream:
                     yield think
         else:
+            sources = {}
             if embd_mdl:
-                kbinfos = retriever.retrieval(
+                sources["knowledge base"] = (lambda: retriever.retrieval(
                     " ".join(questions),
                     embd_mdl,
                     tenant_ids,
@@ -434,16 +488,24 @@ def chat(dialog, messages, stream=True, **kwargs):
                     aggs=False,
                     rerank_mdl=rerank_mdl,
                     rank_feature=label_question(" ".join(questions), kbs),
-                )
+                ), KB_RETRIEVAL_TIMEOUT)
             if prompt_config.get("tavily_api_key"):
-                tav = Tavily(prompt_config["tavily_api_key"])
-                tav_res = tav.retrieve_chunks(" ".join(questions))
+                sources["web search"] = (lambda: Tavily(prompt_config["tavily_api_key"]).retrieve_chunks(" ".join(questions)), WEB_SEARCH_TIMEOUT)
+            if prompt_config.get("use_kg"):
+                sources["knowledge graph"] = (lambda: settings.kg_retrievaler.retrieval(" ".join(questions), tenant_ids, dialog.kb_ids, embd_mdl,
+                                                                                        LLMBundle(dialog.tenant_id, LLMType.CHAT)), KG_RETRIEVAL_TIMEOUT)
+            results, retrieval_costs = retrieve_concurrently(sources)
+
+            # Same order as retrieving one source after the other: knowledge graph, knowledge base, then web.
+            if results.get("knowledge base"):
+                kbinfos = results["knowledge base"]
+            tav_res = results.get("web search")
+            if tav_res:
                 kbinfos["chunks"].extend(tav_res["chunks"])
                 kbinfos["doc_aggs"].extend(tav_res["doc_aggs"])
-            if prompt_config.get("use_kg"):
-                ck = settings.kg_retrievaler.retrieval(" ".join(questions), tenant_ids, dialog.kb_ids, embd_mdl, LLMBundle(dialog.tenant_id, LLMType.CHAT))
-                if ck["content_with_weight"]:
-                    kbinfos["chunks"].insert(0, ck)
+            ck = results.get("knowledge graph")
+            if ck and ck["content_with_weight"]:
+                kbinfos["chunks"].insert(0, ck)
 
             knowledges = kb_prompt(kbinfos, max_tokens)
 
@@ -471,7 +533,7 @@ def chat(dialog, messages, stream=True, **kwargs):
         gen_conf["max_tokens"] = min(gen_conf["max_tokens"], max_tokens - used_token_count)
 
     def decorate_answer(answer):
-        nonlocal embd_mdl, prompt_config, knowledges, kwargs, kbinfos, prompt, retrieval_ts, questions, langfuse_tracer
+        nonlocal embd_mdl, prompt_config, knowledges, kwargs, kbinfos, prompt, retrieval_ts, retrieval_costs, questions, langfuse_tracer
 
         refs = []
         ans = answer.split("</think>")
@@ -490,6 +552,7 @@ def chat(dialog, messages, stream=True, **kwargs):
                     embd_mdl,
                     tkweight=1 - dialog.vector_similarity_weight,
                     vtweight=dialog.vector_similarity_weight,
+                    done_pieces=streaming_citations.pieces() if streaming_citations else None,
                 )
             else:
                 for match in re.finditer(r"\[ID:([0-9]+)\]", answer):
@@ -533,6 +596,7 @@ def chat(dialog, messages, stream=True, **kwargs):
             f"  - Bind models: {bind_embedding_time_cost:.1f}ms\n"
             f"  - Query refinement(LLM): {refine_question_time_cost:.1f}ms\n"
             f"  - Retrieval: {retrieval_time_cost:.1f}ms\n"
+            + "".join(f"    - {name}: {cost:.1f}ms\n" for name, cost in retrieval_costs.items()) +
             f"  - Generate answer: {generate_result_time_cost:.1f}ms\n\n"
             "## Token usage:\n"
             f"  - Generated tokens(approximately): {tk_num}\n"
@@ -553,6 +617,8 @@ def chat(dialog, messages, stream=True, **kwargs):
             trace_context=trace_context, name="chat", model=llm_model_config["llm_name"], input={"prompt": prompt, "prompt4citation": prompt4citation, "messages": msg}
         )
 
+    # Pieces of the answer get embedded while it streams, decorate_answer only scores them.
+    streaming_citations = StreamingCitations(embd_mdl) if stream and embd_mdl and prompt4citation else None
     if stream:
         last_ans = ""
         answer = ""
@@ -564,6 +630,8 @@ def chat(dialog, messages, stream=True, **kwargs):
             if num_tokens_from_string(delta_ans) < 16:
                 continue
             last_ans = answer
+            if streaming_citations:
+                streaming_citations.feed(answer)
             yield {"answer": thought + answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
         delta_ans = answer[len(last_ans) :]
         if delta_ans:
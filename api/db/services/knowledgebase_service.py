@@ -21,6 +21,7 @@ from api.db import StatusEnum, TenantPermission
 from api.db.db_models import DB, Document, Knowledgebase, Tenant, User, UserTenant
 from api.db.services.common_service import CommonService
 from api.utils import current_timestamp, datetime_format
+from rag.utils.config_cache import CONFIG_CACHE
 
 
 class KnowledgebaseService(CommonService):
@@ -42,6 +43,19 @@ class KnowledgebaseService(CommonService):
     """
     model = Knowledgebase
 
+    @classmethod
+    def update_by_id(cls, pid, data):
+        # Model bundles and field maps of chats over the knowledge base are cached
+        num = super().update_by_id(pid, data)
+        CONFIG_CACHE.invalidate(f"kb:{pid}")
+        return num
+
+    @classmethod
+    def delete_by_id(cls, pid):
+        num = super().delete_by_id(pid)
+        CONFIG_CACHE.invalidate(f"kb:{pid}")
+        return num
+
     @classmethod
     @DB.connection_context()
     def accessible4deletion(cls, kb_id, user_id):
@@ -17,10 +17,12 @@
 from datetime import datetime
 
 import peewee
+from langfuse import Langfuse
 
 from api.db.db_models import DB, TenantLangfuse
 from api.db.services.common_service import CommonService
 from api.utils import current_timestamp, datetime_format
+from rag.utils.config_cache import CONFIG_CACHE, tenant_scopes
 
 
 class TenantLangfuseService(CommonService):
@@ -51,11 +53,26 @@ class TenantLangfuseService(CommonService):
         except peewee.DoesNotExist:
             return None
 
+    @classmethod
+    def get_tracer(cls, tenant_id):
+        """The Langfuse client of the tenant if its keys pass `auth_check`, else None. Cached in CONFIG_CACHE."""
+
+        def load():
+            langfuse_keys = cls.filter_by_tenant(tenant_id=tenant_id)
+            if not langfuse_keys:
+                return None
+            langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
+            return langfuse if langfuse.auth_check() else None
+
+        return CONFIG_CACHE.get("langfuse", tenant_id, tenant_scopes(tenant_id), load)
+
     @classmethod
     def update_by_tenant(cls, tenant_id, langfuse_keys):
         langfuse_keys["update_time"] = current_timestamp()
         langfuse_keys["update_date"] = datetime_format(datetime.now())
-        return cls.model.update(**langfuse_keys).where(cls.model.tenant_id == tenant_id).execute()
+        num = cls.model.update(**langfuse_keys).where(cls.model.tenant_id == tenant_id).execute()
+        CONFIG_CACHE.invalidate(f"tenant:{tenant_id}")
+        return num
 
     @classmethod
     def save(cls, **kwargs):
@@ -64,8 +81,10 @@ class TenantLangfuseService(CommonService):
         kwargs["update_time"] = current_timestamp()
         kwargs["update_date"] = datetime_format(datetime.now())
         obj = cls.model.create(**kwargs)
+        CONFIG_CACHE.invalidate(f"tenant:{kwargs.get('tenant_id')}")
         return obj
 
     @classmethod
     def delete_model(cls, langfuse_model):
         langfuse_model.delete_instance()
+        CONFIG_CACHE.invalidate(f"tenant:{langfuse_model.tenant_id}")
@@ -13,8 +13,8 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import copy
 import logging
-from langfuse import Langfuse
 from api import settings
 from api.db import LLMType
 from api.db.db_models import DB, LLMFactories, TenantLLM
@@ -22,6 +22,7 @@ from api.db.services.common_service import CommonService
 from api.db.services.langfuse_service import TenantLangfuseService
 from api.db.services.user_service import TenantService
 from rag.llm import ChatModel, CvModel, EmbeddingModel, RerankModel, Seq2txtModel, TTSModel
+from rag.utils.config_cache import CONFIG_CACHE
 
 
 class LLMFactoriesService(CommonService):
@@ -31,6 +32,29 @@ class LLMFactoriesService(CommonService):
 class TenantLLMService(CommonService):
     model = TenantLLM
 
+    @classmethod
+    def save(cls, **kwargs):
+        obj = super().save(**kwargs)
+        CONFIG_CACHE.invalidate(f"tenant:{kwargs.get('tenant_id')}")
+        return obj
+
+    @classmethod
+    def insert_many(cls, data_list, batch_size=100):
+        super().insert_many(data_list, batch_size)
+        CONFIG_CACHE.invalidate(*[f"tenant:{d.get('tenant_id')}" for d in data_list])
+
+    @classmethod
+    def filter_update(cls, filters, update_data):
+        num = super().filter_update(filters, update_data)
+        CONFIG_CACHE.invalidate("tenants")
+        return num
+
+    @classmethod
+    def filter_delete(cls, filters):
+        num = super().filter_delete(filters)
+        CONFIG_CACHE.invalidate("tenants")
+        return num
+
     @classmethod
     @DB.connection_context()
     def get_api_key(cls, tenant_id, model_name):
@@ -242,11 +266,18 @@ class LLM4Tenant:
         self.is_tools = model_config.get("is_tools", False)
         self.verbose_tool_use = kwargs.get("verbose_tool_use")
 
-        langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=tenant_id)
-        self.langfuse = None
-        if langfuse_keys:
-            langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
-            if langfuse.auth_check():
-                self.langfuse = langfuse
-                trace_id = self.langfuse.create_trace_id()
-                self.trace_context = {"trace_id": trace_id}
\ No newline at end of file
+        self.langfuse = TenantLangfuseService.get_tracer(tenant_id)
+        if self.langfuse:
+            trace_id = self.langfuse.create_trace_id()
+            self.trace_context = {"trace_id": trace_id}
+
+    def fork(self):
+        """
+        A shallow copy with its own Langfuse trace and its own model object for `bind_tools`,
+        so that a bundle cached in CONFIG_CACHE is shared by concurrent requests.
+        """
+        bundle = copy.copy(self)
+        bundle.mdl = copy.copy(self.mdl)
+        if bundle.langfuse:
+            bundle.trace_context = {"trace_id": bundle.langfuse.create_trace_id()}
+        return bundle
@@ -27,6 +27,7 @@ from api.db.services.common_service import CommonService
 from api.utils import get_uuid, current_timestamp, datetime_format
 from api.db import StatusEnum
 from rag.settings import MINIO
+from rag.utils.config_cache import CONFIG_CACHE
 
 
 class UserService(CommonService):
@@ -145,6 +146,18 @@ class TenantService(CommonService):
     """
     model = Tenant
 
+    @classmethod
+    def update_by_id(cls, pid, data):
+        num = super().update_by_id(pid, data)
+        CONFIG_CACHE.invalidate(f"tenant:{pid}")
+        return num
+
+    @classmethod
+    def filter_update(cls, filters, update_data):
+        num = super().filter_update(filters, update_data)
+        CONFIG_CACHE.invalidate("tenants")
+        return num
+
     @classmethod
     @DB.connection_context()
     def get_info_by(cls, user_id):
@@ -18,9 +18,7 @@ import functools
 import json
 import logging
 import os
-import queue
 import random
-import threading
 import time
 from base64 import b64encode
 from copy import deepcopy
@@ -52,7 +50,8 @@ from api.db.db_models import APIToken
 from api.db.services.llm_service import LLMService
 from api.db.services.tenant_llm_service import TenantLLMService
 from api.utils import CustomJSONEncoder, get_uuid, json_dumps
-from rag.utils.mcp_tool_call_conn import MCPToolCallSession, close_multiple_mcp_toolcall_sessions
+from api.utils.deadline_executor import DEADLINE_EXECUTOR
+from rag.utils.mcp_tool_call_conn import MCPToolCallSession, close_mcp_toolcall_sessions_in_background
 
 requests.models.complexjson.dumps = functools.partial(json.dumps, cls=CustomJSONEncoder)
 
@@ -638,8 +637,8 @@ def get_mcp_tools(mcp_servers: list, timeout: float | int = 10) -> tuple[dict, s
                 tool_dict["enabled"] = cached_tool.get("enabled", True)
                 results[server_key].append(tool_dict)
 
-        # PERF: blocking call to close sessions — consider moving to background thread or task queue
-        close_multiple_mcp_toolcall_sessions(tool_call_sessions)
+        # These configs may never be saved, so their sessions aren't pooled.
+        close_mcp_toolcall_sessions_in_background(tool_call_sessions)
         return results, ""
     except Exception as e:
         return {}, str(e)
@@ -650,34 +649,15 @@ OnTimeoutCallback = Union[Callable[..., Any], Coroutine[Any, Any, Any]]
 
 
 def timeout(seconds: float | int = None, attempts: int = 2, *, exception: Optional[TimeoutException] = None, on_timeout: Optional[OnTimeoutCallback] = None):
+    """
+    With ENABLE_TIMEOUT_ASSERTION, gives up on the call once it ran for `seconds` x `attempts`.
+    Sync functions run on DEADLINE_EXECUTOR and their time counts from when a worker starts them:
+    with all the workers busy, the caller may wait up to twice `seconds` x `attempts`.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            result_queue = queue.Queue(maxsize=1)
-
-            def target():
-                try:
-                    result = func(*args, **kwargs)
-                    result_queue.put(result)
-                except Exception as e:
-                    result_queue.put(e)
-
-            thread = threading.Thread(target=target)
-            thread.daemon = True
-            thread.start()
-
-            for a in range(attempts):
-                try:
-                    if os.environ.get("ENABLE_TIMEOUT_ASSERTION"):
-                        result = result_queue.get(timeout=seconds)
-                    else:
-                        result = result_queue.get()
-                    if isinstance(result, Exception):
-                        raise result
-                    return result
-                except queue.Empty:
-                    pass
-            raise TimeoutError(f"Function '{func.__name__}' timed out after {seconds} seconds and {attempts} attempts.")
+            return DEADLINE_EXECUTOR.run(func, args, kwargs, seconds, attempts)
 
         @wraps(func)
         async def async_wrapper(*args, **kwargs) -> Any:
@@ -0,0 +1,179 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Runs the sync functions decorated with `@timeout` under their deadline.
+
+They used to get a new thread per call, which kept running once its caller
+gave up. Calls now run on a bounded pool of reusable workers, and their time
+counts from when a worker starts them. When a call times out, it is dropped
+if it is still queued. Otherwise its token is cancelled, and long functions
+can stop between steps by calling `check_deadline()`. A nested call, made
+from a worker, doesn't queue behind the callers holding the workers: it gets
+a thread of its own when no worker is free.
+
+Deadlines are enforced only with ENABLE_TIMEOUT_ASSERTION, as before.
+Otherwise the caller waited for the result anyway, so calls run inline.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+# Sized for the components of CANVAS_WORKERS canvas threads plus the calls they nest.
+DEADLINE_WORKERS = int(os.environ.get("DEADLINE_WORKERS", 128))
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CancellationToken:
+    def __init__(self, deadline: float | None = None, parent: "CancellationToken | None" = None):
+        self.deadline = deadline
+        self.parent = parent
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        if self.deadline is not None and time.time() > self.deadline:
+            return True
+        return self.parent is not None and self.parent.cancelled()
+
+    def raise_if_cancelled(self):
+        if self.cancelled():
+            raise DeadlineExceeded("Deadline exceeded, the caller has given up.")
+
+
+_local = threading.local()
+
+
+def current_token() -> CancellationToken | None:
+    return getattr(_local, "token", None)
+
+
+def check_deadline():
+    """Raises DeadlineExceeded if the `@timeout` call running in this thread was given up."""
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+class DeadlineExecutor:
+    def __init__(self, max_workers: int = DEADLINE_WORKERS):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deadline")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.counters = {"calls": 0, "inline": 0, "nested_overflow": 0, "timeouts": 0, "dropped": 0, "overruns": 0,
+                         "overrun_seconds": 0.0, "queue_wait_seconds": 0.0, "max_queue_wait_seconds": 0.0}
+
+    def run(self, func, args: tuple, kwargs: dict, seconds: float | int | str | None, attempts: int = 1):
+        """
+        `func(*args, **kwargs)`, raising TimeoutError once it ran for `seconds` x `attempts`.
+        Waiting for a worker is bounded by as much, so the caller waits twice that at worst.
+        """
+        if seconds is None or not os.environ.get("ENABLE_TIMEOUT_ASSERTION"):
+            with self._lock:
+                self.counters["inline"] += 1
+            return func(*args, **kwargs)
+
+        # Env-configured timeouts come as strings.
+        seconds = float(seconds)
+        budget = seconds * attempts
+        submitted = time.time()
+        parent = current_token()
+        # The clock starts with the call: waiting for a worker doesn't use up its time.
+        token = CancellationToken(None, parent)
+        started = threading.Event()
+
+        def task():
+            if token.cancelled():
+                # Given up while queued.
+                with self._lock:
+                    self._pending -= 1
+                    self.counters["dropped"] += 1
+                raise DeadlineExceeded(f"Function '{func.__name__}' was given up before it started.")
+            token.deadline = time.time() + budget
+            with self._lock:
+                wait = token.deadline - budget - submitted
+                self.counters["queue_wait_seconds"] += wait
+                self.counters["max_queue_wait_seconds"] = max(self.counters["max_queue_wait_seconds"], wait)
+            started.set()
+            _local.token = token
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.token = None
+                ended = time.time()
+                with self._lock:
+                    self._pending -= 1
+                    if ended > token.deadline:
+                        self.counters["overruns"] += 1
+                        self.counters["overrun_seconds"] += ended - token.deadline
+
+        with self._lock:
+            self.counters["calls"] += 1
+            overflow = parent is not None and self._pending >= self.max_workers
+            self._pending += 1
+            if overflow:
+                self.counters["nested_overflow"] += 1
+        future = self._spawn(task) if overflow else self._pool.submit(task)
+
+        # Waiting for a worker is bounded by the budget too, then the call gets all of it.
+        if started.wait(budget):
+            wait([future], timeout=max(0.0, token.deadline - time.time()))
+        if future.done():
+            # Whatever it raised, TimeoutErrors of its own included, is the caller's.
+            return future.result()
+
+        token.cancel()
+        if future.cancel():
+            with self._lock:
+                self._pending -= 1
+                self.counters["dropped"] += 1
+        with self._lock:
+            self.counters["timeouts"] += 1
+        logging.warning(f"Function '{func.__name__}' timed out after {seconds} seconds and {attempts} attempts, cancelled.")
+        raise TimeoutError(f"Function '{func.__name__}' timed out after {seconds} seconds and {attempts} attempts.")
+
+    @staticmethod
+    def _spawn(task) -> Future:
+        future = Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(task())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, daemon=True).start()
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self.counters, pending=self._pending, max_workers=self.max_workers)
+        res["avg_queue_wait_seconds"] = round(res["queue_wait_seconds"] / res["calls"], 6) if res["calls"] else 0.0
+        return res
+
+
+DEADLINE_EXECUTOR = DeadlineExecutor()
@@ -0,0 +1,74 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cache of the PDF page analysis, i.e. what `RAGFlowPdfParser.__images__` computes:
+text boxes, layouts detected per page and the PNG-encoded page images.
+
+Entries live in the object storage, keyed by the xxhash of the file, the parser
+version, the layout model and the page range with its zoom. Re-chunking a
+document with another chunk_token_num or delimiter, or retrying a failed page
+range, then goes straight to layout merging and chunking without OCR. Entries
+are pickled and loaded with `restricted_loads`, which only allows numpy types.
+Nothing expires them: give PDF_ANALYSIS_BUCKET a lifecycle rule if needed.
+"""
+import logging
+import os
+import pickle
+
+import xxhash
+
+from api.utils import restricted_loads
+
+PDF_ANALYSIS_BUCKET = os.environ.get("PDF_ANALYSIS_BUCKET", "ragflow-pdf-analysis")
+# Bump it whenever what `__images__` computes changes, older entries are then ignored.
+PDF_ANALYSIS_VERSION = 1
+
+
+def file_hash(fnm):
+    hasher = xxhash.xxh64()
+    if isinstance(fnm, str):
+        with open(fnm, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+    else:
+        hasher.update(fnm)
+    return hasher.hexdigest()
+
+
+class PdfAnalysisCache:
+    def __init__(self, storage, bucket=PDF_ANALYSIS_BUCKET):
+        self.storage = storage
+        self.bucket = bucket
+
+    @staticmethod
+    def key(fnm, model, zoomin, page_from, page_to):
+        return f"{file_hash(fnm)}/v{PDF_ANALYSIS_VERSION}-{model}-{zoomin}-{page_from}-{page_to}"
+
+    def get(self, key):
+        try:
+            if not self.storage.obj_exist(self.bucket, key):
+                return None
+            binary = self.storage.get(self.bucket, key)
+            return restricted_loads(binary) if binary else None
+        except Exception:
+            logging.exception(f"PdfAnalysisCache failed to load {key}")
+            return None
+
+    def put(self, key, analysis):
+        try:
+            self.storage.put(self.bucket, key, pickle.dumps(analysis, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            logging.exception(f"PdfAnalysisCache failed to save {key}")
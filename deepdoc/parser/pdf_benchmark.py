@@ -0,0 +1,136 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Peak memory of parsing a synthetic scanned PDF: rendering every page up front,
+as `RAGFlowPdfParser.__images__` used to, against the page window pipeline.
+Every run happens in a fresh process and reports its peak RSS above the RSS
+it had before parsing (models loaded).
+
+    python deepdoc/parser/pdf_benchmark.py --pages 50 300 --windows 4 16
+    python deepdoc/parser/pdf_benchmark.py --pages 300 --eager_only
+"""
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import multiprocessing as mp
+import random
+import resource
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+WORDS = "the of parser page layout table figure memory window render document knowledge retrieval".split()
+
+
+def make_pdf(fnm, pages, seed, dpi=150):
+    random.seed(seed)
+    w, h = int(8.27 * dpi), int(11.69 * dpi)
+
+    def page(i):
+        img = Image.new("RGB", (w, h), (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        draw.text((w // 2, h // 20), f"Page {i + 1}", fill=(0, 0, 0))
+        y = h // 10
+        while y < h * 0.9:
+            draw.text((w // 10, y), " ".join(random.choices(WORDS, k=random.randint(4, 14))), fill=(0, 0, 0))
+            y += random.randint(20, 40)
+        if i % 3 == 0:
+            draw.rectangle((w // 10, h // 2, w * 9 // 10, h * 2 // 3), outline=(0, 0, 0))
+        return img
+
+    first = page(0)
+    first.save(fnm, "PDF", resolution=dpi, save_all=True, append_images=(page(i) for i in range(1, pages)))
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def eager(fnm, zoomin, queue):
+    import pdfplumber
+
+    base = rss_mb()
+    st = time.perf_counter()
+    with pdfplumber.open(fnm) as pdf:
+        page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for p in pdf.pages]
+        page_chars = [[c for c in p.dedupe_chars().chars] for p in pdf.pages]
+    assert len(page_chars) == len(page_images)
+    queue.put((base, peak_rss_mb(), time.perf_counter() - st, len(page_images)))
+
+
+def window(fnm, zoomin, size, queue):
+    os.environ["PDF_PAGE_WINDOW"] = str(size)
+    from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+
+    parser = RAGFlowPdfParser()
+    base = rss_mb()
+    st = time.perf_counter()
+    parser.__images__(fnm, zoomin, 0, 100000)
+    parser._layouts_rec(zoomin)
+    parser._table_transformer_job(zoomin)
+    queue.put((base, peak_rss_mb(), time.perf_counter() - st, len(parser.page_images)))
+
+
+def run(target, *args):
+    queue = mp.get_context("spawn").Queue()
+    p = mp.get_context("spawn").Process(target=target, args=(*args, queue))
+    p.start()
+    base, peak, el, pages = queue.get()
+    p.join()
+    return peak - base, el, pages
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.pages:
+            fnm = os.path.join(tmp, f"synthetic_{n}.pdf")
+            make_pdf(fnm, n, args.seed)
+            print(f"{n} pages, {os.path.getsize(fnm) / 1024 / 1024:.1f}MB PDF")
+            mb, el, _ = run(eager, fnm, args.zoomin)
+            print(f"    render all pages up front: +{mb:8.1f}MB peak RSS, {el:.1f}s (rendering only)")
+            if args.eager_only:
+                continue
+            for size in args.windows:
+                mb, el, _ = run(window, fnm, args.zoomin, size)
+                print(f"    window of {size:3d} pages      : +{mb:8.1f}MB peak RSS, {el:.1f}s (OCR, layouts and tables)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs="+", help="page counts of the synthetic PDFs", default=[50, 300])
+    parser.add_argument('--windows', type=int, nargs="+", help="PDF_PAGE_WINDOW values to run", default=[4, 16])
+    parser.add_argument('--zoomin', type=int, default=3)
+    parser.add_argument('--eager_only', action="store_true", help="skip the parser runs, which need the deepdoc models")
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
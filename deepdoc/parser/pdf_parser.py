@@ -28,6 +28,7 @@ import numpy as np
 import pdfplumber
 import trio
 import xgboost as xgb
+from cachetools import LRUCache
 from huggingface_hub import snapshot_download
 from PIL import Image
 from pypdf import PdfReader as pdf2_read
@@ -35,6 +36,8 @@ from pypdf import PdfReader as pdf2_read
 from api import settings
 from api.utils.file_utils import get_project_base_directory
 from deepdoc.vision import OCR, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision.box_index import BoxIndex
+from deepdoc.vision.session_pool import OCR_CPU_WORKERS
 from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
 from rag.nlp import rag_tokenizer
 from rag.prompts import vision_llm_describe_prompt
@@ -44,6 +47,66 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+# Pages OCRed together: text detection runs on them at once and their text lines are recognized together.
+PDF_OCR_BATCH = int(os.environ.get("PDF_OCR_BATCH", 4))
+# Pages rendered but not yet OCRed, and decoded pages kept by `PageImages`.
+PDF_PAGE_WINDOW = int(os.environ.get("PDF_PAGE_WINDOW", 2 * PDF_OCR_BATCH * max(1, PARALLEL_DEVICES, OCR_CPU_WORKERS)))
+# Pages of a document without any text box which are OCRed again at a higher resolution.
+PDF_ZOOMED_OCR_PAGES = int(os.environ.get("PDF_ZOOMED_OCR_PAGES", 16))
+# Resolution factor of that second pass.
+PDF_OCR_ZOOM = 3
+
+
+class PageImages:
+    """
+    Page images of a parse, kept PNG-encoded once their OCR is done.
+
+    Indexing returns a PIL image which is decoded on first pixel access, and at
+    most `window` of them are held, so memory depends on the window instead of
+    the page count. PNG is lossless: crops are the same as the rendered page.
+    """
+
+    def __init__(self, n_pages, window=PDF_PAGE_WINDOW):
+        self._blobs = [None] * n_pages
+        self._decoded = LRUCache(maxsize=max(1, window))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __setitem__(self, i, img):
+        buf = BytesIO()
+        img.save(buf, format="PNG", compress_level=1)
+        with self._lock:
+            self._blobs[i] = buf.getvalue()
+            self._decoded.pop(i, None)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self._blobs)
+        with self._lock:
+            img = self._decoded.get(i)
+            if img is None:
+                img = Image.open(BytesIO(self._blobs[i]))
+                self._decoded[i] = img
+        return img
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def nbytes(self):
+        return sum(len(b) for b in self._blobs if b)
+
+    def blobs(self):
+        return list(self._blobs)
+
+    @classmethod
+    def from_blobs(cls, blobs, window=PDF_PAGE_WINDOW):
+        images = cls(len(blobs), window)
+        images._blobs = list(blobs)
+        return images
+
 
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
@@ -63,6 +126,9 @@ class RAGFlowPdfParser:
         self.parallel_limiter = None
         if PARALLEL_DEVICES > 1:
             self.parallel_limiter = [trio.CapacityLimiter(1) for _ in range(PARALLEL_DEVICES)]
+        elif PARALLEL_DEVICES == 0 and OCR_CPU_WORKERS > 1:
+            # One "device" whose model runs are spread over the CPU workers, see deepdoc/vision/session_pool.py.
+            self.parallel_limiter = [trio.CapacityLimiter(OCR_CPU_WORKERS)]
 
         if hasattr(self, "model_speciess"):
             self.layouter = LayoutRecognizer("layout." + self.model_speciess)
@@ -94,6 +160,9 @@ class RAGFlowPdfParser:
 
         self.page_from = 0
 
+    # A `PdfAnalysisCache` set by the task executor, `__images__` reuses the analysis of a page range from it.
+    analysis_cache = None
+
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // max(len(c["text"]), 1)
 
@@ -261,109 +330,123 @@ class RAGFlowPdfParser:
         clmns = sorted([r for r in self.tb_cpns if re.match(
             r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
         clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
-        for b in self.boxes:
-            if b.get("layout_type", "") != "table":
-                continue
-            ii = Recognizer.find_overlapped_with_threshold(b, rows, thr=0.3)
-            if ii is not None:
-                b["R"] = ii
-                b["R_top"] = rows[ii]["top"]
-                b["R_bott"] = rows[ii]["bottom"]
-
-            ii = Recognizer.find_overlapped_with_threshold(
-                b, headers, thr=0.3)
-            if ii is not None:
-                b["H_top"] = headers[ii]["top"]
-                b["H_bott"] = headers[ii]["bottom"]
-                b["H_left"] = headers[ii]["x0"]
-                b["H_right"] = headers[ii]["x1"]
-                b["H"] = ii
-
-            ii = Recognizer.find_horizontally_tightest_fit(b, clmns)
-            if ii is not None:
-                b["C"] = ii
-                b["C_left"] = clmns[ii]["x0"]
-                b["C_right"] = clmns[ii]["x1"]
-
-            ii = Recognizer.find_overlapped_with_threshold(b, spans, thr=0.3)
-            if ii is not None:
-                b["H_top"] = spans[ii]["top"]
-                b["H_bott"] = spans[ii]["bottom"]
-                b["H_left"] = spans[ii]["x0"]
-                b["H_right"] = spans[ii]["x1"]
-                b["SP"] = ii
-
-    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None):
+        tbls = [b for b in self.boxes if b.get("layout_type", "") == "table"]
+        row_ii = BoxIndex(rows).find_overlapped_with_threshold(tbls, thr=0.3)
+        header_ii = BoxIndex(headers).find_overlapped_with_threshold(tbls, thr=0.3)
+        clmn_ii = BoxIndex(clmns).find_horizontally_tightest_fit(tbls, clmns)
+        span_ii = BoxIndex(spans).find_overlapped_with_threshold(tbls, thr=0.3)
+        for b, r, h, c, sp in zip(tbls, row_ii, header_ii, clmn_ii, span_ii):
+            if r is not None:
+                b["R"] = r
+                b["R_top"] = rows[r]["top"]
+                b["R_bott"] = rows[r]["bottom"]
+
+            if h is not None:
+                b["H_top"] = headers[h]["top"]
+                b["H_bott"] = headers[h]["bottom"]
+                b["H_left"] = headers[h]["x0"]
+                b["H_right"] = headers[h]["x1"]
+                b["H"] = h
+
+            if c is not None:
+                b["C"] = c
+                b["C_left"] = clmns[c]["x0"]
+                b["C_right"] = clmns[c]["x1"]
+
+            if sp is not None:
+                b["H_top"] = spans[sp]["top"]
+                b["H_bott"] = spans[sp]["bottom"]
+                b["H_left"] = spans[sp]["x0"]
+                b["H_right"] = spans[sp]["x1"]
+                b["SP"] = sp
+
+    def __ocr(self, pages, ZM=3, device_id: int | None = None):
+        """
+        OCRs `pages`, a list of (pagenum, img, chars). Their text boxes are
+        detected in one batch, then the boxes without PDF characters of every
+        page are recognized in another one.
+        """
         start = timer()
-        bxs = self.ocr.detect(np.array(img), device_id)
-        logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
+        imgs_np = [np.array(img) for _, img, _ in pages]
+        dets = self.ocr.detect_batch(imgs_np, device_id)
+        logging.info(f"__ocr detecting boxes of {len(pages)} images cost ({timer() - start}s)")
 
         start = timer()
-        if not bxs:
-            self.boxes.append([])
-            return
-        bxs = [(line[0], line[1][0]) for line in bxs]
-        bxs = Recognizer.sort_Y_firstly(
-            [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
-              "top": b[0][1] / ZM, "text": "", "txt": t,
-              "bottom": b[-1][1] / ZM,
-              "chars": [],
-              "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
-            self.mean_height[pagenum-1] / 3
-        )
-
-        # merge chars in the same rect
-        for c in chars:
-            ii = Recognizer.find_overlapped(c, bxs)
-            if ii is None:
-                self.lefted_chars.append(c)
-                continue
-            ch = c["bottom"] - c["top"]
-            bh = bxs[ii]["bottom"] - bxs[ii]["top"]
-            if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
-                self.lefted_chars.append(c)
+        page_bxs, boxes_to_reg = [], []
+        for (pagenum, _, chars), img_np, bxs in zip(pages, imgs_np, dets):
+            if bxs is None:
+                self.boxes[pagenum - 1] = []
+                page_bxs.append(None)
                 continue
-            bxs[ii]["chars"].append(c)
+            bxs = [(line[0], line[1][0]) for line in bxs]
+            bxs = Recognizer.sort_Y_firstly(
+                [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
+                  "top": b[0][1] / ZM, "text": "", "txt": t,
+                  "bottom": b[-1][1] / ZM,
+                  "chars": [],
+                  "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
+                self.mean_height[pagenum-1] / 3
+            )
 
-        for b in bxs:
-            if not b["chars"]:
+            # merge chars in the same rect
+            for c, ii in zip(chars, BoxIndex(bxs).find_overlapped(chars)):
+                if ii is None:
+                    self.lefted_chars.append(c)
+                    continue
+                ch = c["bottom"] - c["top"]
+                bh = bxs[ii]["bottom"] - bxs[ii]["top"]
+                if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
+                    self.lefted_chars.append(c)
+                    continue
+                bxs[ii]["chars"].append(c)
+
+            for b in bxs:
+                if not b["chars"]:
+                    del b["chars"]
+                    continue
+                m_ht = np.mean([c["height"] for c in b["chars"]])
+                for c in Recognizer.sort_Y_firstly(b["chars"], m_ht):
+                    if c["text"] == " " and b["text"]:
+                        if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
+                            b["text"] += " "
+                    else:
+                        b["text"] += c["text"]
                 del b["chars"]
-                continue
-            m_ht = np.mean([c["height"] for c in b["chars"]])
-            for c in Recognizer.sort_Y_firstly(b["chars"], m_ht):
-                if c["text"] == " " and b["text"]:
-                    if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
-                        b["text"] += " "
-                else:
-                    b["text"] += c["text"]
-            del b["chars"]
 
-        logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
+            for b in bxs:
+                if not b["text"]:
+                    left, right, top, bott = b["x0"] * ZM, b["x1"] * \
+                                             ZM, b["top"] * ZM, b["bottom"] * ZM
+                    b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
+                    boxes_to_reg.append(b)
+                del b["txt"]
+            page_bxs.append(bxs)
+        logging.info(f"__ocr sorting chars of {len(pages)} pages cost {timer() - start}s")
+
         start = timer()
-        boxes_to_reg = []
-        img_np = np.array(img)
-        for b in bxs:
-            if not b["text"]:
-                left, right, top, bott = b["x0"] * ZM, b["x1"] * \
-                                         ZM, b["top"] * ZM, b["bottom"] * ZM
-                b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
-                boxes_to_reg.append(b)
-            del b["txt"]
         texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id)
         for i in range(len(boxes_to_reg)):
             boxes_to_reg[i]["text"] = texts[i]
             del boxes_to_reg[i]["box_image"]
-        logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
-        bxs = [b for b in bxs if b["text"]]
-        if self.mean_height[pagenum-1] == 0:
-            self.mean_height[pagenum-1] = np.median([b["bottom"] - b["top"]
-                                              for b in bxs])
-        self.boxes.append(bxs)
+        logging.info(f"__ocr recognize {len(boxes_to_reg)} boxes cost {timer() - start}s")
+
+        for (pagenum, _, _), bxs in zip(pages, page_bxs):
+            if bxs is None:
+                continue
+            bxs = [b for b in bxs if b["text"]]
+            if self.mean_height[pagenum-1] == 0:
+                self.mean_height[pagenum-1] = np.median([b["bottom"] - b["top"]
+                                                  for b in bxs])
+            self.boxes[pagenum - 1] = bxs
 
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
+        # Layouts detected page by page while OCRing, see `__images__`.
+        layouts = getattr(self, "page_layout_preds", None)
+        if layouts is not None and len(layouts) != len(self.page_images):
+            layouts = None
         self.boxes, self.page_layout = self.layouter(
-            self.page_images, self.boxes, ZM, drop=drop)
+            self.page_images, self.boxes, ZM, drop=drop, layouts=layouts)
         # cumlative Y
         for i in range(len(self.boxes)):
             self.boxes[i]["top"] += \
@@ -1003,41 +1086,69 @@ class RAGFlowPdfParser:
         except Exception:
             logging.exception("total_page_number")
 
+    def _page_chars(self, page):
+        try:
+            return [c for c in page.dedupe_chars().chars if self._has_color(c)]
+        except Exception as e:
+            logging.warning(f"Failed to extract characters of page {page.page_number}: {str(e)}")
+            return []  # If failed to extract, using empty list instead.
+        finally:
+            # pdfplumber caches the parsed objects of every page otherwise.
+            page.close()
+
     def __images__(self, fnm, zoomin=3, page_from=0,
                    page_to=299, callback=None):
+        """
+        Renders, OCRs and detects the layouts of the pages in a window of
+        PDF_PAGE_WINDOW pages. Once a page is done its image is handed over to
+        `PageImages` and its characters are dropped, so peak memory depends on
+        the window instead of the page count. Up to PDF_ZOOMED_OCR_PAGES pages
+        where no text box was detected are OCRed again at zoomin * 3 with the
+        same opened document, each of them taking 9 pages of the window.
+        With an `analysis_cache`, all of it is done once per file and page range.
+        """
         self.lefted_chars = []
-        self.mean_height = []
-        self.mean_width = []
-        self.boxes = []
         self.garbages = {}
-        self.page_cum_height = [0]
         self.page_layout = []
         self.page_from = page_from
+        cache_key = None
+        if self.analysis_cache is not None:
+            cache_key = self.analysis_cache.key(fnm, getattr(self, "model_speciess", "general"), zoomin, page_from, page_to)
+            if self._load_analysis(self.analysis_cache.get(cache_key)):
+                logging.info(f"__images__ reused the analysis of {len(self.page_images)} pages from {cache_key}")
+                if callback:
+                    callback(prog=0.6, msg="OCR and layout results of an earlier parse reused")
+                return
         start = timer()
+        pages = []
+        pdf = None
         try:
             with sys.modules[LOCK_KEY_pdfplumber]:
-                with (pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in
-                                        enumerate(self.pdf.pages[page_from:page_to])]
-
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-
-                    self.total_page = len(self.pdf.pages)
-
+                pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+                self.pdf = pdf
+                pages = self.pdf.pages[page_from:page_to]
+                self.total_page = len(self.pdf.pages)
         except Exception:
             logging.exception("RAGFlowPdfParser __images__")
+
+        # The language is decided before any OCR, over the pages of the first window. Their characters are kept
+        # for the OCR, the others are extracted when their page comes.
+        sampled_chars = {}
+        is_english, has_chars = [], False
+        for i, page in enumerate(pages[:PDF_PAGE_WINDOW]):
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                chars = sampled_chars[i] = self._page_chars(page)
+            has_chars = has_chars or bool(chars)
+            is_english.append(re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(
+                random.choices([c["text"] for c in chars], k=min(100, len(chars))))))
+        self.is_english = sum([1 if e else 0 for e in is_english]) > len(is_english) / 2
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
 
         self.outlines = []
         try:
             with (pdf2_read(fnm if isinstance(fnm, str)
-                            else BytesIO(fnm))) as pdf:
-                self.pdf = pdf
+                            else BytesIO(fnm))) as pdf2:
+                self.pdf = pdf2
 
                 outlines = self.pdf.outline
                 def dfs(arr, depth):
@@ -1055,68 +1166,134 @@ class RAGFlowPdfParser:
         if not self.outlines:
             logging.warning("Miss outlines")
 
-        logging.debug("Images converted.")
-        self.is_english = [re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(
-            random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i]))))) for i in
-            range(len(self.page_chars))]
-        if sum([1 if e else 0 for e in self.is_english]) > len(
-                self.page_images) / 2:
-            self.is_english = True
-        else:
-            self.is_english = False
-
-        async def __img_ocr(i, id, img, chars, limiter):
-            j = 0
-            while j + 1 < len(chars):
-                if chars[j]["text"] and chars[j + 1]["text"] \
-                        and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
-                        and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
-                                                                       chars[j]["width"]) / 2:
-                    chars[j]["text"] += " "
-                j += 1
-
-            if limiter:
-                async with limiter:
-                    await trio.to_thread.run_sync(lambda: self.__ocr(i + 1, img, chars, zoomin, id))
-            else:
-                self.__ocr(i + 1, img, chars, zoomin, id)
+        self.boxes = [[] for _ in pages]
+        self.mean_height = [0] * len(pages)
+        self.mean_width = [8] * len(pages)
+        self.page_cum_height = [0] * (len(pages) + 1)
+        self.page_images = PageImages(len(pages))
+        self.page_layout_preds = [None] * len(pages)
+        # Without several devices the batches of pages are still OCRed one by one, rendering goes ahead of them.
+        limiters = self.parallel_limiter or [trio.CapacityLimiter(1)]
+        done = [0]
 
-            if callback and i % 6 == 5:
-                callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
+        # Chars of the pages where no text box was detected, by page index.
+        blank = {}
 
-        async def __img_ocr_launcher():
-            def __ocr_preprocess():
-                chars = self.page_chars[i] if not self.is_english else []
-                self.mean_height.append(
-                    np.median(sorted([c["height"] for c in chars])) if chars else 0
-                )
-                self.mean_width.append(
-                    np.median(sorted([c["width"] for c in chars])) if chars else 8
-                )
-                self.page_cum_height.append(img.size[1] / zoomin)
-                return chars
+        def __render(page, zoom):
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                try:
+                    return page.to_image(resolution=72 * zoom, antialias=True).annotated
+                except Exception:
+                    logging.exception(f"RAGFlowPdfParser __images__ rendering page {page.page_number}")
+                    return Image.new("RGB", (int(page.width * zoom), int(page.height * zoom)), (255, 255, 255))
+
+        def __chars(i, page):
+            nonlocal has_chars
+            chars = sampled_chars.pop(i, None)
+            if self.is_english:
+                return []
+            if chars is None:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    chars = self._page_chars(page)
+                has_chars = has_chars or bool(chars)
+            return chars
+
+        def __unleft(chars):
+            chars = set(map(id, chars))
+            self.lefted_chars = [c for c in self.lefted_chars if id(c) not in chars]
+
+        def __ocr_pages(id, batch):
+            self.__ocr([(i + 1, img, chars) for i, img, chars in batch], zoomin, id)
+            for (i, img, chars), layouts in zip(batch, self.layouter.detect([img for _, img, _ in batch])):
+                self.page_layout_preds[i] = layouts
+                self.page_images[i] = img
+                if not self.boxes[i]:
+                    blank[i] = chars
+
+        async def __img_ocr(id, batch, limiter, window):
+            try:
+                pages_ = []
+                for i, page in batch:
+                    img = await trio.to_thread.run_sync(lambda: __render(page, zoomin))
+                    chars = await trio.to_thread.run_sync(lambda: __chars(i, page))
+                    self.mean_height[i] = np.median(sorted([c["height"] for c in chars])) if chars else 0
+                    self.mean_width[i] = np.median(sorted([c["width"] for c in chars])) if chars else 8
+                    self.page_cum_height[i + 1] = img.size[1] / zoomin
+
+                    j = 0
+                    while j + 1 < len(chars):
+                        if chars[j]["text"] and chars[j + 1]["text"] \
+                                and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
+                                and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
+                                                                               chars[j]["width"]) / 2:
+                            chars[j]["text"] += " "
+                        j += 1
+                    pages_.append((i, img, chars))
 
-            if self.parallel_limiter:
-                async with trio.open_nursery() as nursery:
-                    for i, img in enumerate(self.page_images):
-                        chars = __ocr_preprocess()
+                async with limiter:
+                    await trio.to_thread.run_sync(lambda: __ocr_pages(id, pages_))
+            finally:
+                for _ in batch:
+                    window.release()
+
+            for _ in batch:
+                done[0] += 1
+                if callback and done[0] % 6 == 0:
+                    callback(prog=done[0] * 0.6 / len(pages), msg="")
+
+        async def __zoomed_ocr(id, batch, limiter, window, slots):
+            # Only the text boxes are redone, page images and layouts stay the ones of the first pass.
+            try:
+                pages_ = []
+                for i in batch:
+                    img = await trio.to_thread.run_sync(lambda: __render(pages[i], zoomin * PDF_OCR_ZOOM))
+                    pages_.append((i + 1, img, blank[i]))
+                async with limiter:
+                    await trio.to_thread.run_sync(lambda: self.__ocr(pages_, zoomin * PDF_OCR_ZOOM, id))
+            finally:
+                for _ in range(len(batch) * slots):
+                    window.release()
 
-                        nursery.start_soon(__img_ocr, i, i % PARALLEL_DEVICES, img, chars,
-                                           self.parallel_limiter[i % PARALLEL_DEVICES])
-                        await trio.sleep(0.1)
-            else:
-                for i, img in enumerate(self.page_images):
-                    chars = __ocr_preprocess()
-                    await __img_ocr(i, 0, img, chars, None)
+        async def __img_ocr_launcher():
+            window_size = max(PDF_PAGE_WINDOW, PDF_OCR_BATCH)
+            window = trio.Semaphore(window_size)
+            async with trio.open_nursery() as nursery:
+                for b in range(0, len(pages), PDF_OCR_BATCH):
+                    batch = [(i, pages[i]) for i in range(b, min(b + PDF_OCR_BATCH, len(pages)))]
+                    for _ in batch:
+                        await window.acquire()
+                    id = b // PDF_OCR_BATCH % len(limiters)
+                    nursery.start_soon(__img_ocr, id, batch, limiters[id], window)
+
+            if not blank or zoomin >= 9 or PDF_ZOOMED_OCR_PAGES <= 0:
+                return
+            # Pages without any text box, e.g. small scanned print, get another try at a higher resolution.
+            retry = sorted(blank)[:PDF_ZOOMED_OCR_PAGES]
+            logging.info(f"__images__ OCR {len(retry)} of {len(blank)} pages without text boxes again with zoomin {zoomin * PDF_OCR_ZOOM}")
+            __unleft([c for i in retry for c in blank[i]])
+            # A zoomed page has zoom² the pixels of a page of the first pass, it holds as many slots of the window.
+            slots = min(PDF_OCR_ZOOM ** 2, window_size)
+            batch_size = max(1, min(PDF_OCR_BATCH, window_size // slots))
+            async with trio.open_nursery() as nursery:
+                for b in range(0, len(retry), batch_size):
+                    batch = retry[b: b + batch_size]
+                    for _ in range(len(batch) * slots):
+                        await window.acquire()
+                    id = b // batch_size % len(limiters)
+                    nursery.start_soon(__zoomed_ocr, id, batch, limiters[id], window, slots)
 
         start = timer()
+        try:
+            trio.run(__img_ocr_launcher)
+        finally:
+            if pdf:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    pdf.close()
 
-        trio.run(__img_ocr_launcher)
-
-        logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
+        logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s, "
+                     f"{self.page_images.nbytes() / 1024 / 1024:.1f}MB of encoded page images")
 
-        if not self.is_english and not any(
-                [c for c in self.page_chars]) and self.boxes:
+        if not self.is_english and not has_chars and self.boxes:
             bxes = [b for bxs in self.boxes for b in bxs]
             self.is_english = re.search(r"[\na-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}",
                                         "".join([b["text"] for b in random.choices(bxes, k=min(30, len(bxes)))]))
@@ -1125,8 +1302,35 @@ class RAGFlowPdfParser:
 
         self.page_cum_height = np.cumsum(self.page_cum_height)
         assert len(self.page_cum_height) == len(self.page_images) + 1
-        if len(self.boxes) == 0 and zoomin < 9:
-            self.__images__(fnm, zoomin * 3, page_from, page_to, callback)
+        if cache_key and pdf is not None and pages:
+            self.analysis_cache.put(cache_key, self._dump_analysis())
+
+    def _dump_analysis(self):
+        return {
+            "total_page": self.total_page,
+            "outlines": self.outlines,
+            "is_english": bool(self.is_english),
+            "boxes": self.boxes,
+            "mean_height": self.mean_height,
+            "mean_width": self.mean_width,
+            "page_cum_height": self.page_cum_height,
+            "page_images": self.page_images.blobs(),
+            "page_layout_preds": self.page_layout_preds,
+        }
+
+    def _load_analysis(self, analysis):
+        if not analysis:
+            return False
+        self.total_page = analysis["total_page"]
+        self.outlines = analysis["outlines"]
+        self.is_english = analysis["is_english"]
+        self.boxes = analysis["boxes"]
+        self.mean_height = analysis["mean_height"]
+        self.mean_width = analysis["mean_width"]
+        self.page_cum_height = analysis["page_cum_height"]
+        self.page_images = PageImages.from_blobs(analysis["page_images"])
+        self.page_layout_preds = analysis["page_layout_preds"]
+        return True
 
     def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
         self.__images__(fnm, zoomin)
@@ -0,0 +1,175 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Batched box lookups of `Recognizer`.
+
+A `BoxIndex` keeps the x0, x1, top and bottom of a list of boxes in numpy arrays,
+along with their order by top. The boxes a query box may touch lie in the range
+of tops [query top - highest box, query bottom], so a whole batch of queries
+(e.g. every PDF char of a page) is answered with two `searchsorted` and array
+arithmetic instead of a Python loop over the boxes for every query.
+
+The `find_*` methods return, for every query, the index the function of the
+same name in `Recognizer` returns for it, ties included.
+"""
+import numpy as np
+
+
+def _coords(boxes):
+    arr = np.array([(b["x0"], b["x1"], b["top"], b["bottom"]) for b in boxes], dtype=np.float64).reshape(-1, 4)
+    return [np.ascontiguousarray(arr[:, i]) for i in range(4)]
+
+
+def _overlapped_area(a, ai, b, bi, ratio=True):
+    """`Recognizer.overlapped_area(a[ai[k]], b[bi[k]], ratio)` of every k."""
+    x0, x1, tp, btm = a.x0[ai], a.x1[ai], a.top[ai], a.bottom[ai]
+    x0_ = np.maximum(b.x0[bi], x0)
+    x1_ = np.minimum(b.x1[bi], x1)
+    tp_ = np.maximum(b.top[bi], tp)
+    btm_ = np.minimum(b.bottom[bi], btm)
+    w, h = x1 - x0, btm - tp
+    ov = np.where((w != 0) & (h != 0) & (x0_ <= x1_) & (tp_ <= btm_), (btm_ - tp_) * (x1_ - x0_), 0.)
+    if ratio:
+        ov = np.divide(ov, w * h, out=ov, where=ov > 0)
+    return ov
+
+
+class BoxIndex:
+    def __init__(self, boxes):
+        self.n = len(boxes)
+        self.x0, self.x1, self.top, self.bottom = _coords(boxes)
+        self.by_top = np.argsort(self.top, kind="stable")
+        self.sorted_top = self.top[self.by_top]
+        self.max_height = float(np.max(self.bottom - self.top, initial=0))
+
+    @staticmethod
+    def of(boxes):
+        return boxes if isinstance(boxes, BoxIndex) else BoxIndex(boxes)
+
+    def touching(self, q):
+        """Pairs (query index, box index) of the boxes which touch their query, by query then box."""
+        # A little slack for the rounding of bottom - top, the exact test follows.
+        slack = self.max_height * (1 + 1e-9) + 1e-9
+        lo = np.searchsorted(self.sorted_top, q.top - slack, side="left")
+        hi = np.searchsorted(self.sorted_top, q.bottom, side="right")
+        cnt = np.maximum(hi - lo, 0)
+        qi = np.repeat(np.arange(q.n), cnt)
+        offset = np.arange(qi.size) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        bi = self.by_top[np.repeat(lo, cnt) + offset]
+        keep = ~((q.x0[qi] > self.x1[bi]) | (q.x1[qi] < self.x0[bi])
+                 | (q.bottom[qi] < self.top[bi]) | (q.top[qi] > self.bottom[bi]))
+        qi, bi = qi[keep], bi[keep]
+        order = np.lexsort((bi, qi))
+        return qi[order], bi[order]
+
+    def all_pairs(self, q):
+        return np.repeat(np.arange(q.n), self.n), np.tile(np.arange(self.n), q.n)
+
+    @staticmethod
+    def _first_of_each(qi, bi, n, *keys):
+        """For each query, the box of the pair ranked first by `keys` (ascending, last key first)."""
+        res = [None] * n
+        if not qi.size:
+            return res
+        order = np.lexsort((*keys, qi))
+        qi, bi = qi[order], bi[order]
+        first = np.ones(qi.size, dtype=bool)
+        first[1:] = qi[1:] != qi[:-1]
+        for q, b in zip(qi[first].tolist(), bi[first].tolist()):
+            res[q] = b
+        return res
+
+    def find_overlapped(self, queries, naive=False):
+        """`Recognizer.find_overlapped(q, boxes, naive)` of every query, the boxes being sorted by y."""
+        q = BoxIndex.of(queries)
+        if not self.n:
+            return [None] * q.n
+        s = np.zeros(q.n, dtype=np.int64)
+        e = np.full(q.n, self.n, dtype=np.int64)
+        ii = np.zeros(q.n, dtype=np.int64)
+        # The binary search of Recognizer.find_overlapped, for all the queries at once.
+        active = np.flatnonzero(s < e) if not naive else np.array([], dtype=np.int64)
+        while active.size:
+            m = (e[active] + s[active]) // 2
+            ii[active] = m
+            below = q.bottom[active] < self.top[m]
+            above = ~below & (q.top[active] > self.bottom[m])
+            e[active[below]] = m[below]
+            s[active[above]] = m[above] + 1
+            active = active[(below | above) & (s[active] < e[active])]
+        step = s < ii
+        step[step] = q.top[step] > self.bottom[s[step]]
+        s += step
+        step = e - 1 > ii
+        step[step] = q.bottom[step] < self.top[e[step] - 1]
+        e -= step
+
+        qi, bi = self.touching(q)
+        inside = (bi >= s[qi]) & (bi < e[qi])
+        qi, bi = qi[inside], bi[inside]
+        ov = _overlapped_area(self, bi, q, qi)
+        positive = ov > 0
+        qi, bi, ov = qi[positive], bi[positive], ov[positive]
+        # The largest ratio, the first box on ties.
+        return self._first_of_each(qi, bi, q.n, bi, -ov)
+
+    def find_overlapped_with_threshold(self, queries, thr=0.3):
+        """`Recognizer.find_overlapped_with_threshold(q, boxes, thr)` of every query."""
+        q = BoxIndex.of(queries)
+        if not self.n:
+            return [None] * q.n
+        # Boxes not touching a query have no overlap, they only count for a threshold <= 0.
+        qi, bi = self.touching(q) if thr > 0 else self.all_pairs(q)
+        ov = _overlapped_area(q, qi, self, bi)
+        _ov = _overlapped_area(self, bi, q, qi)
+        above = ov >= thr
+        qi, bi, ov, _ov = qi[above], bi[above], ov[above], _ov[above]
+        # The largest (ov, _ov), the last box on ties.
+        return self._first_of_each(qi, bi, q.n, -bi, -_ov, -ov)
+
+    def find_horizontally_tightest_fit(self, queries, boxes):
+        """`Recognizer.find_horizontally_tightest_fit(q, boxes)` of every query, `boxes` being the indexed ones."""
+        res = [None] * len(queries)
+        if not self.n:
+            return res
+        groups = {}
+        for i, b in enumerate(boxes):
+            groups.setdefault(b.get("layoutno", "0"), []).append(i)
+        pending = {}
+        for i, b in enumerate(queries):
+            if b.get("layoutno", "0") in groups:
+                pending.setdefault(b.get("layoutno", "0"), []).append(i)
+        for no, qs in pending.items():
+            x0, x1, _, _ = _coords([queries[i] for i in qs])
+            bs = np.array(groups[no])
+            bx0, bx1 = self.x0[bs], self.x1[bs]
+            dis = np.minimum(np.minimum(np.abs(x0[:, None] - bx0[None, :]), np.abs(x1[:, None] - bx1[None, :])),
+                             np.abs(x0[:, None] + x1[:, None] - bx1[None, :] - bx0[None, :]) / 2)
+            dis = np.where(np.isnan(dis), np.inf, dis)
+            j = np.argmin(dis, axis=1)
+            for i, jj, d in zip(qs, j.tolist(), dis[np.arange(len(qs)), j].tolist()):
+                if d < 1000000:
+                    res[i] = int(bs[jj])
+        return res
+
+    def overlapped_area_sum(self, box):
+        """Sum of `Recognizer.overlapped_area(b, box, False)` over the boxes touching `box`, added in order."""
+        q = BoxIndex([box])
+        _, bi = self.touching(q)
+        area = 0
+        for ov in _overlapped_area(self, bi, q, np.zeros_like(bi), False).tolist():
+            area += ov
+        return area
@@ -0,0 +1,108 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Box lookups of a synthetic dense page, one `Recognizer` call per box against
+one `BoxIndex` batch: chars to OCR boxes, table boxes to rows and columns,
+and the area sums of `layouts_cleanup`. Results must be identical.
+
+    python deepdoc/vision/box_index_benchmark.py --lines 120 --chars_per_line 150
+"""
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+import time
+
+from deepdoc.vision import Recognizer
+from deepdoc.vision.box_index import BoxIndex
+
+
+def dense_page(lines, chars_per_line, seed, width=595., height=842.):
+    """Chars of `lines` text lines, split into OCR boxes of a few words, and table rows/columns over them."""
+    random.seed(seed)
+    line_h = height / lines
+    char_w = width / chars_per_line
+    chars, bxs = [], []
+    for ln in range(lines):
+        top = ln * line_h + random.uniform(0, line_h * .1)
+        bottom = top + line_h * random.uniform(.6, .9)
+        x = random.uniform(0, char_w)
+        box = None
+        for _ in range(chars_per_line):
+            if box is None or random.random() < .05:
+                box = {"x0": x, "x1": x, "top": top - .5, "bottom": bottom + .5, "layoutno": "table-0"}
+                bxs.append(box)
+            w = char_w * random.uniform(.5, .95)
+            chars.append({"x0": x, "x1": x + w, "top": top, "bottom": bottom, "text": "x"})
+            box["x1"] = x + w
+            x += char_w
+    rows = [{"x0": 0., "x1": width, "top": ln * line_h, "bottom": (ln + 1) * line_h} for ln in range(lines)]
+    clmns = [{"x0": c * width / 8, "x1": (c + 1) * width / 8, "top": 0., "bottom": height, "layoutno": "table-0"}
+             for c in range(8)]
+    return chars, Recognizer.sort_Y_firstly(bxs, line_h / 3), rows, clmns
+
+
+def timed(fn):
+    st = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - st
+
+
+def report(name, loop, batch):
+    (a, el0), (b, el1) = loop, batch
+    print(f"{name:32s}: {el0:8.3f}s -> {el1:7.3f}s, {el0 / max(el1, 1e-9):6.1f}x, identical: {a == b}")
+
+
+def main(args):
+    chars, bxs, rows, clmns = dense_page(args.lines, args.chars_per_line, args.seed)
+    print(f"{len(chars)} chars, {len(bxs)} boxes, {len(rows)} rows, {len(clmns)} columns")
+
+    report("find_overlapped (chars)",
+           timed(lambda: [Recognizer.find_overlapped(c, bxs) for c in chars]),
+           timed(lambda: BoxIndex(bxs).find_overlapped(chars)))
+    report("find_overlapped_with_threshold",
+           timed(lambda: [Recognizer.find_overlapped_with_threshold(b, rows, thr=.3) for b in bxs]),
+           timed(lambda: BoxIndex(rows).find_overlapped_with_threshold(bxs, thr=.3)))
+    report("find_horizontally_tightest_fit",
+           timed(lambda: [Recognizer.find_horizontally_tightest_fit(b, clmns) for b in bxs]),
+           timed(lambda: BoxIndex(clmns).find_horizontally_tightest_fit(bxs, clmns)))
+
+    def area_sums():
+        area = []
+        for lt in rows:
+            area.append(0)
+            for c in chars:
+                area[-1] += Recognizer.overlapped_area(c, lt, False)
+        return area
+    index = BoxIndex(chars)
+    report("layouts_cleanup area sums", timed(area_sums), timed(lambda: [index.overlapped_area_sum(lt) for lt in rows]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, help="text lines of the page", default=120)
+    parser.add_argument('--chars_per_line', type=int, default=150)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
@@ -25,6 +25,7 @@ from huggingface_hub import snapshot_download
 
 from api.utils.file_utils import get_project_base_directory
 from deepdoc.vision import Recognizer
+from deepdoc.vision.box_index import BoxIndex
 from deepdoc.vision.operators import nms
 
 
@@ -61,7 +62,12 @@ class LayoutRecognizer(Recognizer):
             from deepdoc.vision.dla_cli import DLAClient
             self.client = DLAClient(os.environ["TENSORRT_DLA_SVR"])
 
-    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True):
+    def detect(self, image_list, thr=0.2, batch_size=16):
+        if self.client:
+            return self.client.predict(image_list)
+        return super().__call__(image_list, thr, batch_size)
+
+    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True, layouts=None):
         def __is_garbage(b):
             patt = [r"^•+$", "^[0-9]{1,2} / ?[0-9]{1,2}$",
                     r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}",
@@ -69,10 +75,8 @@ class LayoutRecognizer(Recognizer):
                     ]
             return any([re.search(p, b["text"]) for p in patt])
 
-        if self.client:
-            layouts = self.client.predict(image_list)
-        else:
-            layouts = super().__call__(image_list, thr, batch_size)
+        if layouts is None:
+            layouts = self.detect(image_list, thr, batch_size)
         # save_results(image_list, layouts, self.labels, output_dir='output/', threshold=0.7)
         assert len(image_list) == len(ocr_res)
         # Tag layout type
@@ -82,6 +86,7 @@ class LayoutRecognizer(Recognizer):
         page_layout = []
         for pn, lts in enumerate(layouts):
             bxs = ocr_res[pn]
+            page_height = image_list[pn].size[1]
             lts = [{"type": b["type"],
                     "score": float(b["score"]),
                     "x0": b["bbox"][0] / scale_factor, "x1": b["bbox"][2] / scale_factor,
@@ -97,6 +102,8 @@ class LayoutRecognizer(Recognizer):
             def findLayout(ty):
                 nonlocal bxs, lts, self
                 lts_ = [lt for lt in lts if lt["type"] == ty]
+                todo = [b for b in bxs if not b.get("layout_type")]
+                owners = dict(zip(map(id, todo), BoxIndex(lts_).find_overlapped_with_threshold(todo, thr=0.4)))
                 i = 0
                 while i < len(bxs):
                     if bxs[i].get("layout_type"):
@@ -106,8 +113,7 @@ class LayoutRecognizer(Recognizer):
                         bxs.pop(i)
                         continue
 
-                    ii = self.find_overlapped_with_threshold(bxs[i], lts_,
-                                                              thr=0.4)
+                    ii = owners[id(bxs[i])]
                     if ii is None:  # belong to nothing
                         bxs[i]["layout_type"] = ""
                         i += 1
@@ -115,9 +121,9 @@ class LayoutRecognizer(Recognizer):
                     lts_[ii]["visited"] = True
                     keep_feats = [
                         lts_[
-                            ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].size[1] * 0.9 / scale_factor,
+                            ii]["type"] == "footer" and bxs[i]["bottom"] < page_height * 0.9 / scale_factor,
                         lts_[
-                            ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].size[1] * 0.1 / scale_factor,
+                            ii]["type"] == "header" and bxs[i]["top"] > page_height * 0.1 / scale_factor,
                     ]
                     if drop and lts_[
                             ii]["type"] in self.garbage_layouts and not any(keep_feats):
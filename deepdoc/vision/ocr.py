@@ -31,6 +31,7 @@ import cv2
 import onnxruntime as ort
 
 from .postprocess import build_post_process
+from .session_pool import OCR_CPU_WORKERS, PooledSession
 
 loaded_models = {}
 
@@ -90,6 +91,12 @@ def load_model(model_dir, nm, device_id: int | None = None):
             return False
         return False
 
+    if OCR_CPU_WORKERS > 0 and not cuda_is_available():
+        loaded_model = (PooledSession(model_file_path), ort.RunOptions())
+        loaded_models[model_cached_tag] = loaded_model
+        logging.info(f"load_model {model_file_path} uses the CPU worker pool")
+        return loaded_model
+
     options = ort.SessionOptions()
     options.enable_cpu_mem_arena = False
     options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
@@ -423,6 +430,8 @@ class TextDetector:
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.run_options = load_model(model_dir, 'det', device_id)
         self.input_tensor = self.predictor.get_inputs()[0]
+        # Models exported with a fixed batch dimension take one image per run.
+        self.det_batch_num = 1 if isinstance(self.input_tensor.shape[0], int) and self.input_tensor.shape[0] > 0 else 8
 
         img_h, img_w = self.input_tensor.shape[2:]
         if isinstance(img_h, str) or isinstance(img_w, str):
@@ -479,34 +488,45 @@ class TextDetector:
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def __call__(self, img):
-        ori_im = img.copy()
-        data = {'image': img}
-
+    def batch(self, img_list):
+        """
+        Detects the text boxes of several images. Images resized to the same
+        shape, like the pages of most PDFs, are stacked into one run; they are
+        not padded to a common shape since padding changes the detections
+        along the page borders.
+        """
         st = time.time()
-        data = transform(data, self.preprocess_op)
-        img, shape_list = data
-        if img is None:
-            return None, 0
-        img = np.expand_dims(img, axis=0)
-        shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
-        input_dict = {}
-        input_dict[self.input_tensor.name] = img
-        for i in range(100000):
-            try:
-                outputs = self.predictor.run(None, input_dict, self.run_options)
-                break
-            except Exception as e:
-                if i >= 3:
-                    raise e
-                time.sleep(5)
-
-        post_result = self.postprocess_op({"maps": outputs[0]}, shape_list)
-        dt_boxes = post_result[0]['points']
-        dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+        dt_boxes_list = [None] * len(img_list)
+        groups = {}
+        for i, img in enumerate(img_list):
+            norm_img, shape = transform({'image': img}, self.preprocess_op)
+            if norm_img is None:
+                continue
+            groups.setdefault(norm_img.shape, []).append((i, norm_img, shape))
+
+        for items in groups.values():
+            for beg in range(0, len(items), self.det_batch_num):
+                batch = items[beg: beg + self.det_batch_num]
+                input_dict = {}
+                input_dict[self.input_tensor.name] = np.stack([norm_img for _, norm_img, _ in batch])
+                for i in range(100000):
+                    try:
+                        outputs = self.predictor.run(None, input_dict, self.run_options)
+                        break
+                    except Exception as e:
+                        if i >= 3:
+                            raise e
+                        time.sleep(5)
+
+                post_result = self.postprocess_op({"maps": outputs[0]}, np.stack([shape for _, _, shape in batch]))
+                for (ino, _, _), res in zip(batch, post_result):
+                    dt_boxes_list[ino] = self.filter_tag_det_res(res['points'], img_list[ino].shape)
+
+        return dt_boxes_list, time.time() - st
 
-        return dt_boxes, time.time() - st
+    def __call__(self, img):
+        dt_boxes_list, elapse = self.batch([img])
+        return dt_boxes_list[0], elapse
 
 
 class OCR:
@@ -657,6 +677,15 @@ class OCR:
         return zip(self.sorted_boxes(dt_boxes), [
                    ("", 0) for _ in range(len(dt_boxes))])
 
+    def detect_batch(self, img_list, device_id: int | None = None):
+        """`detect` over several images, stacked into as few detection runs as possible."""
+        if device_id is None:
+            device_id = 0
+
+        dt_boxes_list, elapse = self.text_detector[device_id].batch(img_list)
+        return [None if dt_boxes is None else list(zip(self.sorted_boxes(dt_boxes), [("", 0)] * len(dt_boxes)))
+                for dt_boxes in dt_boxes_list]
+
     def recognize(self, ori_im, box, device_id: int | None = None):
         if device_id is None:
             device_id = 0
@@ -725,3 +754,32 @@ class OCR:
         #    print(f"{bno}, {rec_res[bno]}")
 
         return list(zip([a.tolist() for a in filter_boxes], filter_rec_res))
+
+    def ocr_batch(self, img_list, device_id=0):
+        """
+        `__call__` over several images: their text boxes are detected in
+        batches, then the crops of all of them are recognized together, so the
+        recognizer's aspect ratio sorted batches pool the lines of every image.
+        """
+        if device_id is None:
+            device_id = 0
+
+        dt_boxes_list, _ = self.text_detector[device_id].batch(img_list)
+        img_crop_list = []
+        for i, dt_boxes in enumerate(dt_boxes_list):
+            dt_boxes_list[i] = self.sorted_boxes(dt_boxes) if dt_boxes is not None else []
+            for box in dt_boxes_list[i]:
+                img_crop_list.append(self.get_rotate_crop_image(img_list[i], copy.deepcopy(box)))
+
+        rec_res, _ = self.text_recognizer[device_id](img_crop_list)
+
+        res, k = [], 0
+        for dt_boxes in dt_boxes_list:
+            page_res = []
+            for box in dt_boxes:
+                text, score = rec_res[k]
+                k += 1
+                if score >= self.drop_score:
+                    page_res.append((box.tolist(), (text, score)))
+            res.append(page_res)
+        return res
@@ -0,0 +1,144 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+CPU worker processes for the deepdoc ONNX models.
+
+Without GPUs, `load_model` hands out a `PooledSession` when OCR_CPU_WORKERS > 0.
+It looks like an `onnxruntime.InferenceSession` to TextDetector, TextRecognizer,
+LayoutRecognizer and TableStructureRecognizer, but its runs go to a pool of
+worker processes. Each worker opens its own sessions, with OCR_CPU_THREADS
+intra-op threads, the first time it sees a model. All the models share the one
+pool, whose queue hands every run to the next idle worker, so the pages a parser
+OCRs concurrently spread over the workers. Pre- and post-processing stay in
+the calling thread and every call returns its own outputs, in order.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+OCR_CPU_WORKERS = int(os.environ.get("OCR_CPU_WORKERS", 0))
+OCR_CPU_THREADS = int(os.environ.get("OCR_CPU_THREADS", max(1, (os.cpu_count() or 1) // max(1, OCR_CPU_WORKERS))))
+
+# Sessions of a worker process, by model file.
+_sessions = {}
+_threads = 1
+
+
+def _init_worker(threads):
+    global _threads
+    _threads = threads
+
+
+def _session(model_file_path):
+    import onnxruntime as ort
+
+    if model_file_path not in _sessions:
+        options = ort.SessionOptions()
+        options.enable_cpu_mem_arena = False
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = _threads
+        options.inter_op_num_threads = 1
+        run_options = ort.RunOptions()
+        run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "cpu")
+        sess = ort.InferenceSession(model_file_path, options=options, providers=['CPUExecutionProvider'])
+        _sessions[model_file_path] = (sess, run_options)
+        logging.info(f"CPU worker {os.getpid()} loaded {model_file_path} with {_threads} threads")
+    return _sessions[model_file_path]
+
+
+def _describe(model_file_path):
+    sess, _ = _session(model_file_path)
+    return [[(n.name, n.shape, n.type) for n in nodes] for nodes in (sess.get_inputs(), sess.get_outputs())]
+
+
+def _run(model_file_path, output_names, input_feed):
+    sess, run_options = _session(model_file_path)
+    return sess.run(output_names, input_feed, run_options)
+
+
+class WorkerPool:
+    def __init__(self, workers=OCR_CPU_WORKERS, threads=OCR_CPU_THREADS):
+        self.workers = workers
+        self.threads = threads
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned: the parent runs threads of trio and onnxruntime.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker, initargs=(self.threads,))
+                logging.info(f"Started {self.workers} OCR CPU workers with {self.threads} threads each")
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args):
+        executor = self.executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), start over with fresh ones.
+            self._reset(executor)
+            return self.executor().submit(fn, *args)
+
+    def call(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+
+WORKER_POOL = WorkerPool()
+
+
+class PooledSession:
+    """Stands for an `onnxruntime.InferenceSession` whose runs happen in `WORKER_POOL`."""
+
+    def __init__(self, model_file_path, pool=WORKER_POOL):
+        self.model_file_path = model_file_path
+        self.pool = pool
+        inputs, outputs = pool.call(_describe, model_file_path)
+        self._inputs = [SimpleNamespace(name=n, shape=s, type=t) for n, s, t in inputs]
+        self._outputs = [SimpleNamespace(name=n, shape=s, type=t) for n, s, t in outputs]
+
+    def get_inputs(self):
+        return self._inputs
+
+    def get_outputs(self):
+        return self._outputs
+
+    def run(self, output_names, input_feed, run_options=None):
+        # The caller's run options hold no data a worker can use, workers have theirs.
+        return self.pool.call(_run, self.model_file_path, output_names, input_feed)
+
+    def run_many(self, output_names, input_feeds):
+        futures = [self.pool.submit(_run, self.model_file_path, output_names, f) for f in input_feeds]
+        return [f.result() for f in futures]
+
+
+def run_many(sess, output_names, input_feeds, run_options=None):
+    """Runs `sess` over every feed, concurrently when it is a `PooledSession`. Outputs come back in order."""
+    if isinstance(sess, PooledSession):
+        return sess.run_many(output_names, input_feeds)
+    return [sess.run(output_names, f, run_options) for f in input_feeds]
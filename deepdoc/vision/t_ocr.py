@@ -27,6 +27,7 @@ sys.path.insert(
 from deepdoc.vision.seeit import draw_box
 from deepdoc.vision import OCR, init_in_out
 import argparse
+import time
 import numpy as np
 import trio
 
@@ -35,6 +36,27 @@ os.environ['CUDA_VISIBLE_DEVICES'] = '0' #1 gpu
 # os.environ['CUDA_VISIBLE_DEVICES'] = '' #cpu
 
 
+def benchmark(ocr, images, batch_size):
+    images = [np.array(img) for img in images]
+    # Warm up the models
+    ocr(images[0])
+
+    st = time.perf_counter()
+    res0 = [ocr(img) for img in images]
+    el0 = time.perf_counter() - st
+    print(f"Page by page        : {len(images) / el0:.2f} pages/s")
+
+    st = time.perf_counter()
+    res1 = []
+    for i in range(0, len(images), batch_size):
+        res1.extend(ocr.ocr_batch(images[i: i + batch_size]))
+    el1 = time.perf_counter() - st
+    print(f"Batches of {batch_size:2d} pages : {len(images) / el1:.2f} pages/s")
+
+    diff = sum(int([t for _, (t, _) in a] != [t for _, (t, _) in b]) for a, b in zip(res0, res1))
+    print(f"Pages with different texts: {diff}")
+
+
 def main(args):
     import torch.cuda
 
@@ -42,6 +64,9 @@ def main(args):
     limiter = [trio.CapacityLimiter(1) for _ in range(cuda_devices)] if cuda_devices > 1 else None
     ocr = OCR()
     images, outputs = init_in_out(args)
+    if args.benchmark:
+        benchmark(ocr, images, args.batch_size)
+        return
 
     def __ocr(i, id, img):
         print("Task {} start".format(i))
@@ -89,5 +114,8 @@ if __name__ == "__main__":
                         required=True)
     parser.add_argument('--output_dir', help="Directory where to store the output images. Default: './ocr_outputs'",
                         default="./ocr_outputs")
+    parser.add_argument('--benchmark', action="store_true",
+                        help="Measure the throughput in pages/sec of page by page OCR against batched OCR, nothing is saved")
+    parser.add_argument('--batch_size', type=int, help="Pages per batch with --benchmark. Default: 8", default=8)
     args = parser.parse_args()
     main(args)
@@ -14,9 +14,9 @@
 #  limitations under the License.
 #
 import logging
-import itertools
 import os
 import re
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from typing import Any, Callable
 
@@ -35,6 +35,80 @@ DEFAULT_ENTITY_INDEX_DELIMITER = "<|>"
 DEFAULT_RESOLUTION_RESULT_DELIMITER = "&&"
 
 
+def _digit_2grams(s):
+    return frozenset(s[i:i + 2] for i in range(len(s) - 1) if any(c.isdigit() for c in s[i:i + 2]))
+
+
+def _min_overlap(n, english):
+    """Lower bound of the characters a name of n (distinct, unless english) characters
+    shares with any name `is_similarity` accepts with it."""
+    if english:
+        # editdistance(a, b) <= min(|a|, |b|) // 2 keeps at least max(|a|, |b|) - min(|a|, |b|) // 2 characters.
+        return n - n // 2
+    if n < 4:
+        return 2
+    return next(k for k in range(n + 1) if k * 1. / n >= 0.8)
+
+
+def _tokens(name, english):
+    if english:
+        # Multiset of characters, the i-th occurrence of c being token (c, i).
+        return [(c, i) for c, cnt in Counter(name).items() for i in range(cnt)]
+    return list(set(name))
+
+
+def _prefix_tokens(name, english, rank):
+    toks = sorted(_tokens(name, english), key=lambda t: rank[t])
+    return toks[:len(toks) - _min_overlap(len(toks), english) + 1]
+
+
+def candidate_pairs(nodes, subgraph_nodes, is_similarity):
+    """Pairs of `nodes`, one of them at least in `subgraph_nodes`, accepted by `is_similarity`.
+
+    Same result and order as checking every combination, but only pairs that can pass the
+    rules are checked: names must have the same digit 2-grams, and must share a character
+    of their prefix filter, i.e. their rarest characters, since similar names share most
+    characters.
+    """
+    order = {n: i for i, n in enumerate(nodes)}
+    blocks = defaultdict(list)
+    for n in nodes:
+        blocks[_digit_2grams(n)].append(n)
+
+    pairs = set()
+    for names in blocks.values():
+        if len(names) < 2 or not any(n in subgraph_nodes for n in names):
+            continue
+        for english in [False, True]:
+            members = [n for n in names if is_english(n)] if english else names
+            freq = Counter()
+            for n in members:
+                freq.update(_tokens(n, english))
+            # Rarest characters first, they make the shortest posting lists.
+            rank = {t: (c, t) for t, c in freq.items()}
+            index = defaultdict(list)
+            for n in members:
+                for t in _prefix_tokens(n, english, rank):
+                    index[t].append(n)
+            size = {n: len(n) if english else len(set(n)) for n in members}
+            for a in members:
+                if a not in subgraph_nodes:
+                    continue
+                for t in _prefix_tokens(a, english, rank):
+                    for b in index[t]:
+                        if a == b:
+                            continue
+                        # Length filter: edits can't be fewer than the length difference, and
+                        # the smaller character set must be able to hold the required overlap.
+                        lo, hi = sorted([size[a], size[b]])
+                        if english and hi - lo > lo // 2:
+                            continue
+                        if not english and lo < _min_overlap(hi, False):
+                            continue
+                        pairs.add((a, b) if order[a] < order[b] else (b, a))
+    return sorted([p for p in pairs if is_similarity(*p)], key=lambda p: (order[p[0]], order[p[1]]))
+
+
 @dataclass
 class EntityResolutionResult:
     """Entity resolution result class definition."""
@@ -92,7 +166,7 @@ class EntityResolution(Extractor):
 
         candidate_resolution = {entity_type: [] for entity_type in entity_types}
         for k, v in node_clusters.items():
-            candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if (a in subgraph_nodes or b in subgraph_nodes) and self.is_similarity(a, b)]
+            candidate_resolution[k] = candidate_pairs(v, subgraph_nodes, self.is_similarity)
         num_candidates = sum([len(candidates) for _, candidates in candidate_resolution.items()])
         callback(msg=f"Identified {num_candidates} candidate pairs")
         remain_candidates_to_resolve = num_candidates
@@ -220,7 +294,11 @@ class EntityResolution(Extractor):
 
         return ans_list
 
-    def _has_digit_in_2gram_diff(self, a, b):
+    @staticmethod
+    def _has_digit_in_2gram_diff(a, b):
+        if not any(c.isdigit() for c in a) and not any(c.isdigit() for c in b):
+            return False
+
         def to_2gram_set(s):
             return {s[i:i+2] for i in range(len(s) - 1)}
 
@@ -230,8 +308,9 @@ class EntityResolution(Extractor):
 
         return any(any(c.isdigit() for c in pair) for pair in diff)
 
-    def is_similarity(self, a, b):
-        if self._has_digit_in_2gram_diff(a, b):
+    @staticmethod
+    def is_similarity(a, b):
+        if EntityResolution._has_digit_in_2gram_diff(a, b):
             return False
 
         if is_english(a) and is_english(b):
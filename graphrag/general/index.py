@@ -31,6 +31,10 @@ from graphrag.general.extractor import Extractor
 from graphrag.utils import (
     graph_merge,
     get_graph,
+    get_graph_neighbourhood,
+    repair_graph,
+    set_local_pagerank,
+    set_pagerank,
     set_graph,
     chunk_id,
     does_graph_contains,
@@ -84,6 +88,8 @@ async def run_graphrag(
     callback(msg=f"run_graphrag {doc_id} graphrag_task_lock acquired")
 
     try:
+        # Not under merge_subgraph's timeout: migrating a large graph takes a while, once.
+        await repair_graph(tenant_id, kb_id, embedding_model, callback)
         subgraph_nodes = set(subgraph.nodes())
         new_graph = await merge_subgraph(
             tenant_id,
@@ -92,6 +98,7 @@ async def run_graphrag(
             subgraph,
             embedding_model,
             callback,
+            whole_graph=with_resolution or with_community,
         )
         assert new_graph is not None
 
@@ -210,21 +217,32 @@ async def merge_subgraph(
     subgraph: nx.Graph,
     embedding_model,
     callback,
+    whole_graph: bool = False,
 ):
+    """Merges the subgraph into the stored graph. Unless `whole_graph` is set, for resolution or
+    community extraction, only the neighbourhood of the subgraph is loaded and returned."""
     start = trio.current_time()
     change = GraphChange()
-    old_graph = await get_graph(tenant_id, kb_id, subgraph.graph["source_id"])
+    if whole_graph:
+        old_graph = await get_graph(tenant_id, kb_id)
+    else:
+        old_graph = await get_graph_neighbourhood(tenant_id, kb_id, set(subgraph.nodes()))
+    degrees = {}
     if old_graph is not None:
         logging.info("Merge with an exiting graph...................")
         tidy_graph(old_graph, callback)
+        # graph_merge sets the degrees within the loaded graph, the stored ones are needed for PageRank.
+        degrees = {n: attr.get("rank", 0) for n, attr in old_graph.nodes(data=True)}
         new_graph = graph_merge(old_graph, subgraph, change)
     else:
         new_graph = subgraph
         change.added_updated_nodes = set(new_graph.nodes())
         change.added_updated_edges = set(new_graph.edges())
-    pr = nx.pagerank(new_graph)
-    for node_name, pagerank in pr.items():
-        new_graph.nodes[node_name]["pagerank"] = pagerank
+    if whole_graph:
+        set_pagerank(new_graph)
+    else:
+        # Only the neighbourhood is loaded: its nodes get a PageRank comparable with the stored ones.
+        await set_local_pagerank(tenant_id, kb_id, new_graph, change.added_updated_nodes, degrees)
 
     await set_graph(tenant_id, kb_id, embedding_model, new_graph, change, callback)
     now = trio.current_time()
@@ -79,7 +79,7 @@ class KGSearch(Dealer):
             res[ent["entity_kwd"]] = {
                 "sim": get_float(ent.get("_score", 0)),
                 "pagerank": get_float(ent.get("rank_flt", 0)),
-                "n_hop_ents": json.loads(ent.get("n_hop_with_weight", "[]")),
+                "n_hop_ents": json.loads(ent.get("n_hop_with_weight") or "[]"),
                 "description": ent.get("content_with_weight", "{}")
             }
         return res
@@ -137,6 +137,27 @@ class KGSearch(Dealer):
                                        idxnms, kb_ids)
         return self._ent_info_from_(es_res, 0)
 
+    def get_neighbours_of_ents(self, ents, filters, idxnms, kb_ids, N=56):
+        """1-hop paths of the entities, loaded from the relation records touching them."""
+        nhops = defaultdict(list)
+        if not ents:
+            return nhops
+        flds = ["from_entity_kwd", "to_entity_kwd", "weight_int"]
+        ordr = OrderByExpr()
+        ordr.desc("weight_int")
+        for fld in ["from_entity_kwd", "to_entity_kwd"]:
+            fltr = deepcopy(filters)
+            fltr["knowledge_graph_kwd"] = "relation"
+            fltr[fld] = list(ents)
+            es_res = self.dataStore.search(flds, [], fltr, [], ordr, 0, N, idxnms, kb_ids)
+            for _, rel in self.dataStore.getFields(es_res, flds).items():
+                f, t = rel["from_entity_kwd"], rel["to_entity_kwd"]
+                f = f[0] if isinstance(f, list) else f
+                t = t[0] if isinstance(t, list) else t
+                ent, nbr = (f, t) if fld == "from_entity_kwd" else (t, f)
+                nhops[ent].append({"path": [ent, nbr], "weights": [get_float(rel.get("weight_int", 0))]})
+        return nhops
+
     def retrieval(self, question: str,
                tenant_ids: str | list[str],
                kb_ids: list[str],
@@ -167,6 +188,10 @@ class KGSearch(Dealer):
         ents_from_query = self.get_relevant_ents_by_keywords(ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
         ents_from_types = self.get_relevant_ents_by_types(ty_kwds, filters, idxnms, kb_ids, 10000)
         rels_from_txt = self.get_relevant_relations_by_txt(qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+        # Entities indexed without their n-hop paths get their neighbourhood loaded here.
+        missing = [n for n, ent in ents_from_query.items() if not ent.get("n_hop_ents")]
+        for n, nhops in self.get_neighbours_of_ents(missing, filters, idxnms, kb_ids).items():
+            ents_from_query[n]["n_hop_ents"] = nhops
         nhop_pathes = defaultdict(dict)
         for _, ent in ents_from_query.items():
             nhops = ent.get("n_hop_ents", [])
@@ -6,6 +6,7 @@ Reference:
  - [LightRag](https://github.com/HKUDS/LightRAG)
 """
 
+import heapq
 import html
 import json
 import logging
@@ -28,6 +29,7 @@ from api import settings
 from api.utils import get_uuid
 from rag.nlp import search, rag_tokenizer
 from rag.utils.doc_store_conn import OrderByExpr
+from rag.utils.embedding_cache import EMBD_CACHE
 from rag.utils.redis_conn import REDIS_CONN
 
 GRAPH_FIELD_SEP = "<SEP>"
@@ -35,6 +37,13 @@ GRAPH_FIELD_SEP = "<SEP>"
 ErrorHandlerFn = Callable[[BaseException | None, str | None, dict | None], None]
 
 chat_limiter = trio.CapacityLimiter(int(os.environ.get('MAX_CONCURRENT_CHATS', 10)))
+GRAPH_BULK_MAX_BYTES = int(os.environ.get('GRAPH_BULK_MAX_BYTES', 8 * 1024 * 1024))
+GRAPH_BULK_MAX_DOCS = int(os.environ.get('GRAPH_BULK_MAX_DOCS', 512))
+GRAPH_DELETE_BATCH = int(os.environ.get('GRAPH_DELETE_BATCH', 1024))
+GRAPH_LOAD_BATCH = int(os.environ.get('GRAPH_LOAD_BATCH', 256))
+GRAPH_LOAD_PAGE = 1024
+# What the knowledge graph endpoints show.
+GRAPH_PREVIEW_NODES = 256
 
 @dataclasses.dataclass
 class GraphChange:
@@ -118,25 +127,11 @@ def set_llm_cache(llmnm, txt, v, history, genconf):
 
 
 def get_embed_cache(llmnm, txt):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
-    if not bin:
-        return
-    return np.array(json.loads(bin))
+    return EMBD_CACHE.get(llmnm, txt)
 
 
 def set_embed_cache(llmnm, txt, arr):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-
-    k = hasher.hexdigest()
-    arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24*3600)
+    EMBD_CACHE.set(llmnm, txt, arr)
 
 
 def get_tags_from_cache(kb_ids):
@@ -305,11 +300,16 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
+def graph_record_id(kb_id, kind, *names):
+    # One record per entity or relation: writing it again replaces it.
+    return xxhash.xxh64(json.dumps([kb_id, kind, *names], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
 async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
     global chat_limiter
     enable_timeout_assertion=os.environ.get("ENABLE_TIMEOUT_ASSERTION")
     chunk = {
-        "id": get_uuid(),
+        "id": graph_record_id(kb_id, "entity", ent_name),
         "important_kwd": [ent_name],
         "title_tks": rag_tokenizer.tokenize(ent_name),
         "entity_kwd": ent_name,
@@ -318,6 +318,7 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "content_with_weight": json.dumps(meta, ensure_ascii=False),
         "content_ltks": rag_tokenizer.tokenize(meta["description"]),
         "source_id": meta["source_id"],
+        "rank_flt": meta.get("pagerank", 0),
         "kb_id": kb_id,
         "available_int": 0
     }
@@ -365,7 +366,7 @@ def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
 async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
     enable_timeout_assertion=os.environ.get("ENABLE_TIMEOUT_ASSERTION")
     chunk = {
-        "id": get_uuid(),
+        "id": graph_record_id(kb_id, "relation", *get_from_to(from_ent_name, to_ent_name)),
         "from_entity_kwd": from_ent_name,
         "to_entity_kwd": to_ent_name,
         "knowledge_graph_kwd": "relation",
@@ -422,78 +423,255 @@ async def get_graph_doc_ids(tenant_id, kb_id) -> list[str]:
     return doc_ids
 
 
-async def get_graph(tenant_id, kb_id, exclude_rebuild=None):
+async def get_graph_manifest(tenant_id, kb_id) -> dict | None:
+    """
+    The "graph" chunk: documents the graph is built from and a preview of its top nodes. It is
+    `legacy` when written before the records held the graph, its "preview" being the whole graph.
+    """
     conds = {
         "fields": ["content_with_weight", "removed_kwd", "source_id"],
         "size": 1,
         "knowledge_graph_kwd": ["graph"]
     }
     res = await trio.to_thread.run_sync(lambda: settings.retrievaler.search(conds, search.index_name(tenant_id), [kb_id]))
-    if not res.total == 0:
-        for id in res.ids:
-            try:
-                if res.field[id]["removed_kwd"] == "N":
-                    g = json_graph.node_link_graph(json.loads(res.field[id]["content_with_weight"]), edges="edges")
-                    if "source_id" not in g.graph:
-                        g.graph["source_id"] = res.field[id]["source_id"]
-                else:
-                    g = await rebuild_graph(tenant_id, kb_id, exclude_rebuild)
-                return g
-            except Exception:
-                continue
-    result = None
-    return result
+    for id in res.ids:
+        try:
+            preview = json_graph.node_link_graph(json.loads(res.field[id]["content_with_weight"]), edges="edges")
+        except Exception:
+            preview = None
+        return {"source_id": res.field[id].get("source_id") or [], "removed_kwd": res.field[id].get("removed_kwd"), "preview": preview,
+                "legacy": preview is not None and not preview.graph.get("records")}
+    return None
 
 
-async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, change: GraphChange, callback):
-    global chat_limiter
-    start = trio.current_time()
+async def iter_graph_records(tenant_id, kb_id, condition: dict, fields: list[str]):
+    # Scans rather than pages with offsets: a graph easily has more records than index.max_result_window.
+    pages = settings.docStoreConn.scan(fields, dict(condition), search.index_name(tenant_id), [kb_id], GRAPH_LOAD_PAGE)
+    try:
+        while True:
+            es_res = await trio.to_thread.run_sync(next, pages, None)
+            if es_res is None:
+                break
+            for d in settings.docStoreConn.getFields(es_res, fields).values():
+                yield d
+    finally:
+        await trio.to_thread.run_sync(pages.close)
 
-    await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "subgraph"]}, search.index_name(tenant_id), kb_id))
 
-    if change.removed_nodes:
-        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(change.removed_nodes)}, search.index_name(tenant_id), kb_id))
+def _record_attrs(d: dict) -> dict | None:
+    try:
+        attrs = json.loads(d["content_with_weight"])
+    except Exception:
+        return None
+    # Documents removed from the knowledge base are only taken out of the record's source_id field.
+    source_id = d.get("source_id")
+    attrs["source_id"] = [source_id] if isinstance(source_id, str) else list(source_id or [])
+    return attrs
 
 
-    if change.removed_edges:
-        async def del_edges(from_node, to_node):
-            async with chat_limiter:
-                await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["relation"], "from_entity_kwd": from_node, "to_entity_kwd": to_node}, search.index_name(tenant_id), kb_id))
-        async with trio.open_nursery() as nursery:
-            for from_node, to_node in change.removed_edges:
-                 nursery.start_soon(del_edges, from_node, to_node)
+def _kwd(v):
+    return v[0] if isinstance(v, list) else v
 
-    now = trio.current_time()
-    if callback:
-        callback(msg=f"set_graph removed {len(change.removed_nodes)} nodes and {len(change.removed_edges)} edges from index in {now - start:.2f}s.")
-    start = now
 
-    chunks = [{
-        "id": get_uuid(),
-        "content_with_weight": json.dumps(nx.node_link_data(graph, edges="edges"), ensure_ascii=False),
-        "knowledge_graph_kwd": "graph",
-        "kb_id": kb_id,
-        "source_id": graph.graph.get("source_id", []),
-        "available_int": 0,
-        "removed_kwd": "N"
-    }]
-    
-    # generate updated subgraphs
-    for source in graph.graph["source_id"]:
-        subgraph = graph.subgraph([n for n in graph.nodes if source in graph.nodes[n]["source_id"]]).copy()
-        subgraph.graph["source_id"] = [source]
-        for n in subgraph.nodes:
-            subgraph.nodes[n]["source_id"] = [source]
-        chunks.append({
-            "id": get_uuid(),
-            "content_with_weight": json.dumps(nx.node_link_data(subgraph, edges="edges"), ensure_ascii=False),
-            "knowledge_graph_kwd": "subgraph",
-            "kb_id": kb_id,
-            "source_id": [source],
-            "available_int": 0,
-            "removed_kwd": "N"
-        })
+async def get_entities(tenant_id, kb_id, names=None) -> dict[str, dict]:
+    """Node attributes of the given entities, of all of them if `names` is None."""
+    fields = ["entity_kwd", "content_with_weight", "source_id"]
+    ents = {}
+    if names is None:
+        conditions = [{"knowledge_graph_kwd": ["entity"]}]
+    else:
+        names = sorted(names)
+        conditions = [{"knowledge_graph_kwd": ["entity"], "entity_kwd": names[b:b + GRAPH_LOAD_BATCH]} for b in range(0, len(names), GRAPH_LOAD_BATCH)]
+    for condition in conditions:
+        async for d in iter_graph_records(tenant_id, kb_id, condition, fields):
+            attrs = _record_attrs(d)
+            if attrs is not None:
+                ents[_kwd(d["entity_kwd"])] = attrs
+    return ents
+
+
+async def get_relations(tenant_id, kb_id, names=None) -> dict[tuple[str, str], dict]:
+    """Edge attributes of the relations touching the given entities, of all of them if `names` is None."""
+    fields = ["from_entity_kwd", "to_entity_kwd", "content_with_weight", "source_id"]
+    rels = {}
+    if names is None:
+        conditions = [{"knowledge_graph_kwd": ["relation"]}]
+    else:
+        names = sorted(names)
+        conditions = [{"knowledge_graph_kwd": ["relation"], fld: names[b:b + GRAPH_LOAD_BATCH]}
+                      for fld in ["from_entity_kwd", "to_entity_kwd"] for b in range(0, len(names), GRAPH_LOAD_BATCH)]
+    for condition in conditions:
+        async for d in iter_graph_records(tenant_id, kb_id, condition, fields):
+            attrs = _record_attrs(d)
+            if attrs is not None:
+                rels[get_from_to(_kwd(d["from_entity_kwd"]), _kwd(d["to_entity_kwd"]))] = attrs
+    return rels
+
+
+def _records_to_graph(ents: dict, rels: dict, source_id: list) -> nx.Graph:
+    graph = nx.Graph()
+    for name, attrs in ents.items():
+        graph.add_node(name, **attrs)
+    for (from_node, to_node), attrs in rels.items():
+        if from_node in ents and to_node in ents:
+            graph.add_edge(from_node, to_node, **attrs)
+    graph.graph["source_id"] = list(source_id)
+    return graph
+
+
+async def get_graph(tenant_id, kb_id) -> nx.Graph | None:
+    """Loads the whole graph from its entity and relation records."""
+    manifest = await get_graph_manifest(tenant_id, kb_id)
+    ents = await get_entities(tenant_id, kb_id)
+    if not ents:
+        return None
+    rels = await get_relations(tenant_id, kb_id)
+    return _records_to_graph(ents, rels, manifest["source_id"] if manifest else [])
+
+
+async def get_graph_neighbourhood(tenant_id, kb_id, names) -> nx.Graph | None:
+    """Loads the given entities, their relations and their neighbours, enough to merge a subgraph of `names` in."""
+    manifest = await get_graph_manifest(tenant_id, kb_id)
+    ents = await get_entities(tenant_id, kb_id, names)
+    if not ents:
+        return None
+    rels = await get_relations(tenant_id, kb_id, ents.keys())
+    neighbours = {n for edge in rels for n in edge} - ents.keys()
+    if neighbours:
+        ents.update(await get_entities(tenant_id, kb_id, neighbours))
+    return _records_to_graph(ents, rels, manifest["source_id"] if manifest else [])
+
+
+async def get_entity_count(tenant_id, kb_id) -> int:
+    es_res = await trio.to_thread.run_sync(lambda: settings.docStoreConn.search(["entity_kwd"], [], {"knowledge_graph_kwd": ["entity"]}, [], OrderByExpr(), 0, 1, search.index_name(tenant_id), [kb_id]))
+    return settings.docStoreConn.getTotal(es_res)
+
+
+async def set_local_pagerank(tenant_id, kb_id, graph: nx.Graph, nodes: set[str], degrees: dict[str, int], alpha=0.85, max_iter=50, tol=1e-9):
+    """
+    PageRank of `nodes` when `graph` is only a neighbourhood of the stored graph. The PageRank
+    iteration runs over `nodes` only, with the stored PageRank of their other neighbours, whose
+    edges haven't changed, held fixed. Those neighbours keep their stored `degrees`, their other
+    edges not being loaded. Edges count the same whatever their weight.
+    """
+    nodes = {n for n in nodes if graph.has_node(n)}
+    if not nodes:
+        return
+    n_total = max(await get_entity_count(tenant_id, kb_id), graph.number_of_nodes())
+    n_total += len([n for n in nodes if "pagerank" not in graph.nodes[n]])
+
+    def degree(n):
+        return graph.degree(n) if n in nodes else max(graph.degree(n), int(degrees.get(n) or 0))
+
+    pr = {n: graph.nodes[n].get("pagerank") or 1.0 / n_total for n in graph.nodes}
+    for _ in range(max_iter):
+        err = 0.0
+        for n in nodes:
+            v = (1.0 - alpha) / n_total + alpha * sum(pr[m] / max(degree(m), 1) for m in graph.neighbors(n))
+            err += abs(v - pr[n])
+            pr[n] = v
+        if err < tol * len(nodes):
+            break
+    for n in nodes:
+        graph.nodes[n]["pagerank"] = pr[n]
+
+
+def graph_preview(preview: nx.Graph | None, graph: nx.Graph, change: GraphChange) -> nx.Graph:
+    """Applies the change to the preview kept in the "graph" chunk and keeps its GRAPH_PREVIEW_NODES top nodes."""
+    g = preview.copy() if preview is not None else nx.Graph()
+    g.remove_nodes_from([n for n in change.removed_nodes if g.has_node(n)])
+    g.remove_edges_from([e for e in change.removed_edges if g.has_edge(*e)])
+    for node in change.added_updated_nodes:
+        if graph.has_node(node):
+            g.add_node(node, **graph.nodes[node])
+    for from_node, to_node in change.added_updated_edges:
+        if graph.has_edge(from_node, to_node) and g.has_node(from_node) and g.has_node(to_node):
+            g.add_edge(from_node, to_node, **graph.get_edge_data(from_node, to_node))
+    nodes = sorted(g.nodes, key=lambda n: g.nodes[n].get("pagerank", 0), reverse=True)[:GRAPH_PREVIEW_NODES]
+    g = g.subgraph(nodes).copy()
+    g.graph = {"source_id": graph.graph.get("source_id", []), "records": True}
+    return g
+
+
+def group_removed_edges(edges, batch_size=GRAPH_DELETE_BATCH):
+    """Covers the edges with (node, [neighbors]) stars, busiest nodes first, so that
+    the edges of a merged away node go in one or two deletes. Yields delete conditions."""
+    by_node = defaultdict(set)
+    for from_node, to_node in edges:
+        by_node[from_node].add((from_node, to_node))
+        by_node[to_node].add((from_node, to_node))
+    heap = [(-len(es), node) for node, es in by_node.items()]
+    heapq.heapify(heap)
+    while heap:
+        deg, node = heapq.heappop(heap)
+        star = by_node[node]
+        if not star:
+            continue
+        if len(star) != -deg:
+            heapq.heappush(heap, (-len(star), node))
+            continue
+        by_node[node] = set()
+        for from_node, to_node in star:
+            by_node[to_node if from_node == node else from_node].discard((from_node, to_node))
+        tos = sorted(t for f, t in star if f == node)
+        froms = sorted(f for f, t in star if t == node and f != node)
+        for b in range(0, len(tos), batch_size):
+            yield {"knowledge_graph_kwd": ["relation"], "from_entity_kwd": node, "to_entity_kwd": tos[b:b + batch_size]}
+        for b in range(0, len(froms), batch_size):
+            yield {"knowledge_graph_kwd": ["relation"], "from_entity_kwd": froms[b:b + batch_size], "to_entity_kwd": node}
+
+
+def chunk_nbytes(chunk: dict) -> int:
+    # Rough size of the chunk once serialized, vectors included.
+    n = 0
+    for k, v in chunk.items():
+        n += len(k) + 4
+        if isinstance(v, str):
+            n += len(v.encode("utf-8"))
+        elif isinstance(v, (list, tuple, np.ndarray)):
+            n += sum(len(str(x)) + 1 for x in v) if len(v) and isinstance(v[0], str) else 20 * len(v)
+        else:
+            n += 20
+    return n
 
+
+async def bulk_insert_chunks(tenant_id: str, kb_id: str, chunks, callback=None) -> int:
+    """Inserts the chunks in batches bounded by GRAPH_BULK_MAX_BYTES and GRAPH_BULK_MAX_DOCS.
+    `chunks` may be any iterable, it's consumed one batch ahead of the doc store."""
+    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+    inserted = 0
+
+    async def insert(batch):
+        nonlocal inserted
+        with trio.fail_after(3 if enable_timeout_assertion else 30000000):
+            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(batch, search.index_name(tenant_id), kb_id))
+        if doc_store_result:
+            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+            raise Exception(error_message)
+        inserted += len(batch)
+        if callback:
+            callback(msg=f"Insert chunks: {inserted}")
+
+    batch, nbytes = [], 0
+    for ck in chunks:
+        sz = chunk_nbytes(ck)
+        if batch and (nbytes + sz > GRAPH_BULK_MAX_BYTES or len(batch) >= GRAPH_BULK_MAX_DOCS):
+            await insert(batch)
+            batch, nbytes = [], 0
+        batch.append(ck)
+        nbytes += sz
+    if batch:
+        await insert(batch)
+    return inserted
+
+
+async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, change: GraphChange, callback, replace_all: bool = False):
+    """Applies the change to the entity and relation records. `graph` only needs to hold the changed nodes and edges.
+    With `replace_all`, all the records are dropped first and the change must add the whole graph."""
+    global chat_limiter
+    start = trio.current_time()
+
+    chunks = []
     async with trio.open_nursery() as nursery:
         for ii, node in enumerate(change.added_updated_nodes):
             node_attrs = graph.nodes[node]
@@ -513,22 +691,126 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
 
     now = trio.current_time()
     if callback:
-        callback(msg=f"set_graph converted graph change to {len(chunks)} chunks in {now - start:.2f}s.")
+        callback(msg=f"set_graph converted graph change to {len(chunks)} entity/relation chunks in {now - start:.2f}s.")
     start = now
 
-    enable_timeout_assertion=os.environ.get("ENABLE_TIMEOUT_ASSERTION")
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        with trio.fail_after(3 if enable_timeout_assertion else 30000000):
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(tenant_id), kb_id))
-        if b % 100 == es_bulk_size and callback:
-            callback(msg=f"Insert chunks: {b}/{len(chunks)}")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            raise Exception(error_message)
+    manifest = None if replace_all else await get_graph_manifest(tenant_id, kb_id)
+    await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph"] + (["entity", "relation"] if replace_all else [])}, search.index_name(tenant_id), kb_id))
+
+    # The records of updated nodes and edges are replaced as well.
+    stale_nodes = [] if replace_all else sorted(change.removed_nodes | change.added_updated_nodes)
+    for b in range(0, len(stale_nodes), GRAPH_DELETE_BATCH):
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["entity"], "entity_kwd": stale_nodes[b:b + GRAPH_DELETE_BATCH]}, search.index_name(tenant_id), kb_id))
+
+    # Relations may have been stored either way round.
+    stale_edges = {e for from_node, to_node in change.removed_edges | change.added_updated_edges for e in [(from_node, to_node), (to_node, from_node)]}
+    if stale_edges and not replace_all:
+        async def del_edges(condition):
+            async with chat_limiter:
+                await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete(condition, search.index_name(tenant_id), kb_id))
+        async with trio.open_nursery() as nursery:
+            for condition in group_removed_edges(stale_edges):
+                nursery.start_soon(del_edges, condition)
+
+    now = trio.current_time()
+    if callback:
+        callback(msg=f"set_graph removed {len(change.removed_nodes)} nodes and {len(change.removed_edges)} edges from index in {now - start:.2f}s.")
+    start = now
+
+    preview = graph_preview(manifest["preview"] if manifest else None, graph, change)
+    graph_chunk = {
+        "id": get_uuid(),
+        "content_with_weight": json.dumps(nx.node_link_data(preview, edges="edges"), ensure_ascii=False),
+        "knowledge_graph_kwd": "graph",
+        "kb_id": kb_id,
+        "source_id": graph.graph.get("source_id", []),
+        "available_int": 0,
+        "removed_kwd": "N"
+    }
+    inserted = await bulk_insert_chunks(tenant_id, kb_id, [graph_chunk] + chunks, callback)
     now = trio.current_time()
     if callback:
-        callback(msg=f"set_graph added/updated {len(change.added_updated_nodes)} nodes and {len(change.added_updated_edges)} edges from index in {now - start:.2f}s.")
+        callback(msg=f"set_graph added/updated {len(change.added_updated_nodes)} nodes and {len(change.added_updated_edges)} edges ({inserted} chunks) from index in {now - start:.2f}s.")
+
+
+async def rebuild_graph(tenant_id, kb_id) -> nx.Graph | None:
+    """Merges the subgraphs of the documents of the knowledge base, as merge_subgraph did one by one."""
+    subgraphs = []
+    async for d in iter_graph_records(tenant_id, kb_id, {"knowledge_graph_kwd": ["subgraph"]}, ["content_with_weight", "source_id"]):
+        try:
+            subgraphs.append(json_graph.node_link_graph(json.loads(d["content_with_weight"]), edges="edges"))
+        except Exception:
+            logging.exception("rebuild_graph got an unreadable subgraph")
+    graph = None
+    # In document order, whatever the order of the scan.
+    for subgraph in sorted(subgraphs, key=lambda g: g.graph.get("source_id", [])):
+        graph = graph_merge(graph, subgraph, GraphChange()) if graph is not None else subgraph
+    if graph is not None:
+        graph.graph["source_id"] = sorted(graph.graph.get("source_id", []))
+    return graph
+
+
+async def get_stripped_records(tenant_id, kb_id) -> tuple[set[str], set[tuple[str, str]]]:
+    """Entities and relations a removed document was stripped from: their attributes still hold what it brought."""
+    fields = ["knowledge_graph_kwd", "entity_kwd", "from_entity_kwd", "to_entity_kwd", "content_with_weight", "source_id"]
+    nodes, edges = set(), set()
+    async for d in iter_graph_records(tenant_id, kb_id, {"knowledge_graph_kwd": ["entity", "relation"]}, fields):
+        try:
+            sources = set(json.loads(d["content_with_weight"]).get("source_id") or [])
+        except Exception:
+            continue
+        if not sources - set(_record_attrs(d)["source_id"]):
+            continue
+        if _kwd(d.get("knowledge_graph_kwd")) == "entity":
+            nodes.add(_kwd(d["entity_kwd"]))
+        else:
+            edges.add(get_from_to(_kwd(d["from_entity_kwd"]), _kwd(d["to_entity_kwd"])))
+    return nodes, edges
+
+
+def set_pagerank(graph: nx.Graph):
+    for node_name, pagerank in nx.pagerank(graph).items():
+        graph.nodes[node_name]["pagerank"] = pagerank
+
+
+async def repair_graph(tenant_id: str, kb_id: str, embd_mdl, callback):
+    """
+    Brings the records in line with the "graph" chunk before a merge reads them.
+
+    A graph stored before the records held it is migrated once: its records, of which
+    updated entities and relations have several, are replaced by one record each, from the
+    whole graph of the "graph" chunk. Removing a document only strips it from the records
+    and marks the "graph" chunk removed: the entities and relations it was stripped from
+    are then recomputed from the subgraphs of the remaining documents. Entity resolution
+    and community reports over them aren't redone, as before.
+    """
+    manifest = await get_graph_manifest(tenant_id, kb_id)
+    if manifest is None or (not manifest["legacy"] and manifest["removed_kwd"] != "Y"):
+        return
+    start = trio.current_time()
+    graph = await rebuild_graph(tenant_id, kb_id) if manifest["removed_kwd"] == "Y" else manifest["preview"]
+    if graph is None:
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "entity", "relation"]}, search.index_name(tenant_id), kb_id))
+        callback(msg="repair_graph removed the graph, none of its documents is left.")
+        return
+    if not graph.graph.get("source_id"):
+        graph.graph["source_id"] = manifest["source_id"]
+    set_pagerank(graph)
+
+    change = GraphChange()
+    if manifest["legacy"]:
+        change.added_updated_nodes = set(graph.nodes())
+        change.added_updated_edges = {get_from_to(f, t) for f, t in graph.edges()}
+        await set_graph(tenant_id, kb_id, embd_mdl, graph, change, callback, replace_all=True)
+        callback(msg=f"repair_graph migrated the graph to {len(change.added_updated_nodes)} entity and {len(change.added_updated_edges)} relation records in {trio.current_time() - start:.2f}s.")
+        return
+    nodes, edges = await get_stripped_records(tenant_id, kb_id)
+    change.added_updated_nodes = {n for n in nodes if graph.has_node(n)}
+    change.removed_nodes = nodes - change.added_updated_nodes
+    change.added_updated_edges = {e for e in edges if graph.has_edge(*e)}
+    change.removed_edges = edges - change.added_updated_edges
+    await set_graph(tenant_id, kb_id, embd_mdl, graph, change, callback)
+    callback(msg=f"repair_graph recomputed {len(nodes)} entities and {len(edges)} relations of removed documents in {trio.current_time() - start:.2f}s.")
 
 
 def is_continuous_subsequence(subseq, seq):
@@ -603,47 +885,3 @@ def flat_uniq_list(arr, key):
         else:
             res.append(a)
     return list(set(res))
-
-
-async def rebuild_graph(tenant_id, kb_id, exclude_rebuild=None):
-    graph = nx.Graph()
-    flds = ["knowledge_graph_kwd", "content_with_weight", "source_id"]
-    bs = 256
-    for i in range(0, 1024*bs, bs):
-        es_res = await trio.to_thread.run_sync(lambda: settings.docStoreConn.search(flds, [],
-                                 {"kb_id": kb_id, "knowledge_graph_kwd": ["subgraph"]},
-                                 [],
-                                 OrderByExpr(),
-                                 i, bs, search.index_name(tenant_id), [kb_id]
-                                 ))
-        # tot = settings.docStoreConn.getTotal(es_res)
-        es_res = settings.docStoreConn.getFields(es_res, flds)
-
-        if len(es_res) == 0:
-            break
-
-        for id, d in es_res.items():
-            assert d["knowledge_graph_kwd"] == "subgraph"
-            if isinstance(exclude_rebuild, list):
-                if sum([n in d["source_id"] for n in exclude_rebuild]):
-                    continue
-            elif exclude_rebuild in d["source_id"]:
-                continue
-            
-            next_graph = json_graph.node_link_graph(json.loads(d["content_with_weight"]), edges="edges")
-            merged_graph = nx.compose(graph, next_graph)
-            merged_source = {
-                n: graph.nodes[n]["source_id"] + next_graph.nodes[n]["source_id"]
-                for n in graph.nodes & next_graph.nodes
-            }
-            nx.set_node_attributes(merged_graph, merged_source, "source_id")
-            if "source_id" in graph.graph:
-                merged_graph.graph["source_id"] = graph.graph["source_id"] + next_graph.graph["source_id"]
-            else:
-                merged_graph.graph["source_id"] = next_graph.graph["source_id"]
-            graph = merged_graph
-
-    if len(graph.nodes) == 0:
-        return None
-    graph.graph["source_id"] = sorted(graph.graph["source_id"])
-    return graph
@@ -0,0 +1,106 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+CPU-only benchmark of the local reranker: fixed batches of 8 pairs against the
+adaptive batching of `DefaultRerank._process_batch`, then a repeated query
+served from the score cache.
+
+    python rag/llm/rerank_benchmark.py --model BAAI/bge-reranker-v2-m3 --pairs 256 --corpus /path/to/txt_dir
+"""
+import os
+import sys
+
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from rag.llm import rerank_model
+from rag.llm.rerank_model import DefaultRerank
+
+
+def load_texts(paths, n, seed):
+    random.seed(seed)
+    texts = []
+    for p in paths:
+        fnms = [os.path.join(p, f) for f in sorted(os.listdir(p))] if os.path.isdir(p) else [p]
+        for fnm in fnms:
+            with open(fnm, "r", encoding="utf-8", errors="ignore") as f:
+                txt = f.read()
+            i = 0
+            while i < len(txt):
+                size = random.randint(64, 2048)
+                texts.append(txt[i: i + size])
+                i += size
+    if not texts:
+        words = "the of retrieval augmented generation chunk document knowledge graph reranker query answer model".split()
+        texts = [" ".join(random.choices(words, k=random.randint(16, 400))) for _ in range(n)]
+    return random.sample(texts, min(n, len(texts)))
+
+
+def fixed_batches(mdl, query, texts, batch_size=8):
+    pairs = [(query, t) for t in texts]
+    return np.concatenate([np.array(mdl._compute_batch_scores(pairs[i: i + batch_size]), dtype=float)
+                           for i in range(0, len(pairs), batch_size)])
+
+
+def main(args):
+    mdl = DefaultRerank(None, args.model)
+    texts = load_texts(args.corpus, args.pairs, args.seed)
+    query = args.query
+    print(f"{len(texts)} pairs, {sum(len(t) for t in texts)} characters")
+
+    # Warm up the model
+    mdl._compute_batch_scores([(query, texts[0])])
+
+    st = time.perf_counter()
+    legacy = fixed_batches(mdl, query, texts)
+    el0 = time.perf_counter() - st
+    print(f"Fixed batches of 8: {el0:.3f}s, {len(texts) / el0:.1f} pairs/s")
+
+    rerank_model._rerank_score_cache.clear()
+    st = time.perf_counter()
+    adaptive, _ = mdl.similarity(query, texts)
+    el1 = time.perf_counter() - st
+    print(f"Adaptive batches  : {el1:.3f}s, {len(texts) / el1:.1f} pairs/s, max abs diff {np.max(np.abs(legacy - adaptive)):.2e}")
+    for s in mdl.batch_stats:
+        print(f"    {s['pairs']:5d} pairs {s['padded_tokens']:7d} padded tokens {s['seconds']:.3f}s")
+    print(f"Batch budget is now {DefaultRerank._batch_tokens} padded tokens")
+
+    st = time.perf_counter()
+    mdl.similarity(query, texts)
+    el2 = time.perf_counter() - st
+    print(f"Repeated query    : {el2:.3f}s from the score cache")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help="local reranker", default="BAAI/bge-reranker-v2-m3")
+    parser.add_argument('--corpus', nargs="*", help="text files or directories of text files", default=[])
+    parser.add_argument('--pairs', type=int, help="number of (query, text) pairs", default=256)
+    parser.add_argument('--query', default="What is retrieval augmented generation?")
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
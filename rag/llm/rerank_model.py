@@ -14,9 +14,11 @@
 #  limitations under the License.
 #
 import json
+import logging
 import os
 import re
 import threading
+import time
 from abc import ABC
 from collections.abc import Iterable
 from urllib.parse import urljoin
@@ -24,6 +26,8 @@ from urllib.parse import urljoin
 import httpx
 import numpy as np
 import requests
+import xxhash
+from cachetools import LRUCache
 from huggingface_hub import snapshot_download
 from yarl import URL
 
@@ -32,6 +36,20 @@ from api.utils.file_utils import get_home_cache_dir
 from api.utils.log_utils import log_exception
 from rag.utils import num_tokens_from_string, truncate
 
+RERANK_BATCH_TOKENS = int(os.environ.get("RERANK_BATCH_TOKENS", 8192))
+RERANK_MIN_BATCH_TOKENS = 512
+RERANK_MAX_BATCH_TOKENS = int(os.environ.get("RERANK_MAX_BATCH_TOKENS", 131072))
+RERANK_BATCH_SECONDS = float(os.environ.get("RERANK_BATCH_SECONDS", 1.0))
+
+# Scores of local rerankers for (model, query, text), retrievals of the same question re-score the same chunks.
+_rerank_score_cache = LRUCache(maxsize=int(os.environ.get("RERANK_CACHE_SIZE", 65536)))
+_rerank_score_lock = threading.Lock()
+
+
+def _rerank_score_key(model_name, query, text):
+    return xxhash.xxh64(f"{model_name}\0{query}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
 class Base(ABC):
     def __init__(self, key, model_name, **kwargs):
         """
@@ -62,6 +80,9 @@ class DefaultRerank(Base):
     _FACTORY_NAME = "BAAI"
     _model = None
     _model_lock = threading.Lock()
+    # Padded tokens per batch, adapted by _process_batch. FlagReranker truncates pairs to 512 tokens.
+    _batch_tokens = RERANK_BATCH_TOKENS
+    _max_length = 512
 
     def __init__(self, key, model_name, **kwargs):
         """
@@ -87,7 +108,7 @@ class DefaultRerank(Base):
                         model_dir = snapshot_download(repo_id=model_name, local_dir=os.path.join(get_home_cache_dir(), re.sub(r"^[a-zA-Z0-9]+/", "", model_name)), local_dir_use_symlinks=False)
                         DefaultRerank._model = FlagReranker(model_dir, use_fp16=torch.cuda.is_available())
         self._model = DefaultRerank._model
-        self._dynamic_batch_size = 8
+        self._model_name = model_name
         self._min_batch_size = 1
 
     def torch_empty_cache(self):
@@ -98,40 +119,68 @@ class DefaultRerank(Base):
         except Exception as e:
             log_exception(e)
 
-    def _process_batch(self, pairs, max_batch_size=None):
-        """template method for subclass call"""
-        old_dynamic_batch_size = self._dynamic_batch_size
-        if max_batch_size is not None:
-            self._dynamic_batch_size = max_batch_size
-        res = np.array(len(pairs), dtype=float)
-        i = 0
-        while i < len(pairs):
-            cur_i = i
-            current_batch = self._dynamic_batch_size
-            max_retries = 5
+    def _process_batch(self, pairs, max_batch_size=None, lengths=None):
+        """template method for subclass call
+
+        Scores the pairs missing from the score cache, longest first so that a batch holds pairs of
+        similar length. A batch holds as many pairs as fit the padded token budget of the class,
+        which doubles while batches run under half of RERANK_BATCH_SECONDS and halves when they
+        exceed it or run out of memory.
+        """
+        res = np.zeros(len(pairs), dtype=float)
+        keys = [_rerank_score_key(self._model_name, q, t) for q, t in pairs]
+        todo = []
+        with _rerank_score_lock:
+            for i, k in enumerate(keys):
+                score = _rerank_score_cache.get(k)
+                if score is None:
+                    todo.append(i)
+                else:
+                    res[i] = score
+        if lengths is None:
+            lengths = [num_tokens_from_string(q) + num_tokens_from_string(t) for q, t in pairs]
+        lengths = [max(1, min(n, self._max_length)) for n in lengths]
+        todo.sort(key=lambda i: lengths[i], reverse=True)
+        max_batch_size = max_batch_size or len(todo)
+
+        cls = type(self)
+        self.batch_stats = []
+        b = 0
+        max_retries = 5
+        retry_count = 0
+        while b < len(todo):
+            # The first pair of the batch is the longest one, every pair is padded to it.
+            n = min(max_batch_size, max(self._min_batch_size, cls._batch_tokens // lengths[todo[b]]))
+            batch = todo[b : b + n]
+            st = time.perf_counter()
+            try:
+                # call subclass implemented batch processing calculation
+                batch_scores = self._compute_batch_scores([pairs[i] for i in batch])
+            except RuntimeError as e:
+                if "out of memory" in str(e) and n > self._min_batch_size:
+                    if retry_count >= max_retries:
+                        raise RuntimeError("max retry times, still cannot process batch, please check your GPU memory")
+                    cls._batch_tokens = max(cls._batch_tokens // 2, RERANK_MIN_BATCH_TOKENS)
+                    self.torch_empty_cache()
+                    retry_count += 1
+                    continue
+                raise
+            elapsed = time.perf_counter() - st
             retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    # call subclass implemented batch processing calculation
-                    batch_scores = self._compute_batch_scores(pairs[i : i + current_batch])
-                    res[i : i + current_batch] = batch_scores
-                    i += current_batch
-                    self._dynamic_batch_size = min(self._dynamic_batch_size * 2, 8)
-                    break
-                except RuntimeError as e:
-                    if "CUDA out of memory" in str(e) and current_batch > self._min_batch_size:
-                        current_batch = max(current_batch // 2, self._min_batch_size)
-                        self.torch_empty_cache()
-                        i = cur_i # reset i to the start of the current batch
-                        retry_count += 1
-                    else:
-                        raise
-            if retry_count >= max_retries:
-                raise RuntimeError("max retry times, still cannot process batch, please check your GPU memory")
-            
+            with _rerank_score_lock:
+                for i, score in zip(batch, batch_scores):
+                    res[i] = score
+                    _rerank_score_cache[keys[i]] = float(score)
+            self.batch_stats.append({"pairs": len(batch), "padded_tokens": len(batch) * lengths[batch[0]], "seconds": elapsed})
+            logging.debug(f"{cls.__name__} scored {len(batch)} pairs ({len(batch) * lengths[batch[0]]} padded tokens) in {elapsed:.3f}s")
+            if elapsed > RERANK_BATCH_SECONDS:
+                cls._batch_tokens = max(cls._batch_tokens // 2, RERANK_MIN_BATCH_TOKENS)
+            elif elapsed < RERANK_BATCH_SECONDS / 2 and len(batch) == n and n < max_batch_size:
+                cls._batch_tokens = min(cls._batch_tokens * 2, RERANK_MAX_BATCH_TOKENS)
+            b += len(batch)
+
         self.torch_empty_cache()
-        self._dynamic_batch_size = old_dynamic_batch_size
-        return np.array(res)
+        return res
 
     def _compute_batch_scores(self, batch_pairs, max_length=None):
         if max_length is None:
@@ -144,11 +193,11 @@ class DefaultRerank(Base):
 
     def similarity(self, query: str, texts: list):
         pairs = [(query, truncate(t, 2048)) for t in texts]
-        token_count = 0
-        for _, t in pairs:
-            token_count += num_tokens_from_string(t)
+        query_tokens = num_tokens_from_string(query)
+        lengths = [query_tokens + num_tokens_from_string(t) for _, t in pairs]
+        token_count = sum(lengths) - query_tokens * len(pairs)
         batch_size = 4096
-        res = self._process_batch(pairs, max_batch_size=batch_size)
+        res = self._process_batch(pairs, max_batch_size=batch_size, lengths=lengths)
         return np.array(res), token_count
 
 
@@ -177,6 +226,7 @@ class YoudaoRerank(DefaultRerank):
     _FACTORY_NAME = "Youdao"
     _model = None
     _model_lock = threading.Lock()
+    _batch_tokens = RERANK_BATCH_TOKENS
 
     def __init__(self, key=None, model_name="maidalun1020/bce-reranker-base_v1", **kwargs):
         if not settings.LIGHTEN and not YoudaoRerank._model:
@@ -190,16 +240,17 @@ class YoudaoRerank(DefaultRerank):
                         YoudaoRerank._model = RerankerModel(model_name_or_path=model_name.replace("maidalun1020", "InfiniFlow"))
 
         self._model = YoudaoRerank._model
-        self._dynamic_batch_size = 8
+        self._model_name = model_name
+        self._max_length = self._model.max_length if self._model else 512
         self._min_batch_size = 1
 
     def similarity(self, query: str, texts: list):
         pairs = [(query, truncate(t, self._model.max_length)) for t in texts]
-        token_count = 0
-        for _, t in pairs:
-            token_count += num_tokens_from_string(t)
+        query_tokens = num_tokens_from_string(query)
+        lengths = [query_tokens + num_tokens_from_string(t) for _, t in pairs]
+        token_count = sum(lengths) - query_tokens * len(pairs)
         batch_size = 8
-        res = self._process_batch(pairs, max_batch_size=batch_size)
+        res = self._process_batch(pairs, max_batch_size=batch_size, lengths=lengths)
         return np.array(res), token_count
 
 
@@ -0,0 +1,156 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Compares `Dealer.insert_citations` with the former one, which scored every
+answer sentence with `hybrid_similarity` again for every threshold, on long
+answers made of sentences of the chunks. Embeddings are random projections of
+the token counts, so no model is needed.
+
+    python rag/nlp/citation_benchmark.py --sentences 200 --chunks 16 --corpus /path/to/txt_dir
+"""
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+import re
+import time
+
+import numpy as np
+
+from rag.nlp import rag_tokenizer
+from rag.nlp.query import FulltextQueryer
+from rag.nlp.search import Dealer
+
+SAMPLES = [
+    "Retrieval augmented generation grounds the answer of a language model on chunks retrieved from a knowledge base.",
+    "The parser splits every document into chunks, which are embedded and indexed with their tokens.",
+    "A hybrid similarity mixes the cosine similarity of the embeddings with the weights of the shared terms.",
+    "知识库中的文档被切分成多个片段，每个片段都会计算向量并建立全文索引。",
+    "回答生成之后，系统会为每一句话寻找最相似的片段并插入引用。",
+    "Rerankers score each pair of query and chunk with a cross encoder, which is slower but more accurate.",
+]
+
+
+class HashEmbedding:
+    def __init__(self, dim=256, seed=0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+        self.token_vecs = {}
+
+    def encode(self, texts):
+        vecs = []
+        for t in texts:
+            v = np.zeros(self.dim)
+            for tk in re.findall(r"\w+", t.lower()):
+                if tk not in self.token_vecs:
+                    self.token_vecs[tk] = self.rng.standard_normal(self.dim)
+                v += self.token_vecs[tk]
+            vecs.append(v)
+        return np.array(vecs), 0
+
+
+def legacy_insert_citations(dealer, answer, chunks, chunk_v, embd_mdl, tkweight=0.1, vtweight=0.9):
+    pieces = re.split(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", answer)
+    for i in range(1, len(pieces)):
+        if re.match(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", pieces[i]):
+            pieces[i - 1] += pieces[i][0]
+            pieces[i] = pieces[i][1:]
+    idx, pieces_ = [], []
+    for i, t in enumerate(pieces):
+        if len(t) < 5:
+            continue
+        idx.append(i)
+        pieces_.append(t)
+    ans_v, _ = embd_mdl.encode(pieces_)
+    chunks_tks = [rag_tokenizer.tokenize(dealer.qryr.rmWWW(ck)).split() for ck in chunks]
+    cites = {}
+    thr = 0.63
+    while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
+        for i, a in enumerate(pieces_):
+            sim, tksim, vtsim = dealer.qryr.hybrid_similarity(ans_v[i], chunk_v,
+                                                              rag_tokenizer.tokenize(dealer.qryr.rmWWW(pieces_[i])).split(),
+                                                              chunks_tks, tkweight, vtweight)
+            mx = np.max(sim) * 0.99
+            if mx < thr:
+                continue
+            cites[idx[i]] = list(set([str(ii) for ii in range(len(chunk_v)) if sim[ii] > mx]))[:4]
+        thr *= 0.8
+
+    res, seted = "", set([])
+    for i, p in enumerate(pieces):
+        res += p
+        for c in cites.get(i, []):
+            if c in seted:
+                continue
+            res += f" [ID:{c}]"
+            seted.add(c)
+    return res, seted
+
+
+def load_sentences(paths):
+    sentences = []
+    for p in paths:
+        fnms = [os.path.join(p, f) for f in sorted(os.listdir(p))] if os.path.isdir(p) else [p]
+        for fnm in fnms:
+            with open(fnm, "r", encoding="utf-8", errors="ignore") as f:
+                sentences.extend([s.strip() for s in re.split(r"(?<=[。！？.!?])\s*", f.read()) if len(s.strip()) > 10])
+    return sentences or SAMPLES
+
+
+def main(args):
+    random.seed(args.seed)
+    sentences = load_sentences(args.corpus)
+    # Citations need no doc store.
+    dealer = Dealer.__new__(Dealer)
+    dealer.qryr = FulltextQueryer()
+    embd_mdl = HashEmbedding(seed=args.seed)
+    chunks = [" ".join(random.choices(sentences, k=args.chunk_sentences)) for _ in range(args.chunks)]
+    chunk_v = [v.tolist() for v in embd_mdl.encode(chunks)[0]]
+    answers = []
+    for _ in range(args.answers):
+        answers.append("\n".join(random.choice(sentences) for _ in range(args.sentences)))
+    print(f"{args.answers} answers of {args.sentences} sentences, {len(chunks)} chunks")
+
+    st = time.perf_counter()
+    legacy = [legacy_insert_citations(dealer, a, chunks, list(chunk_v), embd_mdl) for a in answers]
+    el0 = time.perf_counter() - st
+    print(f"Sentence by sentence: {el0:.3f}s, {el0 / len(answers) * 1000:.1f}ms per answer")
+
+    st = time.perf_counter()
+    batched = [dealer.insert_citations(a, chunks, list(chunk_v), embd_mdl) for a in answers]
+    el1 = time.perf_counter() - st
+    print(f"Similarity matrix   : {el1:.3f}s, {el1 / len(answers) * 1000:.1f}ms per answer, {el0 / max(el1, 1e-9):.1f}x faster")
+    print(f"Different citations : {sum(int(a != b) for a, b in zip(legacy, batched))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', nargs="*", help="text files or directories to take sentences from", default=[])
+    parser.add_argument('--answers', type=int, default=10)
+    parser.add_argument('--sentences', type=int, help="sentences per answer", default=200)
+    parser.add_argument('--chunks', type=int, default=16)
+    parser.add_argument('--chunk_sentences', type=int, help="sentences per chunk", default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
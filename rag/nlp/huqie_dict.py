@@ -0,0 +1,256 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Memory-mapped, read-only huqie dictionary.
+
+The dictionary holds exactly what `RagTokenizer` used to keep in its datrie:
+forward keys mapped to `(log frequency, POS tag)` and reversed keys mapped to
+`1`. Keys are stored sorted in one blob with an offset table, so lookups and
+prefix checks are binary searches over the mapped pages. Nothing is parsed at
+load time and all the processes of a host share the same page cache copy.
+
+Layout (little endian):
+    header   : magic(8) n_keys(u32) n_tags(u32) 6 section offsets(u64)
+               source size(u64) source mtime(u64, ns)
+    key_offs : u32[n_keys + 1]
+    keys     : concatenated ASCII keys
+    freqs    : i16[n_keys]
+    tags     : u16[n_keys], REVERSED_KEY for reversed keys
+    tag_offs : u32[n_tags + 1]
+    tag_blob : concatenated UTF-8 tags
+
+Build it offline with:
+    python -m rag.nlp.huqie_dict -o rag/res/huqie.dict rag/res/huqie.txt [user_dict.txt ...]
+Sources can be plain text dictionaries (`word freq tag` per line) or datrie
+`.trie` files. The file is stamped with the size and mtime of the first source:
+`RagTokenizer` exports it again once `huqie.txt` doesn't match them any more.
+"""
+import argparse
+import logging
+import math
+import mmap
+import os
+import re
+import string
+import struct
+from bisect import bisect_left
+from functools import lru_cache
+
+import datrie
+import numpy as np
+
+MAGIC = b"HUQIEDB2"
+HEADER = struct.Struct("<8sII8Q")
+REVERSED_KEY = 0xFFFF
+DENOMINATOR = 1000000
+
+
+def source_stamp(fnm):
+    """(size, mtime in ns) of a source dictionary, (0, 0) if there's none."""
+    try:
+        st = os.stat(fnm)
+    except OSError:
+        return 0, 0
+    return st.st_size, st.st_mtime_ns
+
+
+def key_(line):
+    return str(line.lower().encode("utf-8"))[2:-1]
+
+
+def rkey_(line):
+    return str(("DD" + (line[::-1].lower())).encode("utf-8"))[2:-1]
+
+
+class _Keys:
+    """Sequence view over the sorted key blob, for `bisect`."""
+
+    def __init__(self, mm, offs, base):
+        self.mm = mm
+        self.offs = offs
+        self.base = base
+
+    def __len__(self):
+        return len(self.offs) - 1
+
+    def __getitem__(self, i):
+        return self.mm[self.base + int(self.offs[i]): self.base + int(self.offs[i + 1])]
+
+
+class HuqieDict:
+    def __init__(self, fnm, cache_size=1 << 16):
+        self.fnm = fnm
+        with open(fnm, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_keys, n_tags, o_offs, o_keys, o_freqs, o_tags, o_tag_offs, o_tag_blob, src_size, src_mtime = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{fnm} is not a huqie dictionary")
+        self.source = (src_size, src_mtime)
+        self.freqs = np.frombuffer(self.mm, dtype="<i2", count=n_keys, offset=o_freqs)
+        self.tag_ids = np.frombuffer(self.mm, dtype="<u2", count=n_keys, offset=o_tags)
+        self.keys = _Keys(self.mm, np.frombuffer(self.mm, dtype="<u4", count=n_keys + 1, offset=o_offs), o_keys)
+        tag_offs = np.frombuffer(self.mm, dtype="<u4", count=n_tags + 1, offset=o_tag_offs)
+        self.tags = [self.mm[o_tag_blob + int(tag_offs[i]): o_tag_blob + int(tag_offs[i + 1])].decode("utf-8")
+                     for i in range(n_tags)]
+        # Extra entries from user dictionaries added at runtime.
+        self.extra = datrie.Trie(string.printable)
+        self._get = lru_cache(maxsize=cache_size)(self._lookup)
+        self._has_prefix = lru_cache(maxsize=cache_size)(self._lookup_prefix)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lookup(self, k):
+        kb = k.encode("ascii")
+        i = bisect_left(self.keys, kb)
+        if i >= len(self.keys) or self.keys[i] != kb:
+            return None
+        t = int(self.tag_ids[i])
+        if t == REVERSED_KEY:
+            return 1
+        return int(self.freqs[i]), self.tags[t]
+
+    def _lookup_prefix(self, k):
+        kb = k.encode("ascii")
+        i = bisect_left(self.keys, kb)
+        return i < len(self.keys) and self.keys[i].startswith(kb)
+
+    def get(self, k, default=None):
+        if k in self.extra:
+            return self.extra[k]
+        v = self._get(k)
+        return default if v is None else v
+
+    def __contains__(self, k):
+        return k in self.extra or self._get(k) is not None
+
+    def __getitem__(self, k):
+        v = self.get(k)
+        if v is None:
+            raise KeyError(k)
+        return v
+
+    def __setitem__(self, k, v):
+        self.extra[k] = v
+
+    def has_keys_with_prefix(self, k):
+        return self._has_prefix(k) or self.extra.has_keys_with_prefix(k)
+
+    def save(self, fnm):
+        # The mapped part is immutable, only the runtime additions get saved: they aren't a whole
+        # dictionary, see `load_extra`.
+        self.extra.save(fnm)
+
+    def load_extra(self, fnm):
+        """Layers the entries saved by `save` over the mapped dictionary."""
+        self.extra = datrie.Trie.load(fnm)
+
+    def close(self):
+        self.mm.close()
+
+
+def load_entries(fnm, entries=None):
+    """Merge the entries of a text dictionary or a datrie file into `entries` like `RagTokenizer.loadDict_`."""
+    if entries is None:
+        entries = {}
+    if fnm.endswith(".trie"):
+        for k, v in datrie.Trie.load(fnm).items():
+            if v == 1 or k not in entries or entries[k] == 1 or entries[k][0] < v[0]:
+                entries[k] = v
+        return entries
+
+    with open(fnm, "r", encoding="utf-8") as of:
+        for line in of:
+            line = re.sub(r"[\r\n]+", "", line)
+            line = re.split(r"[ \t]", line)
+            if len(line) < 3:
+                continue
+            k = key_(line[0])
+            F = int(math.log(float(line[1]) / DENOMINATOR) + .5)
+            if k not in entries or entries[k][0] < F:
+                entries[k] = (F, line[2])
+            entries[rkey_(line[0])] = 1
+    return entries
+
+
+def build(sources, out):
+    entries = {}
+    for fnm in sources:
+        logging.info(f"[HUQIE]:Load {fnm}")
+        load_entries(fnm, entries)
+    write(entries, out, source_stamp(sources[0]))
+    return len(entries)
+
+
+def write(entries, out, source=(0, 0)):
+    keys = sorted(entries.keys(), key=lambda k: k.encode("ascii"))
+    tags, tag_ids = [], {}
+    key_offs, freqs, tag_idx = [0], [], []
+    blob = bytearray()
+    for k in keys:
+        blob += k.encode("ascii")
+        key_offs.append(len(blob))
+        v = entries[k]
+        if v == 1:
+            freqs.append(0)
+            tag_idx.append(REVERSED_KEY)
+            continue
+        F, tag = v
+        if tag not in tag_ids:
+            tag_ids[tag] = len(tags)
+            tags.append(tag)
+        freqs.append(max(-32768, min(32767, int(F))))
+        tag_idx.append(tag_ids[tag])
+    assert len(tags) < REVERSED_KEY, "Too many distinct tags"
+
+    tag_blob = bytearray()
+    tag_offs = [0]
+    for t in tags:
+        tag_blob += t.encode("utf-8")
+        tag_offs.append(len(tag_blob))
+
+    sections = [
+        np.array(key_offs, dtype="<u4").tobytes(),
+        bytes(blob),
+        np.array(freqs, dtype="<i2").tobytes(),
+        np.array(tag_idx, dtype="<u2").tobytes(),
+        np.array(tag_offs, dtype="<u4").tobytes(),
+        bytes(tag_blob),
+    ]
+    offsets, pos = [], HEADER.size
+    for s in sections:
+        pos += (-pos) % 8
+        offsets.append(pos)
+        pos += len(s)
+
+    # Written aside and renamed so that readers never map a partial file.
+    tmp = f"{out}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(keys), len(tags), *offsets, *source))
+        for o, s in zip(offsets, sections):
+            f.write(b"\0" * (o - f.tell()))
+            f.write(s)
+    os.replace(tmp, out)
+    logging.info(f"[HUQIE]:Wrote {len(keys)} keys to {out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the memory-mapped huqie dictionary.")
+    parser.add_argument("-o", "--output", required=True, help="output file, e.g. rag/res/huqie.dict")
+    parser.add_argument("sources", nargs="+", help="huqie.txt first, then huqie.txt.trie and/or user dictionaries, merged in order")
+    args = parser.parse_args()
+    build(args.sources, args.output)
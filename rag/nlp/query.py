@@ -227,18 +227,56 @@ class FulltextQueryer:
         return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
 
     def token_similarity(self, atks, btkss):
-        def toDict(tks):
+        return self.token_similarity_matrix([atks], btkss)[0]
+
+    def token_similarity_matrix(self, atkss, btkss):
+        # Only the query side carries weights: a candidate contributes the
+        # weights of the query terms it contains (see `similarity`). So the
+        # candidates are turned into a sparse term-incidence matrix over the
+        # union of the query terms, and each token list of `atkss`, a row of
+        # weights, is scored against all of them with a single product.
+        from scipy.sparse import csr_matrix
+        import numpy as np
+
+        qtwts, vocab = [], {}
+        for atks in atkss:
+            if isinstance(atks, str):
+                atks = atks.split()
+            qtwt = defaultdict(int)
+            for t, c in self.tw.weights(atks, preprocess=False):
+                qtwt[t] += c
+            for t in qtwt:
+                vocab.setdefault(t, len(vocab))
+            qtwts.append(qtwt)
+        if not btkss:
+            return np.zeros((len(atkss), 0))
+
+        qmat = np.zeros((len(atkss), max(len(vocab), 1)))
+        qsum = np.zeros((len(atkss), 1))
+        for i, qtwt in enumerate(qtwts):
+            qvec = np.fromiter(qtwt.values(), dtype=np.float64, count=len(qtwt))
+            qmat[i, [vocab[t] for t in qtwt]] = qvec
+            qsum[i, 0] = qvec.sum()
+        indptr, indices = [0], []
+        for tks in btkss:
             if isinstance(tks, str):
                 tks = tks.split()
-            d = defaultdict(int)
-            wts = self.tw.weights(tks, preprocess=False)
-            for i, (t, c) in enumerate(wts):
-                d[t] += c
-            return d
-
-        atks = toDict(atks)
-        btkss = [toDict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+            indices.extend({vocab[t] for t in tks if t in vocab})
+            indptr.append(len(indices))
+        m = csr_matrix((np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                       shape=(len(btkss), qmat.shape[1]))
+        hits = (m @ qmat.T).T
+        return (hits + 1e-9) / (qsum + 1e-9)
+
+    def hybrid_similarity_matrix(self, avecs, bvecs, atkss, btkss, tkweight=0.3, vtweight=0.7):
+        # `hybrid_similarity` of every (avec, atks) pair of `avecs` and `atkss`, one row each.
+        from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
+        import numpy as np
+
+        sims = CosineSimilarity(avecs, bvecs)
+        tksim = self.token_similarity_matrix(atkss, btkss)
+        no_vector = np.sum(sims, axis=1, keepdims=True) == 0
+        return np.where(no_vector, tksim, sims * vtweight + tksim * tkweight)
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -26,6 +26,8 @@ from hanziconv import HanziConv
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from api.utils.file_utils import get_project_base_directory
+from rag.nlp import huqie_dict
+from rag.nlp.huqie_dict import HuqieDict
 
 
 class RagTokenizer:
@@ -51,7 +53,7 @@ class RagTokenizer:
                     self.trie_[self.key_(line[0])] = (F, line[2])
                 self.trie_[self.rkey_(line[0])] = 1
 
-            dict_file_cache = fnm + ".trie"
+            dict_file_cache = self._trie_cache(fnm)
             logging.info(f"[HUQIE]:Build trie cache to {dict_file_cache}")
             self.trie_.save(dict_file_cache)
             of.close()
@@ -61,33 +63,72 @@ class RagTokenizer:
     def __init__(self, debug=False):
         self.DEBUG = debug
         self.DENOMINATOR = 1000000
+        self.segment_ = self.dp_segment_
         self.DIR_ = os.path.join(get_project_base_directory(), "rag/res", "huqie")
 
         self.stemmer = PorterStemmer()
         self.lemmatizer = WordNetLemmatizer()
 
         self.SPLIT_CHAR = r"([ ,\.<>/?;:'\[\]\\`!@#$%^&*\(\)\{\}\|_+=《》，。？、；‘’：“”【】~！￥%……（）——-]+|[a-zA-Z0-9,\.-]+)"
+        self.split_char_re_ = re.compile(self.SPLIT_CHAR)
+
+        # prefer the memory-mapped dictionary shared by all processes on the host, unless huqie.txt changed since
+        source = huqie_dict.source_stamp(self.DIR_ + ".txt")
+        dict_file_name = self.DIR_ + ".dict"
+        if os.path.exists(dict_file_name):
+            try:
+                trie = HuqieDict(dict_file_name)
+                if trie.source == source:
+                    self.trie_ = trie
+                    return
+                logging.info(f"[HUQIE]:Dictionary file {dict_file_name} is outdated, export it again")
+            except Exception:
+                logging.exception(f"[HUQIE]:Fail to map dictionary file {dict_file_name}, fall back to the trie file")
 
         trie_file_name = self.DIR_ + ".txt.trie"
-        # check if trie file existence
-        if os.path.exists(trie_file_name):
+        # check if trie file existence, and that it was built after huqie.txt
+        if os.path.exists(trie_file_name) and os.stat(trie_file_name).st_mtime_ns >= source[1]:
             try:
                 # load trie from file
                 self.trie_ = datrie.Trie.load(trie_file_name)
+                self._export_dict(dict_file_name, source)
                 return
             except Exception:
                 # fail to load trie from file, build default trie
                 logging.exception(f"[HUQIE]:Fail to load trie file {trie_file_name}, build the default trie file")
                 self.trie_ = datrie.Trie(string.printable)
         else:
-            # file not exist, build default trie
-            logging.info(f"[HUQIE]:Trie file {trie_file_name} not found, build the default trie file")
+            # file not exist or outdated, build default trie
+            logging.info(f"[HUQIE]:Trie file {trie_file_name} not found or outdated, build the default trie file")
             self.trie_ = datrie.Trie(string.printable)
 
         # load data from dict file and save to trie file
         self.loadDict_(self.DIR_ + ".txt")
+        self._export_dict(dict_file_name, source)
+
+    def _export_dict(self, fnm, source):
+        # Done once per host and version of huqie.txt: later processes map the exported file instead of loading the trie.
+        if not len(self.trie_):
+            return
+        try:
+            huqie_dict.write(dict(self.trie_.items()), fnm, source)
+        except Exception:
+            logging.exception(f"[HUQIE]:Fail to export dictionary file {fnm}")
+
+    def _trie_cache(self, fnm):
+        # Over the mapped dictionary, only the entries of `fnm` are saved: a trie of its own can't stand for them.
+        return fnm + (".extra.trie" if isinstance(self.trie_, HuqieDict) else ".trie")
 
     def loadUserDict(self, fnm):
+        if isinstance(self.trie_, HuqieDict):
+            # Its trie cache only holds the user entries, which go over the mapped dictionary.
+            try:
+                self.trie_.load_extra(self._trie_cache(fnm))
+                return
+            except Exception:
+                self.trie_.extra = datrie.Trie(string.printable)
+            self.loadDict_(fnm)
+            return
         try:
             self.trie_ = datrie.Trie.load(fnm + ".trie")
             return
@@ -197,6 +238,97 @@ class RagTokenizer:
         _memo[state_key] = result
         return result
 
+    def dfs_segment_(self, chars, topn=1):
+        tkslist = []
+        self.dfs_(chars, 0, [], tkslist)
+        return [tks for tks, _ in self.sortTks_(tkslist)[:topn]]
+
+    def dp_segment_(self, chars, topn=1):
+        """
+        Returns the `topn` best segmentations of `chars`, exactly as ranking every
+        path enumerated by `dfs_` with `sortTks_` would, ties included.
+
+        `score_` is not additive (it divides by the number of tokens), so the
+        suffixes reachable from a DFS state (position, depth, trailing single-char
+        tokens) are grouped by (token count, long token count) and only the `topn`
+        best frequency sums of each group are kept. Ties are broken by DFS order,
+        which is the lexicographic order of token end positions.
+        """
+        MAX_DEPTH = 10
+        n = len(chars)
+        memo = {}
+
+        def value(t):
+            k = self.key_(t)
+            return self.trie_[k] if k in self.trie_ else (-12, '')
+
+        def children(s, d, tail):
+            if s < n - 4 and all(chars[s + i] == chars[s] for i in range(1, 5)):
+                end = s
+                while end < n and chars[end] == chars[s]:
+                    end += 1
+                mid = s + min(10, end - s)
+                return [(mid, chars[s:mid], value(chars[s:mid]))]
+
+            S = s + 1
+            if s + 2 <= n:
+                if self.trie_.has_keys_with_prefix(self.key_(chars[s:s + 1])) and \
+                        not self.trie_.has_keys_with_prefix(self.key_(chars[s:s + 2])):
+                    S = s + 2
+            if d > 2 and tail >= 3:
+                if self.trie_.has_keys_with_prefix(self.key_(chars[s - 1] + chars[s:s + 1])):
+                    S = s + 2
+
+            res = []
+            for e in range(S, n + 1):
+                t = chars[s:e]
+                k = self.key_(t)
+                if e > s + 1 and not self.trie_.has_keys_with_prefix(k):
+                    break
+                if k in self.trie_:
+                    res.append((e, t, self.trie_[k]))
+            if not res:
+                res.append((s + 1, chars[s:s + 1], value(chars[s:s + 1])))
+            return res
+
+        def insert(group, entry):
+            group.append(entry)
+            group.sort(key=lambda x: (-x[0], x[1]))
+            del group[topn:]
+
+        def suffixes(s, d, tail):
+            # {(token count, long token count): [(frequency sum, token ends, tokens)]}
+            if d > MAX_DEPTH:
+                if s < n:
+                    t = chars[s:]
+                    return {(1, int(len(t) >= 2)): [(-12, (n,), (t,))]}
+                return {}
+            if s >= n:
+                return {(0, 0): [(0, (), ())]}
+            state = (s, d, tail)
+            if state in memo:
+                return memo[state]
+
+            groups = {}
+            for e, t, (F, _) in children(s, d, tail):
+                long_ = int(len(t) >= 2)
+                sub = suffixes(e, d + 1, min(tail + 1, 3) if len(t) == 1 else 0)
+                for (k, L), entries in sub.items():
+                    group = groups.setdefault((k + 1, L + long_), [])
+                    for f, ends, tks in entries:
+                        insert(group, (F + f, (e,) + ends, (t,) + tks))
+            memo[state] = groups
+            return groups
+
+        B = 30
+        ranked = []
+        for (k, L), entries in suffixes(0, 0, 0).items():
+            for f, ends, tks in entries:
+                # same arithmetic as `score_`
+                ranked.append((B / k + L / k + f, ends, list(tks)))
+        ranked.sort(key=lambda x: (-x[0], x[1]))
+        return [tks for _, _, tks in ranked[:topn]]
+
     def freq(self, tk):
         k = self.key_(tk)
         if k not in self.trie_:
@@ -239,7 +371,7 @@ class RagTokenizer:
             E = s + 1
             for e in range(s + 2, min(len(tks) + 2, s + 6)):
                 tk = "".join(tks[s:e])
-                if re.search(self.SPLIT_CHAR, tk) and self.freq(tk):
+                if self.split_char_re_.search(tk) and self.freq(tk):
                     E = e
             res.append("".join(tks[s:E]))
             s = E
@@ -319,6 +451,10 @@ class RagTokenizer:
             txt_lang_pairs.append((a[s: e], zh))
         return txt_lang_pairs
 
+    def _best_tks_(self, chars):
+        tkslist = self.segment_(chars, 1)
+        return tkslist[0] if tkslist else [chars]
+
     def tokenize(self, line):
         line = re.sub(r"\W+", " ", line)
         line = self._strQ2B(line).lower()
@@ -367,9 +503,7 @@ class RagTokenizer:
                     j += 1
                     continue
                 # backward tokens from_i to i are different from forward tokens from _j to j.
-                tkslist = []
-                self.dfs_("".join(tks[_j:j]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self._best_tks_("".join(tks[_j:j]))))
 
                 same = 1
                 while i + same < len(tks1) and j + same < len(tks) and tks1[i + same] == tks[j + same]:
@@ -383,9 +517,7 @@ class RagTokenizer:
             if _i < len(tks1):
                 assert _j < len(tks)
                 assert "".join(tks1[_i:]) == "".join(tks[_j:])
-                tkslist = []
-                self.dfs_("".join(tks[_j:]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self._best_tks_("".join(tks[_j:]))))
 
         res = " ".join(res)
         logging.debug("[TKS] {}".format(self.merge_(res)))
@@ -405,15 +537,11 @@ class RagTokenizer:
             if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
                 res.append(tk)
                 continue
-            tkslist = []
-            if len(tk) > 10:
-                tkslist.append(tk)
-            else:
-                self.dfs_(tk, 0, [], tkslist)
+            tkslist = [] if len(tk) > 10 else self.segment_(tk, 2)
             if len(tkslist) < 2:
                 res.append(tk)
                 continue
-            stk = self.sortTks_(tkslist)[1][0]
+            stk = tkslist[1]
             if len(stk) == len(tk):
                 stk = tk
             else:
@@ -431,6 +559,41 @@ class RagTokenizer:
 
         return " ".join(self.english_normalize_(res))
 
+    def tokenize_many(self, texts, processes=0):
+        """`tokenize` over a batch of texts, spread over `processes` worker processes if > 1."""
+        return _map_batches("tokenize", texts, processes)
+
+    def fine_grained_tokenize_many(self, tkss, processes=0):
+        return _map_batches("fine_grained_tokenize", tkss, processes)
+
+
+_POOL = None
+_POOL_SIZE = 0
+
+
+def _run_batch(method, items):
+    return [getattr(tokenizer, method)(t) for t in items]
+
+
+def _map_batches(method, items, processes):
+    global _POOL, _POOL_SIZE
+    items = list(items)
+    if processes <= 1 or len(items) < 2:
+        return _run_batch(method, items)
+
+    from concurrent.futures import ProcessPoolExecutor
+    if _POOL is None or _POOL_SIZE != processes:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False)
+        # Workers map the same dictionary file, so they are cheap to start.
+        _POOL, _POOL_SIZE = ProcessPoolExecutor(max_workers=processes), processes
+    size = max(1, math.ceil(len(items) / (processes * 4)))
+    batches = [items[i: i + size] for i in range(0, len(items), size)]
+    res = []
+    for r in _POOL.map(_run_batch, [method] * len(batches), batches):
+        res.extend(r)
+    return res
+
 
 def is_chinese(s):
     if s >= u'\u4e00' and s <= u'\u9fa5':
@@ -467,6 +630,8 @@ def naiveQie(txt):
 tokenizer = RagTokenizer()
 tokenize = tokenizer.tokenize
 fine_grained_tokenize = tokenizer.fine_grained_tokenize
+tokenize_many = tokenizer.tokenize_many
+fine_grained_tokenize_many = tokenizer.fine_grained_tokenize_many
 tag = tokenizer.tag
 freq = tokenizer.freq
 loadUserDict = tokenizer.loadUserDict
@@ -14,21 +14,123 @@
 #  limitations under the License.
 #
 import logging
+import os
 import re
 import math
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 
 from rag.settings import TAG_FLD, PAGERANK_FLD
 from rag.utils import rmSpace, get_float
 from rag.nlp import rag_tokenizer, query
 import numpy as np
 from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
+from rag.utils.embedding_cache import EMBD_CACHE
+from rag.utils.retrieval_cache import RETRIEVAL_CACHE
+
+
+CITATION_EMBEDDING_BATCH = int(os.environ.get("CITATION_EMBEDDING_BATCH", 8))
+citation_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CITATION_THREADS", 8)), thread_name_prefix="citation")
 
 
 def index_name(uid): return f"ragflow_{uid}"
 
 
+@lru_cache(maxsize=4096)
+def citation_tokens(txt):
+    """Tokens of a chunk for `Dealer.insert_citations`, the same chunks come back answer after answer."""
+    return tuple(rag_tokenizer.tokenize(query.FulltextQueryer.rmWWW(txt)).split())
+
+
+def citation_pieces(answer):
+    """Splits an answer into pieces for citations: (all pieces, indices of the long enough ones, those pieces)."""
+    pieces = re.split(r"(```)", answer)
+    if len(pieces) >= 3:
+        i = 0
+        pieces_ = []
+        while i < len(pieces):
+            if pieces[i] == "```":
+                st = i
+                i += 1
+                while i < len(pieces) and pieces[i] != "```":
+                    i += 1
+                if i < len(pieces):
+                    i += 1
+                pieces_.append("".join(pieces[st: i]) + "\n")
+            else:
+                pieces_.extend(
+                    re.split(
+                        r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])",
+                        pieces[i]))
+                i += 1
+        pieces = pieces_
+    else:
+        pieces = re.split(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", answer)
+    for i in range(1, len(pieces)):
+        if re.match(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", pieces[i]):
+            pieces[i - 1] += pieces[i][0]
+            pieces[i] = pieces[i][1:]
+    idx = []
+    pieces_ = []
+    for i, t in enumerate(pieces):
+        if len(t) < 5:
+            continue
+        idx.append(i)
+        pieces_.append(t)
+    return pieces, idx, pieces_
+
+
+class StreamingCitations:
+    """
+    Embeds and tokenizes the pieces of an answer while it streams, by batches of
+    CITATION_EMBEDDING_BATCH complete pieces on `citation_executor`, so that
+    `Dealer.insert_citations` only scores them once the answer is done.
+    """
+
+    def __init__(self, embd_mdl, batch_size=CITATION_EMBEDDING_BATCH):
+        self.embd_mdl = embd_mdl
+        self.batch_size = batch_size
+        self.seen = set()
+        self.pending = []
+        self.futures = []
+        self.stopped = False
+
+    def feed(self, answer):
+        """Takes the answer streamed so far. Its last piece may still grow, it is left for later."""
+        if self.stopped:
+            return
+        if re.search(r"\[ID:([0-9]+)\]", answer):
+            # The model cites by itself, nothing will be inserted.
+            self.stopped = True
+            return
+        if answer.find("<think>") >= 0 and answer.find("</think>") < 0:
+            return
+        pieces, idx, pieces_ = citation_pieces(answer.split("</think>")[-1])
+        for i, p in zip(idx, pieces_):
+            if i + 1 < len(pieces) and p not in self.seen:
+                self.seen.add(p)
+                self.pending.append(p)
+        if len(self.pending) >= self.batch_size:
+            batch, self.pending = self.pending, []
+            self.futures.append(citation_executor.submit(self._encode, batch))
+
+    def _encode(self, batch):
+        vecs, _ = self.embd_mdl.encode(batch)
+        return {p: (v, rag_tokenizer.tokenize(query.FulltextQueryer.rmWWW(p)).split()) for p, v in zip(batch, vecs)}
+
+    def pieces(self):
+        """{piece: (vector, tokens)} of the batches submitted so far, waiting for the ones in flight."""
+        res = {}
+        for f in self.futures:
+            try:
+                res.update(f.result())
+            except Exception:
+                logging.exception("StreamingCitations failed to embed a batch of pieces")
+        return res
+
+
 class Dealer:
     def __init__(self, dataStore: DocStoreConnection):
         self.qryr = query.FulltextQueryer()
@@ -46,7 +148,7 @@ class Dealer:
         group_docs: list[list] | None = None
 
     def get_vector(self, txt, emb_mdl, topk=10, similarity=0.1):
-        qv, _ = emb_mdl.encode_queries(txt)
+        qv, _ = EMBD_CACHE.encode_queries(emb_mdl, txt)
         shape = np.array(qv).shape
         if len(shape) > 1:
             raise Exception(
@@ -161,48 +263,25 @@ class Dealer:
         return [get_float(t) for t in txt.split("\t")]
 
     def insert_citations(self, answer, chunks, chunk_v,
-                         embd_mdl, tkweight=0.1, vtweight=0.9):
+                         embd_mdl, tkweight=0.1, vtweight=0.9, done_pieces=None):
+        """
+        `done_pieces`, {piece: (vector, tokens)} from `StreamingCitations.pieces`,
+        spares embedding and tokenizing the pieces of the answer done while streaming.
+        """
         assert len(chunks) == len(chunk_v)
         if not chunks:
             return answer, set([])
-        pieces = re.split(r"(```)", answer)
-        if len(pieces) >= 3:
-            i = 0
-            pieces_ = []
-            while i < len(pieces):
-                if pieces[i] == "```":
-                    st = i
-                    i += 1
-                    while i < len(pieces) and pieces[i] != "```":
-                        i += 1
-                    if i < len(pieces):
-                        i += 1
-                    pieces_.append("".join(pieces[st: i]) + "\n")
-                else:
-                    pieces_.extend(
-                        re.split(
-                            r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])",
-                            pieces[i]))
-                    i += 1
-            pieces = pieces_
-        else:
-            pieces = re.split(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", answer)
-        for i in range(1, len(pieces)):
-            if re.match(r"([^\|][；。？!！\n]|[a-z][.?;!][ \n])", pieces[i]):
-                pieces[i - 1] += pieces[i][0]
-                pieces[i] = pieces[i][1:]
-        idx = []
-        pieces_ = []
-        for i, t in enumerate(pieces):
-            if len(t) < 5:
-                continue
-            idx.append(i)
-            pieces_.append(t)
+        pieces, idx, pieces_ = citation_pieces(answer)
         logging.debug("{} => {}".format(answer, pieces_))
         if not pieces_:
             return answer, set([])
 
-        ans_v, _ = embd_mdl.encode(pieces_)
+        done_pieces = done_pieces or {}
+        todo = [p for p in pieces_ if p not in done_pieces]
+        if todo:
+            vecs, _ = embd_mdl.encode(todo)
+            done_pieces = {**done_pieces, **{p: (v, None) for p, v in zip(todo, vecs)}}
+        ans_v = [done_pieces[p][0] for p in pieces_]
         for i in range(len(chunk_v)):
             if len(ans_v[0]) != len(chunk_v[i]):
                 chunk_v[i] = [0.0]*len(ans_v[0])
@@ -211,24 +290,24 @@ class Dealer:
         assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
             len(ans_v[0]), len(chunk_v[0]))
 
-        chunks_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
-                      for ck in chunks]
+        chunks_tks = [citation_tokens(ck) for ck in chunks]
+        # Similarities of every piece to every chunk, once for all the thresholds.
+        sims = self.qryr.hybrid_similarity_matrix(ans_v,
+                                                  chunk_v,
+                                                  [done_pieces[p][1] or rag_tokenizer.tokenize(self.qryr.rmWWW(p)).split()
+                                                   for p in pieces_],
+                                                  chunks_tks,
+                                                  tkweight, vtweight)
+        mxs = np.max(sims, axis=1) * 0.99
         cites = {}
         thr = 0.63
         while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
-            for i, a in enumerate(pieces_):
-                sim, tksim, vtsim = self.qryr.hybrid_similarity(ans_v[i],
-                                                                chunk_v,
-                                                                rag_tokenizer.tokenize(
-                                                                    self.qryr.rmWWW(pieces_[i])).split(),
-                                                                chunks_tks,
-                                                                tkweight, vtweight)
-                mx = np.max(sim) * 0.99
+            for i, mx in enumerate(mxs):
                 logging.debug("{} SIM: {}".format(pieces_[i], mx))
                 if mx < thr:
                     continue
                 cites[idx[i]] = list(
-                    set([str(ii) for ii in range(len(chunk_v)) if sim[ii] > mx]))[:4]
+                    set([str(ii) for ii in np.flatnonzero(sims[i] > mx)]))[:4]
             thr *= 0.8
 
         res = ""
@@ -365,6 +444,17 @@ class Dealer:
         if isinstance(tenant_ids, str):
             tenant_ids = tenant_ids.split(",")
 
+        cache_key = RETRIEVAL_CACHE.key(kb_ids, question=question, tenant_ids=sorted(tenant_ids),
+                                        doc_ids=sorted(doc_ids) if doc_ids else doc_ids, page=page, page_size=page_size,
+                                        similarity_threshold=similarity_threshold,
+                                        vector_similarity_weight=vector_similarity_weight, top=top, aggs=aggs,
+                                        highlight=highlight, rank_feature=rank_feature,
+                                        embd_mdl=getattr(embd_mdl, "llm_name", str(embd_mdl)),
+                                        rerank_mdl=getattr(rerank_mdl, "llm_name", str(rerank_mdl)) if rerank_mdl else None)
+        cached = RETRIEVAL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
         sres = self.search(req, [index_name(tid) for tid in tenant_ids],
                            kb_ids, embd_mdl, highlight, rank_feature=rank_feature)
 
@@ -435,6 +525,7 @@ class Dealer:
                                                                    key=lambda x: x[1]["count"] * -1)]
         ranks["chunks"] = ranks["chunks"][:page_size]
 
+        RETRIEVAL_CACHE.set(cache_key, ranks)
         return ranks
 
     def sql_retrieval(self, sql, fetch_size=128, format="json"):
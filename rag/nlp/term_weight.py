@@ -19,10 +19,13 @@ import math
 import json
 import re
 import os
+from functools import lru_cache
 import numpy as np
 from rag.nlp import rag_tokenizer
 from api.utils.file_utils import get_project_base_directory
 
+TERM_WEIGHT_CACHE_SIZE = int(os.environ.get("TERM_WEIGHT_CACHE_SIZE", 1 << 17))
+
 
 class Dealer:
     def __init__(self):
@@ -88,6 +91,7 @@ class Dealer:
             self.df = load_dict(os.path.join(fnm, "term.freq"))
         except Exception:
             logging.warning("Load term.freq FAIL!")
+        self.token_weight = lru_cache(maxsize=TERM_WEIGHT_CACHE_SIZE)(self._token_weight)
 
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
@@ -159,86 +163,78 @@ class Dealer:
                 tks.append(t)
         return tks
 
-    def weights(self, tks, preprocess=True):
-        def skill(t):
-            if t not in self.sk:
-                return 1
-            return 6
-
-        def ner(t):
-            if re.match(r"[0-9,.]{2,}$", t):
-                return 2
-            if re.match(r"[a-z]{1,2}$", t):
-                return 0.01
-            if not self.ne or t not in self.ne:
-                return 1
-            m = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3,
-                 "firstnm": 1}
-            return m[self.ne[t]]
-
-        def postag(t):
-            t = rag_tokenizer.tag(t)
-            if t in set(["r", "c", "d"]):
-                return 0.3
-            if t in set(["ns", "nt"]):
-                return 3
-            if t in set(["n"]):
-                return 2
-            if re.match(r"[0-9-]+", t):
-                return 2
+    def _ner(self, t):
+        if re.match(r"[0-9,.]{2,}$", t):
+            return 2
+        if re.match(r"[a-z]{1,2}$", t):
+            return 0.01
+        if not self.ne or t not in self.ne:
             return 1
-
-        def freq(t):
-            if re.match(r"[0-9. -]{2,}$", t):
-                return 3
-            s = rag_tokenizer.freq(t)
-            if not s and re.match(r"[a-z. -]+$", t):
-                return 300
-            if not s:
+        m = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3,
+             "firstnm": 1}
+        return m[self.ne[t]]
+
+    @staticmethod
+    def _postag(t):
+        t = rag_tokenizer.tag(t)
+        if t in set(["r", "c", "d"]):
+            return 0.3
+        if t in set(["ns", "nt"]):
+            return 3
+        if t in set(["n"]):
+            return 2
+        if re.match(r"[0-9-]+", t):
+            return 2
+        return 1
+
+    def _freq(self, t):
+        if re.match(r"[0-9. -]{2,}$", t):
+            return 3
+        s = rag_tokenizer.freq(t)
+        if not s and re.match(r"[a-z. -]+$", t):
+            return 300
+        if not s:
+            s = 0
+
+        if not s and len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                s = np.min([self._freq(tt) for tt in s]) / 6.
+            else:
                 s = 0
 
-            if not s and len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    s = np.min([freq(tt) for tt in s]) / 6.
-                else:
-                    s = 0
-
-            return max(s, 10)
-
-        def df(t):
-            if re.match(r"[0-9. -]{2,}$", t):
-                return 5
-            if t in self.df:
-                return self.df[t] + 3
-            elif re.match(r"[a-z. -]+$", t):
-                return 300
-            elif len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    return max(3, np.min([df(tt) for tt in s]) / 6.)
+        return max(s, 10)
 
-            return 3
+    def _df(self, t):
+        if re.match(r"[0-9. -]{2,}$", t):
+            return 5
+        if t in self.df:
+            return self.df[t] + 3
+        elif re.match(r"[a-z. -]+$", t):
+            return 300
+        elif len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                return max(3, np.min([self._df(tt) for tt in s]) / 6.)
+
+        return 3
 
+    def _token_weight(self, t):
         def idf(s, N): return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
 
+        return (0.3 * idf(self._freq(t), 10000000) + 0.7 * idf(self._df(t), 1000000000)) * \
+            (self._ner(t) * self._postag(t))
+
+    def weights(self, tks, preprocess=True):
+        # The un-normalized weight of a token only depends on the token itself,
+        # so it is looked up from the memoized table built by `_token_weight`.
         tw = []
         if not preprocess:
-            idf1 = np.array([idf(freq(t), 10000000) for t in tks])
-            idf2 = np.array([idf(df(t), 1000000000) for t in tks])
-            wts = (0.3 * idf1 + 0.7 * idf2) * \
-                np.array([ner(t) * postag(t) for t in tks])
-            wts = [s for s in wts]
-            tw = list(zip(tks, wts))
+            tw = [(t, self.token_weight(t)) for t in tks]
         else:
             for tk in tks:
                 tt = self.tokenMerge(self.pretoken(tk, True))
-                idf1 = np.array([idf(freq(t), 10000000) for t in tt])
-                idf2 = np.array([idf(df(t), 1000000000) for t in tt])
-                wts = (0.3 * idf1 + 0.7 * idf2) * \
-                    np.array([ner(t) * postag(t) for t in tt])
-                wts = [s for s in wts]
-                tw.extend(zip(tt, wts))
+                tw.extend([(t, self.token_weight(t)) for t in tt])
 
         S = np.sum([s for _, s in tw])
         return [(t, s / S) for t, s in tw]
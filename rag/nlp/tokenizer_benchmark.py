@@ -0,0 +1,97 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Compares the DFS segmentation of RagTokenizer with the DP one, and the
+single-process tokenizer with `tokenize_many` over a process pool.
+
+    python rag/nlp/tokenizer_benchmark.py --corpus /path/to/txt_dir --processes 8
+Without --corpus, a few built-in Chinese/English paragraphs are used.
+"""
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import time
+
+from rag.nlp import rag_tokenizer
+
+SAMPLES = [
+    "公开征求意见稿提出，境外投资者可使用自有人民币或外汇投资。使用外汇投资的，可通过债券持有人在香港人民币业务清算行及香港地区经批准可进入境内银行间外汇市场进行交易的境外人民币业务参加行（以下统称香港结算行）办理外汇资金兑换。",
+    "多校划片就是一个小区对应多个小学初中，让买了学区房的家庭也不确定到底能上哪个学校。目的是通过这种方式为学区房降温，把就近入学落到实处。南京市长江大桥",
+    "实际上当时他们已经将业务中心偏移到安全部门和针对政府企业的部门 Scripts are compiled and cached aaaaaaaaa",
+    "涡轮增压发动机num最大功率,不像别的共享买车锁电子化的手段,我们接过来是否有意义,黄黄爱美食,不过，今天阿奇要讲到的这家农贸市场，说实话，还真蛮有特色的！",
+    "数据分析项目经理|数据分析挖掘|数据分析方向|商品数据分析|搜索数据分析 sql python hive tableau Cocos2d-",
+]
+
+
+def load_corpus(paths, chunk_size):
+    texts = []
+    for p in paths:
+        fnms = [os.path.join(p, f) for f in sorted(os.listdir(p))] if os.path.isdir(p) else [p]
+        for fnm in fnms:
+            with open(fnm, "r", encoding="utf-8", errors="ignore") as f:
+                txt = f.read()
+            texts.extend([txt[i: i + chunk_size] for i in range(0, len(txt), chunk_size)])
+    return texts
+
+
+def run(tknzr, texts):
+    st = time.perf_counter()
+    tks = [tknzr.tokenize(t) for t in texts]
+    fine = [tknzr.fine_grained_tokenize(t) for t in tks]
+    return tks, fine, time.perf_counter() - st
+
+
+def main(args):
+    texts = load_corpus(args.corpus, args.chunk_size) if args.corpus else SAMPLES * args.repeat
+    nchars = sum(len(t) for t in texts)
+    print(f"{len(texts)} texts, {nchars} characters")
+
+    legacy = rag_tokenizer.RagTokenizer()
+    legacy.segment_ = legacy.dfs_segment_
+    tks0, fine0, el0 = run(legacy, texts)
+    print(f"DFS segmentation : {el0:.3f}s, {nchars / el0:.0f} chars/s")
+
+    tks1, fine1, el1 = run(rag_tokenizer.tokenizer, texts)
+    print(f"DP segmentation  : {el1:.3f}s, {nchars / el1:.0f} chars/s")
+    diff = sum(int(a != b) for a, b in zip(tks0 + fine0, tks1 + fine1))
+    print(f"Different outputs: {diff}")
+
+    if args.processes > 1:
+        st = time.perf_counter()
+        tks2 = rag_tokenizer.tokenize_many(texts, processes=args.processes)
+        fine2 = rag_tokenizer.fine_grained_tokenize_many(tks2, processes=args.processes)
+        el2 = time.perf_counter() - st
+        print(f"tokenize_many({args.processes} processes): {el2:.3f}s, {nchars / el2:.0f} chars/s")
+        diff = sum(int(a != b) for a, b in zip(tks1 + fine1, tks2 + fine2))
+        print(f"Different outputs: {diff}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', nargs="*", help="text files or directories of text files", default=[])
+    parser.add_argument('--chunk_size', type=int, help="characters per text", default=512)
+    parser.add_argument('--repeat', type=int, help="times to repeat the built-in samples", default=200)
+    parser.add_argument('--processes', type=int, help="worker processes for tokenize_many", default=os.cpu_count())
+    main(parser.parse_args())
@@ -55,12 +55,17 @@ from api.db.services.file2document_service import File2DocumentService
 from api import settings
 from api.versions import get_ragflow_version
 from api.db.db_models import close_connection
+from deepdoc.parser.analysis_cache import PdfAnalysisCache
+from deepdoc.parser.pdf_parser import RAGFlowPdfParser
 from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, \
     email, tag
 from rag.nlp import search, rag_tokenizer
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
-from rag.settings import DOC_MAXIMUM_SIZE, DOC_BULK_SIZE, EMBEDDING_BATCH_SIZE, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, get_svr_queue_names, print_rag_settings, TAG_FLD, PAGERANK_FLD
-from rag.utils import num_tokens_from_string, truncate
+from rag.settings import DOC_MAXIMUM_SIZE, DOC_BULK_SIZE, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS, \
+    EMBEDDING_BATCH_MAX_WAIT, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, get_svr_queue_names, print_rag_settings, TAG_FLD, PAGERANK_FLD
+from rag.utils import num_tokens_from_string
+from rag.utils.embedding_batcher import EmbeddingBatcher
+from rag.utils.embedding_cache import EMBD_CACHE
 from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
 from rag.utils.storage_factory import STORAGE_IMPL
 from graphrag.utils import chat_limiter
@@ -106,7 +111,9 @@ chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 embed_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 minio_limiter = trio.CapacityLimiter(MAX_CONCURRENT_MINIO)
 kg_limiter = trio.CapacityLimiter(2)
+embedding_batcher = EmbeddingBatcher(EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_MAX_WAIT, limiter=embed_limiter)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
+PDF_ANALYSIS_CACHE = int(os.environ.get('PDF_ANALYSIS_CACHE', "0"))
 stop_event = threading.Event()
 
 
@@ -421,6 +428,20 @@ def init_kb(row, vector_size: int):
     return settings.docStoreConn.createIdx(idxnm, row.get("kb_id", ""), vector_size)
 
 
+async def cached_encode(mdl, txts, callback=None):
+    cached = await trio.to_thread.run_sync(lambda: EMBD_CACHE.get_many(mdl.llm_name, txts))
+    missing = [i for i, v in enumerate(cached) if v is None]
+    tk_count = 0
+    if missing:
+        vts, tk_count = await embedding_batcher.encode(mdl, [txts[i] for i in missing], callback)
+        await trio.to_thread.run_sync(lambda: EMBD_CACHE.set_many(mdl.llm_name, [txts[i] for i in missing], vts))
+        for i, v in zip(missing, vts):
+            cached[i] = v
+    if len(missing) < len(txts):
+        logging.info(f"Embedding cache hit {len(txts) - len(missing)}/{len(txts)} texts of {mdl.llm_name}")
+    return np.array(cached, dtype=np.float32), tk_count
+
+
 async def embedding(docs, mdl, parser_config=None, callback=None):
     if parser_config is None:
         parser_config = {}
@@ -437,26 +458,17 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
 
     tk_count = 0
     if len(tts) == len(cnts):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(tts[0: 1]))
+        vts, c = await cached_encode(mdl, tts[0: 1])
         tts = np.concatenate([vts for _ in range(len(tts))], axis=0)
         tk_count += c
 
-    @timeout(60)
-    def batch_encode(txts):
-        nonlocal mdl
-        return mdl.encode([truncate(c, mdl.max_length-10) for c in txts])
-
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), EMBEDDING_BATCH_SIZE):
-        async with embed_limiter:
-            vts, c = await trio.to_thread.run_sync(lambda: batch_encode(cnts[i: i + EMBEDDING_BATCH_SIZE]))
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
-        tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
-    cnts = cnts_
+    # Chunks of all the concurrent tasks are merged into full batches by the shared batcher.
+    def report(done, total):
+        if callback:
+            callback(prog=0.7 + 0.2 * done / total, msg="")
+
+    cnts, c = await cached_encode(mdl, cnts, report)
+    tk_count += c
     filename_embd_weight = parser_config.get("filename_embd_weight", 0.1) # due to the db support none value
     if not filename_embd_weight:
         filename_embd_weight = 0.1
@@ -706,6 +718,7 @@ async def report_status():
                 "done": DONE_TASKS,
                 "failed": FAILED_TASKS,
                 "current": current,
+                "embedding": embedding_batcher.stats(),
             })
             REDIS_CONN.zadd(CONSUMER_NAME, heartbeat, now.timestamp())
             logging.info(f"{CONSUMER_NAME} reported heartbeat: {heartbeat}")
@@ -758,6 +771,9 @@ async def main():
     TRACE_MALLOC_ENABLED = int(os.environ.get('TRACE_MALLOC_ENABLED', "0"))
     if TRACE_MALLOC_ENABLED:
         start_tracemalloc_and_snapshot(None, None)
+    if PDF_ANALYSIS_CACHE:
+        # Page ranges of PDFs parsed before (re-chunking, retries) skip OCR and layout detection.
+        RAGFlowPdfParser.analysis_cache = PdfAnalysisCache(STORAGE_IMPL)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -0,0 +1,105 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cache of the configuration a chat resolves before answering: model bundles,
+tenant LLM configs, Langfuse tracers and field maps of knowledge bases.
+
+Every entry depends on scopes, "tenant:<id>" and "kb:<id>", each with a version
+in Redis that the services writing those rows bump through `invalidate`
+("tenants" stands for writes which can't tell the tenant). An entry is served
+only while the versions it was loaded with are current, which a single MGET
+tells, and CONFIG_CACHE_TTL bounds its life anyway, e.g. for rows changed
+straight in MySQL. Without Redis nothing is cached.
+"""
+import json
+import os
+import threading
+import time
+
+from cachetools import TTLCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+CONFIG_CACHE_SIZE = int(os.environ.get("CONFIG_CACHE_SIZE", 1024))
+CONFIG_CACHE_TTL = int(os.environ.get("CONFIG_CACHE_TTL", 300))
+# Must outlive cache entries: an expired version reads as "0" again.
+CONFIG_VERSION_TTL = max(7 * 24 * 3600, CONFIG_CACHE_TTL * 2)
+
+
+def _config_version_key(scope):
+    return f"config_version:{scope}"
+
+
+def tenant_scopes(tenant_id):
+    return ["tenants", f"tenant:{tenant_id}"]
+
+
+def kb_scopes(kb_ids):
+    return [f"kb:{kb_id}" for kb_id in sorted(set(kb_ids))]
+
+
+class ConfigCache:
+    def __init__(self, maxsize=CONFIG_CACHE_SIZE, ttl=CONFIG_CACHE_TTL):
+        self.enabled = maxsize > 0
+        self.cache = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def invalidate(self, *scopes):
+        """Invalidates the entries depending on any of the scopes, in every process."""
+        version = f"{time.time():.6f}"
+        for scope in set(scopes):
+            if not REDIS_CONN.set(_config_version_key(scope), version, CONFIG_VERSION_TTL):
+                # Without the version we can't tell stale entries, so drop this process's cache at least.
+                self.clear()
+
+    def get(self, kind, key, scopes, loader):
+        """`loader()`, cached under (kind, key) while the versions of `scopes` stay the same."""
+        if not self.enabled:
+            return loader()
+        versions = REDIS_CONN.mget([_config_version_key(s) for s in scopes]) if scopes else []
+        if versions is None:
+            return loader()
+        # Taken before loading: a write racing with the load leaves an entry which is already stale.
+        version = json.dumps([v or "0" for v in versions])
+        with self.lock:
+            counter = self.counters.setdefault(kind, {"hits": 0, "misses": 0, "invalidated": 0})
+            ent = self.cache.get((kind, key))
+            if ent is not None and ent[0] == version:
+                counter["hits"] += 1
+                return ent[1]
+            if ent is not None:
+                counter["invalidated"] += 1
+            counter["misses"] += 1
+        value = loader()
+        with self.lock:
+            self.cache[(kind, key)] = (version, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def stats(self):
+        res = {"size": len(self.cache)}
+        with self.lock:
+            for kind, counter in self.counters.items():
+                total = counter["hits"] + counter["misses"]
+                res[kind] = dict(counter, hit_ratio=round(counter["hits"] / total, 4) if total else 0.0)
+        return res
+
+
+CONFIG_CACHE = ConfigCache()
@@ -208,6 +208,20 @@ class DocStoreConnection(ABC):
         """
         raise NotImplementedError("Not implemented")
 
+    def scan(self, selectFields: list[str], condition: dict, indexNames: str|list[str], knowledgebaseIds: list[str], pageSize: int = 1024):
+        """
+        Yields the pages of all the documents matching `condition`, each a search result
+        """
+        offset = 0
+        while True:
+            res = self.search(selectFields, [], dict(condition), [], OrderByExpr(), offset, pageSize, indexNames, knowledgebaseIds)
+            n = len(self.getChunkIds(res))
+            if n:
+                yield res
+            if n < pageSize:
+                break
+            offset += pageSize
+
     @abstractmethod
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
         """
@@ -0,0 +1,264 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cross-task embedding micro-batcher.
+
+Every task running in a task executor submits its texts to a shared queue per
+embedding model. Pending texts from all concurrent tasks are merged into full
+batches, bounded by a text count and a token budget, and flushed either when a
+batch is full or when the oldest pending text has waited `max_wait` seconds.
+Vectors are routed back to the submitting task in order.
+
+There is no background flusher: every caller waits until its own texts are
+encoded and, while waiting, flushes whatever batch is ready. Since the owner of
+any pending text is always waiting, somebody is always around to flush it.
+"""
+import logging
+from collections import deque
+from timeit import default_timer as timer
+
+import numpy as np
+import trio
+
+from api.utils.api_utils import timeout
+from rag.utils import num_tokens_from_string, truncate
+
+
+class _Request:
+    __slots__ = ("vectors", "tokens", "remaining", "error", "done")
+
+    def __init__(self, n):
+        self.vectors = [None] * n
+        self.tokens = 0
+        self.remaining = n
+        self.error = None
+        self.done = trio.Event()
+
+
+class _Item:
+    __slots__ = ("mdl", "text", "tokens", "request", "index", "enqueued_at")
+
+    def __init__(self, mdl, text, tokens, request, index, enqueued_at):
+        self.mdl = mdl
+        self.text = text
+        self.tokens = tokens
+        self.request = request
+        self.index = index
+        self.enqueued_at = enqueued_at
+
+
+class _ModelStats:
+    __slots__ = ("batches", "texts", "tokens", "encode_seconds", "wait_seconds", "full_batches", "errors")
+
+    def __init__(self):
+        self.batches = 0
+        self.texts = 0
+        self.tokens = 0
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.full_batches = 0
+        self.errors = 0
+
+    def to_dict(self, batch_size):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "tokens": self.tokens,
+            "errors": self.errors,
+            "avg_batch_fill": round(self.texts / (self.batches * batch_size), 3) if self.batches else 0.0,
+            "full_batch_ratio": round(self.full_batches / self.batches, 3) if self.batches else 0.0,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.texts, 2) if self.texts else 0.0,
+            "texts_per_second": round(self.texts / self.encode_seconds, 2) if self.encode_seconds else 0.0,
+            "tokens_per_second": round(self.tokens / self.encode_seconds, 2) if self.encode_seconds else 0.0,
+        }
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.items = deque()
+        self.pending_tokens = 0
+        self.wakeup = trio.Event()
+
+    def notify(self):
+        self.wakeup.set()
+        self.wakeup = trio.Event()
+
+
+class EmbeddingBatcher:
+    def __init__(self, batch_size=16, max_tokens=8192, max_wait=0.05, limiter=None, encode_timeout=60):
+        self.batch_size = max(1, int(batch_size))
+        self.max_tokens = max(1, int(max_tokens))
+        self.max_wait = max(0.0, float(max_wait))
+        self.limiter = limiter
+        self.encode_timeout = encode_timeout
+        self._queues = {}
+        self._stats = {}
+
+    @staticmethod
+    def model_key(mdl):
+        # Texts are only merged for the same tenant and model so that API keys
+        # and token usage accounting stay with the owner of the bundle.
+        return getattr(mdl, "tenant_id", None), getattr(mdl, "llm_name", None) or id(mdl)
+
+    def _queue(self, mdl):
+        key = self.model_key(mdl)
+        if key not in self._queues:
+            self._queues[key] = _ModelQueue()
+            self._stats.setdefault(str(key[1]), _ModelStats())
+        return self._queues[key]
+
+    async def encode(self, mdl, texts, callback=None):
+        """
+        Encode `texts` with `mdl`, sharing batches with other concurrent callers.
+        Returns `(vectors, used_tokens)` just like `LLMBundle.encode`.
+        `callback(done, total)` is called as the caller's texts get encoded.
+        """
+        if not texts:
+            return np.array([]), 0
+
+        q = self._queue(mdl)
+        req = _Request(len(texts))
+        now = timer()
+        max_length = getattr(mdl, "max_length", None)
+        for i, t in enumerate(texts):
+            if max_length:
+                t = truncate(t, max_length - 10)
+            tokens = num_tokens_from_string(t)
+            q.items.append(_Item(mdl, t, tokens, req, i, now))
+            q.pending_tokens += tokens
+        q.notify()
+
+        reported = 0
+        while not req.done.is_set():
+            batch = self._take_ready(q, timer())
+            if batch:
+                await self._flush(q, batch, req)
+            elif q.items:
+                with trio.move_on_at(trio.current_time() + self._time_left(q, timer())):
+                    await q.wakeup.wait()
+            else:
+                # All of our texts are being encoded by other callers.
+                await q.wakeup.wait()
+            if callback and req.remaining < len(texts) - reported:
+                reported = len(texts) - req.remaining
+                callback(reported, len(texts))
+
+        if req.error is not None:
+            raise req.error
+        return np.array(req.vectors), req.tokens
+
+    def _time_left(self, q, now):
+        return max(0.0, q.items[0].enqueued_at + self.max_wait - now)
+
+    def _take_ready(self, q, now):
+        if not q.items:
+            return None
+        full = len(q.items) >= self.batch_size or q.pending_tokens >= self.max_tokens
+        if not full and self._time_left(q, now) > 0:
+            return None
+
+        batch, tokens = [], 0
+        while q.items and len(batch) < self.batch_size:
+            it = q.items[0]
+            if batch and tokens + it.tokens > self.max_tokens:
+                break
+            q.items.popleft()
+            q.pending_tokens -= it.tokens
+            tokens += it.tokens
+            batch.append(it)
+        return batch
+
+    def _encode(self, mdl, txts):
+        @timeout(self.encode_timeout)
+        def batch_encode():
+            return mdl.encode(txts)
+
+        return batch_encode()
+
+    async def _flush(self, q, batch, owner):
+        stats = self._stats[str(self.model_key(batch[0].mdl)[1])]
+        now = timer()
+        stats.wait_seconds += sum(now - it.enqueued_at for it in batch)
+        mdl = batch[0].mdl
+        txts = [it.text for it in batch]
+        st = timer()
+        try:
+            if self.limiter is not None:
+                async with self.limiter:
+                    vts, used_tokens = await trio.to_thread.run_sync(lambda: self._encode(mdl, txts))
+            else:
+                vts, used_tokens = await trio.to_thread.run_sync(lambda: self._encode(mdl, txts))
+            if len(vts) != len(batch):
+                raise ValueError(f"Embedding model returned {len(vts)} vectors for {len(batch)} texts")
+        except Exception as e:
+            stats.errors += 1
+            logging.exception(f"EmbeddingBatcher: encoding a batch of {len(batch)} texts with {self.model_key(mdl)} failed")
+            failed = set()
+            for it in batch:
+                it.request.error = e
+                failed.add(id(it.request))
+                self._done_one(it.request)
+            # Fail fast: drop the remaining queued texts of the failed callers.
+            for it in [it for it in q.items if id(it.request) in failed]:
+                q.items.remove(it)
+                q.pending_tokens -= it.tokens
+                self._done_one(it.request)
+            q.notify()
+            return
+        except BaseException:
+            # The flushing caller got cancelled: hand the texts of the other
+            # callers back to the queue so that they get flushed by their owners.
+            for it in reversed(batch):
+                if it.request is not owner:
+                    q.items.appendleft(it)
+                    q.pending_tokens += it.tokens
+            q.notify()
+            raise
+
+        elapsed = timer() - st
+        stats.batches += 1
+        stats.texts += len(batch)
+        stats.tokens += used_tokens
+        stats.encode_seconds += elapsed
+        if len(batch) == self.batch_size:
+            stats.full_batches += 1
+
+        total = sum(it.tokens for it in batch) or len(batch)
+        for it, v in zip(batch, vts):
+            req = it.request
+            req.vectors[it.index] = v
+            req.tokens += int(round(used_tokens * (it.tokens or 1) / total))
+            self._done_one(req)
+        q.notify()
+
+    @staticmethod
+    def _done_one(req):
+        req.remaining -= 1
+        if req.remaining <= 0:
+            req.done.set()
+
+    def stats(self):
+        res = {}
+        for (tenant_id, llm_name), q in self._queues.items():
+            k = str(llm_name)
+            res.setdefault(k, self._stats[k].to_dict(self.batch_size) | {"pending": 0})
+            res[k]["pending"] += len(q.items)
+        return res
+
+    def log_stats(self):
+        for k, v in self.stats().items():
+            logging.info(f"EmbeddingBatcher[{k}] {v}")
+
@@ -0,0 +1,136 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by (model name, xxhash of the whitespace-normalized text) and
+stored as raw float32 blobs. A memory-bounded LRU in front of Redis serves hot
+texts without a round-trip; Redis is accessed with a single MGET / pipelined
+SET per batch.
+"""
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import xxhash
+
+from rag.utils.redis_conn import REDIS_CONN
+
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 24 * 3600))
+EMBEDDING_CACHE_LOCAL_MB = int(os.environ.get("EMBEDDING_CACHE_LOCAL_MB", 64))
+
+
+def normalize_text(txt: str) -> str:
+    return re.sub(r"\s+", " ", str(txt)).strip()
+
+
+def cache_key(llm_name: str, txt: str) -> str:
+    hasher = xxhash.xxh64()
+    hasher.update(normalize_text(txt).encode("utf-8", "surrogatepass"))
+    return f"embd:{llm_name}:{hasher.hexdigest()}"
+
+
+class _LocalLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, k):
+        with self.lock:
+            v = self.data.get(k)
+            if v is not None:
+                self.data.move_to_end(k)
+            return v
+
+    def put(self, k, v: bytes):
+        if len(v) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.data.pop(k, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self.data[k] = v
+            self.nbytes += len(v)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.data.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+
+class EmbeddingCache:
+    def __init__(self, max_local_bytes=EMBEDDING_CACHE_LOCAL_MB * 1024 * 1024, ttl=EMBEDDING_CACHE_TTL):
+        self.local = _LocalLRU(max_local_bytes)
+        self.ttl = ttl
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def get_many(self, llm_name: str, texts: list[str]) -> list[np.ndarray | None]:
+        """Returns a float32 vector for every cached text, `None` for the others."""
+        keys = [cache_key(llm_name, t) for t in texts]
+        res = [None] * len(texts)
+        remote = []
+        for i, k in enumerate(keys):
+            v = self.local.get(k)
+            if v is None:
+                remote.append(i)
+                continue
+            res[i] = np.frombuffer(v, dtype=np.float32)
+            self.stats["local_hits"] += 1
+
+        if remote:
+            blobs = REDIS_CONN.mget_bytes([keys[i] for i in remote])
+            for i, v in zip(remote, blobs):
+                if not v:
+                    self.stats["misses"] += 1
+                    continue
+                self.local.put(keys[i], v)
+                res[i] = np.frombuffer(v, dtype=np.float32)
+                self.stats["redis_hits"] += 1
+        return res
+
+    def set_many(self, llm_name: str, texts: list[str], vectors):
+        mapping = {}
+        for t, v in zip(texts, vectors):
+            k = cache_key(llm_name, t)
+            v = np.asarray(v, dtype=np.float32).tobytes()
+            self.local.put(k, v)
+            mapping[k] = v
+        if mapping and not REDIS_CONN.mset_bytes(mapping, self.ttl):
+            logging.warning(f"EmbeddingCache.set_many failed to write {len(mapping)} vectors of {llm_name} to Redis")
+
+    def get(self, llm_name: str, txt: str) -> np.ndarray | None:
+        return self.get_many(llm_name, [txt])[0]
+
+    def set(self, llm_name: str, txt: str, vector):
+        self.set_many(llm_name, [txt], [vector])
+
+    def encode_queries(self, mdl, txt: str):
+        if not getattr(mdl, "llm_name", None):
+            return mdl.encode_queries(txt)
+        # Some models embed queries differently from documents, keep them apart.
+        llm_name = f"{mdl.llm_name}#query"
+        v = self.get(llm_name, txt)
+        if v is not None:
+            return v, 0
+        v, used_tokens = mdl.encode_queries(txt)
+        self.set(llm_name, txt, v)
+        return np.asarray(v, dtype=np.float32), used_tokens
+
+
+EMBD_CACHE = EmbeddingCache()
@@ -15,9 +15,13 @@
 #
 
 import asyncio
+import json
 import logging
+import os
 import threading
+import time
 import weakref
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import TimeoutError as FuturesTimeoutError
 from string import Template
@@ -32,9 +36,25 @@ from mcp.client.streamable_http import streamablehttp_client
 from mcp.types import CallToolResult, ListToolsResult, TextContent, Tool
 from rag.llm.chat_model import ToolCallSession
 
-MCPTaskType = Literal["list_tools", "tool_call"]
+MCPTaskType = Literal["list_tools", "tool_call", "ping"]
 MCPTask = tuple[MCPTaskType, dict[str, Any], asyncio.Queue[Any]]
 
+# Calls a session sends to its server at the same time, the others wait in its queue.
+MCP_MAX_CONCURRENT_CALLS = int(os.environ.get("MCP_MAX_CONCURRENT_CALLS", 8))
+MCP_SESSION_IDLE_TIMEOUT = int(os.environ.get("MCP_SESSION_IDLE_TIMEOUT", 300))
+MCP_SESSION_HEALTH_INTERVAL = int(os.environ.get("MCP_SESSION_HEALTH_INTERVAL", 60))
+
+
+def resolve_headers(mcp_server: Any, server_variables: dict[str, Any]) -> dict[str, str]:
+    raw_headers: dict[str, str] = mcp_server.headers or {}
+    headers: dict[str, str] = {}
+
+    for h, v in raw_headers.items():
+        nh = Template(h).safe_substitute(server_variables)
+        nv = Template(v).safe_substitute(server_variables)
+        headers[nh] = nv
+    return headers
+
 
 class MCPToolCallSession(ToolCallSession):
     _ALL_INSTANCES: weakref.WeakSet["MCPToolCallSession"] = weakref.WeakSet()
@@ -46,6 +66,11 @@ class MCPToolCallSession(ToolCallSession):
         self._server_variables = server_variables or {}
         self._queue = asyncio.Queue()
         self._close = False
+        self._error: str | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._in_use = 0
+        self._in_use_lock = threading.Lock()
+        self.last_used = time.time()
 
         self._event_loop = asyncio.new_event_loop()
         self._thread_pool = ThreadPoolExecutor(max_workers=1)
@@ -55,13 +80,7 @@ class MCPToolCallSession(ToolCallSession):
 
     async def _mcp_server_loop(self) -> None:
         url = self._mcp_server.url.strip()
-        raw_headers: dict[str, str] = self._mcp_server.headers or {}
-        headers: dict[str, str] = {}
-
-        for h, v in raw_headers.items():
-            nh = Template(h).safe_substitute(self._server_variables)
-            nv = Template(v).safe_substitute(self._server_variables)
-            headers[nh] = nv
+        headers = resolve_headers(self._mcp_server, self._server_variables)
 
         if self._mcp_server.server_type == MCPServerType.SSE:
             # SSE transport
@@ -101,6 +120,9 @@ class MCPToolCallSession(ToolCallSession):
             await self._process_mcp_tasks(None, f"Unsupported MCP server type: {self._mcp_server.server_type}, id: {self._mcp_server.id}")
 
     async def _process_mcp_tasks(self, client_session: ClientSession | None, error_message: str | None = None) -> None:
+        if not client_session or error_message:
+            self._error = error_message or "No MCP client session."
+        semaphore = asyncio.Semaphore(MCP_MAX_CONCURRENT_CALLS)
         while not self._close:
             try:
                 mcp_task, arguments, result_queue = await asyncio.wait_for(self._queue.get(), timeout=1)
@@ -109,24 +131,33 @@ class MCPToolCallSession(ToolCallSession):
 
             logging.debug(f"Got MCP task {mcp_task} arguments {arguments}")
 
-            r: Any = None
-
-            if not client_session or error_message:
-                r = ValueError(error_message)
-                await result_queue.put(r)
+            if self._error:
+                await result_queue.put(ValueError(self._error))
                 continue
 
-            try:
-                if mcp_task == "list_tools":
-                    r = await client_session.list_tools()
-                elif mcp_task == "tool_call":
-                    r = await client_session.call_tool(**arguments)
-                else:
-                    r = ValueError(f"Unknown MCP task {mcp_task}")
-            except Exception as e:
-                r = e
+            # Tasks of the callers sharing this session run side by side, up to MCP_MAX_CONCURRENT_CALLS.
+            await semaphore.acquire()
+            task = asyncio.create_task(self._run_mcp_task(client_session, mcp_task, arguments, result_queue, semaphore))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
-            await result_queue.put(r)
+    async def _run_mcp_task(self, client_session: ClientSession, mcp_task: MCPTaskType, arguments: dict[str, Any], result_queue: asyncio.Queue, semaphore: asyncio.Semaphore) -> None:
+        r: Any = None
+        try:
+            if mcp_task == "list_tools":
+                r = await client_session.list_tools()
+            elif mcp_task == "tool_call":
+                r = await client_session.call_tool(**arguments)
+            elif mcp_task == "ping":
+                r = await client_session.send_ping()
+            else:
+                r = ValueError(f"Unknown MCP task {mcp_task}")
+        except Exception as e:
+            r = e
+        finally:
+            semaphore.release()
+
+        await result_queue.put(r)
 
     async def _call_mcp_server(self, task_type: MCPTaskType, timeout: float | int = 8, **kwargs) -> Any:
         results = asyncio.Queue()
@@ -161,7 +192,45 @@ class MCPToolCallSession(ToolCallSession):
         except Exception:
             raise
 
+    def acquire(self) -> None:
+        with self._in_use_lock:
+            self._in_use += 1
+
+    def release(self) -> None:
+        with self._in_use_lock:
+            self._in_use -= 1
+            self.last_used = time.time()
+
+    @contextmanager
+    def _using(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def in_use(self) -> bool:
+        return self._in_use > 0
+
+    def healthy(self) -> bool:
+        return not self._close and self._error is None
+
+    def ping(self, timeout: float | int = 5) -> bool:
+        if not self.healthy():
+            return False
+        future = asyncio.run_coroutine_threadsafe(self._call_mcp_server("ping", timeout=timeout), self._event_loop)
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception as e:
+            logging.warning(f"Ping of MCP server {self._mcp_server.id} failed: {e}")
+            return False
+
     def get_tools(self, timeout: float | int = 10) -> list[Tool]:
+        with self._using():
+            return self._get_tools(timeout)
+
+    def _get_tools(self, timeout: float | int = 10) -> list[Tool]:
         future = asyncio.run_coroutine_threadsafe(self._get_tools_from_mcp_server(timeout=timeout), self._event_loop)
         try:
             return future.result(timeout=timeout)
@@ -175,6 +244,10 @@ class MCPToolCallSession(ToolCallSession):
 
     @override
     def tool_call(self, name: str, arguments: dict[str, Any], timeout: float | int = 10) -> str:
+        with self._using():
+            return self._tool_call(name, arguments, timeout)
+
+    def _tool_call(self, name: str, arguments: dict[str, Any], timeout: float | int = 10) -> str:
         future = asyncio.run_coroutine_threadsafe(self._call_mcp_tool(name, arguments), self._event_loop)
         try:
             return future.result(timeout=timeout)
@@ -227,8 +300,125 @@ def close_multiple_mcp_toolcall_sessions(sessions: list[MCPToolCallSession]) ->
     logging.info(f"{len(sessions)} MCP sessions has been cleaned up. {len(list(MCPToolCallSession._ALL_INSTANCES))} in global context.")
 
 
+def close_mcp_toolcall_sessions_in_background(sessions: list[MCPToolCallSession]) -> None:
+    if sessions:
+        threading.Thread(target=close_multiple_mcp_toolcall_sessions, args=(sessions,), daemon=True).start()
+
+
+class MCPSessionPool:
+    """
+    Sessions shared by all the agents of the process, one per MCP server and
+    resolved headers, so a canvas doesn't start a loop and redo the MCP
+    handshake for each of its servers every time it's built.
+
+    A reaper evicts the sessions idle for MCP_SESSION_IDLE_TIMEOUT and pings
+    the others every MCP_SESSION_HEALTH_INTERVAL, evicting those which don't
+    answer. A session which is evicted or failed to connect is replaced on
+    its next use.
+    """
+
+    def __init__(self, idle_timeout: float | int = MCP_SESSION_IDLE_TIMEOUT, health_interval: float | int = MCP_SESSION_HEALTH_INTERVAL) -> None:
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self._sessions: dict[tuple, MCPToolCallSession] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper: threading.Thread | None = None
+
+    @staticmethod
+    def _key(mcp_server: Any, server_variables: dict[str, Any]) -> tuple:
+        headers = resolve_headers(mcp_server, server_variables)
+        return mcp_server.id, mcp_server.server_type, mcp_server.url.strip(), json.dumps(headers, sort_keys=True)
+
+    @contextmanager
+    def checkout(self, mcp_server: Any, server_variables: dict[str, Any] | None = None):
+        """The pooled session of the server, held in use until the block ends so the reaper leaves it be."""
+        server_variables = server_variables or {}
+        key = self._key(mcp_server, server_variables)
+        stale = None
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or not session.healthy():
+                stale = session
+                session = MCPToolCallSession(mcp_server, server_variables)
+                self._sessions[key] = session
+            # Marked under the pool lock: the reaper can't evict it between here and the call.
+            session.acquire()
+            if self._reaper is None and not self._stop.is_set():
+                self._reaper = threading.Thread(target=self._reap, name="mcp_session_reaper", daemon=True)
+                self._reaper.start()
+        close_mcp_toolcall_sessions_in_background([stale] if stale else [])
+        try:
+            yield session
+        finally:
+            session.release()
+
+    def session(self, mcp_server: Any, server_variables: dict[str, Any] | None = None) -> "PooledMCPToolCallSession":
+        return PooledMCPToolCallSession(self, mcp_server, server_variables)
+
+    def evict(self, server_id: str) -> None:
+        """Drops the sessions of a server, e.g. once it's updated or removed."""
+        with self._lock:
+            evicted = [self._sessions.pop(k) for k in list(self._sessions.keys()) if k[0] == server_id]
+        close_mcp_toolcall_sessions_in_background(evicted)
+
+    def _reap(self) -> None:
+        while not self._stop.wait(min(self.health_interval, self.idle_timeout)):
+            now = time.time()
+            with self._lock:
+                sessions = list(self._sessions.items())
+            evicted = []
+            for key, session in sessions:
+                if session.in_use():
+                    continue
+                idle = now - session.last_used >= self.idle_timeout
+                if not idle and session.ping():
+                    continue
+                with self._lock:
+                    # An idle session may have been taken again meanwhile.
+                    if self._sessions.get(key) is session and not session.in_use() and (not idle or time.time() - session.last_used >= self.idle_timeout):
+                        evicted.append(self._sessions.pop(key))
+            if evicted:
+                logging.info(f"Evict {len(evicted)} idle or broken MCP sessions.")
+                close_multiple_mcp_toolcall_sessions(evicted)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "in_use": sum(int(s.in_use()) for s in self._sessions.values())}
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        if sessions:
+            close_multiple_mcp_toolcall_sessions(sessions)
+
+
+class PooledMCPToolCallSession(ToolCallSession):
+    """What agents hold: every call goes to the current pooled session of the server."""
+
+    def __init__(self, pool: MCPSessionPool, mcp_server: Any, server_variables: dict[str, Any] | None = None) -> None:
+        self._pool = pool
+        self._mcp_server = mcp_server
+        self._server_variables = server_variables or {}
+
+    def get_tools(self, timeout: float | int = 10) -> list[Tool]:
+        with self._pool.checkout(self._mcp_server, self._server_variables) as session:
+            return session.get_tools(timeout)
+
+    @override
+    def tool_call(self, name: str, arguments: dict[str, Any], timeout: float | int = 10) -> str:
+        with self._pool.checkout(self._mcp_server, self._server_variables) as session:
+            return session.tool_call(name, arguments, timeout)
+
+
+MCP_SESSION_POOL = MCPSessionPool()
+
+
 def shutdown_all_mcp_sessions():
     """Gracefully shutdown all active MCPToolCallSession instances."""
+    MCP_SESSION_POOL.shutdown()
     sessions = list(MCPToolCallSession._ALL_INSTANCES)
     if not sessions:
         logging.info("No MCPToolCallSession instances to close.")
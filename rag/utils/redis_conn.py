@@ -61,6 +61,7 @@ class RedisDB:
 
     def __init__(self):
         self.REDIS = None
+        self.REDIS_RAW = None
         self.config = settings.REDIS
         self.__open__()
 
@@ -78,6 +79,14 @@ class RedisDB:
                 password=self.config.get("password"),
                 decode_responses=True,
             )
+            # Shares the connection settings, but hands back bytes for binary payloads.
+            self.REDIS_RAW = redis.StrictRedis(
+                host=self.config["host"].split(":")[0],
+                port=int(self.config.get("host", ":6379").split(":")[1]),
+                db=int(self.config.get("db", 1)),
+                password=self.config.get("password"),
+                decode_responses=False,
+            )
             self.register_scripts()
         except Exception:
             logging.warning("Redis can't be connected.")
@@ -112,6 +121,40 @@ class RedisDB:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def mget(self, keys: list[str]) -> list[str | None] | None:
+        if not self.REDIS:
+            return None
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(len(keys)) + " keys got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def mget_bytes(self, keys: list[str]) -> list[bytes | None]:
+        if not self.REDIS_RAW or not keys:
+            return [None] * len(keys)
+        try:
+            return self.REDIS_RAW.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget_bytes " + str(len(keys)) + " keys got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
+    def mset_bytes(self, mapping: dict[str, bytes], exp=3600):
+        if not self.REDIS_RAW or not mapping:
+            return False
+        try:
+            pipeline = self.REDIS_RAW.pipeline(transaction=False)
+            for k, v in mapping.items():
+                pipeline.set(k, v, exp)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.mset_bytes " + str(len(mapping)) + " keys got exception: " + str(e))
+            self.__open__()
+        return False
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.REDIS.set(k, json.dumps(obj, ensure_ascii=False), exp)
@@ -210,6 +253,30 @@ class RedisDB:
             self.__open__()
         return False
 
+    def stream_append(self, key: str, message, maxlen: int, exp=3600) -> str | None:
+        """Appends `message` to the stream `key`, keeping about its last `maxlen` entries. Returns the entry id."""
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            pipeline.xadd(key, {"message": json.dumps(message, ensure_ascii=False)}, maxlen=maxlen, approximate=True)
+            pipeline.expire(key, exp)
+            return pipeline.execute()[0]
+        except Exception as e:
+            logging.warning("RedisDB.stream_append " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def stream_read(self, key: str, cursor: str = "0", count: int | None = None) -> list[tuple[str, object]] | None:
+        """The (entry id, message) of the stream `key` appended after the entry id `cursor`."""
+        try:
+            res = self.REDIS.xread({key: cursor}, count=count)
+            if not res:
+                return []
+            return [(msg_id, json.loads(payload["message"])) for msg_id, payload in res[0][1]]
+        except Exception as e:
+            logging.warning("RedisDB.stream_read " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
     def queue_product(self, queue, message) -> bool:
         for _ in range(3):
             try:
@@ -0,0 +1,196 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Retrieval result cache.
+
+Every knowledge base has a version in Redis, the time of its last write, which
+the doc store connections bump whenever chunks are inserted, updated or
+deleted. Cached results of `Dealer.retrieval` are keyed by the request *and*
+the current versions of the knowledge bases it reads, so a single MGET tells
+whether an entry is still valid and stale entries simply age out of the LRU.
+Right after a write the doc store may not have refreshed yet, so nothing is
+cached for a knowledge base written less than RETRIEVAL_CACHE_SETTLE seconds ago.
+
+The cache is bounded by the approximate size of its entries rather than by their
+count: a page of chunks with their vectors weighs far more than a short answer.
+Vectors are kept as float32 arrays and only turned back into lists on a hit.
+"""
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import xxhash
+from cachetools import TTLCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+RETRIEVAL_CACHE_MAX_MB = int(os.environ.get("RETRIEVAL_CACHE_MAX_MB", 256))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 3600))
+RETRIEVAL_CACHE_SETTLE = float(os.environ.get("RETRIEVAL_CACHE_SETTLE", 2))
+# Must outlive cache entries: an expired version reads as "0" again.
+KB_VERSION_TTL = max(7 * 24 * 3600, RETRIEVAL_CACHE_TTL * 2)
+
+
+def _kb_version_key(kb_id):
+    return f"kb_version:{kb_id}"
+
+
+def bump_kb_version(kb_ids):
+    """Invalidates cached retrievals over the given knowledge bases."""
+    if not kb_ids:
+        return
+    if isinstance(kb_ids, str):
+        kb_ids = [kb_ids]
+    version = f"{time.time():.6f}"
+    for kb_id in set(kb_ids):
+        if not REDIS_CONN.set(_kb_version_key(kb_id), version, KB_VERSION_TTL):
+            # Without the counter we can't tell stale entries, so drop this process's cache at least.
+            RETRIEVAL_CACHE.clear()
+
+
+def get_kb_versions(kb_ids) -> list[str] | None:
+    versions = REDIS_CONN.mget([_kb_version_key(kb_id) for kb_id in kb_ids])
+    if versions is None:
+        return None
+    return [v or "0" for v in versions]
+
+
+def invalidates_kb(func):
+    """For doc store writes taking a `knowledgebaseId` argument: bumps its version once the write returns."""
+    sig = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            bump_kb_version(sig.bind(*args, **kwargs).arguments.get("knowledgebaseId"))
+
+    return wrapper
+
+
+class RetrievalCache:
+    # Rough bytes of a chunk besides its texts and vector: keys, ids, scores, positions.
+    CHUNK_OVERHEAD = 1024
+
+    def __init__(self, max_bytes=RETRIEVAL_CACHE_MAX_MB * 1024 * 1024, ttl=RETRIEVAL_CACHE_TTL):
+        self.enabled = max_bytes > 0
+        self.cache = TTLCache(maxsize=max(1, max_bytes), ttl=ttl, getsizeof=lambda ent: ent[2])
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.skipped = 0
+
+    @staticmethod
+    def normalize_question(question):
+        return re.sub(r"\s+", " ", question).strip()
+
+    def key(self, kb_ids, **kwargs):
+        """Returns None when the request can't be cached."""
+        if not self.enabled or not kb_ids:
+            return None
+        kb_ids = sorted(set(kb_ids))
+        versions = get_kb_versions(kb_ids)
+        if versions is None:
+            return None
+        settled = time.time() - RETRIEVAL_CACHE_SETTLE
+        if any(float(v) > settled for v in versions):
+            self.skipped += 1
+            return None
+        kwargs["question"] = self.normalize_question(kwargs.get("question", ""))
+        base = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str) + json.dumps(kb_ids)
+        return xxhash.xxh64(base.encode("utf-8")).hexdigest(), xxhash.xxh64(json.dumps(versions).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        request_key, version = key
+        with self.lock:
+            ent = self.cache.get(request_key)
+            if ent is None:
+                self.misses += 1
+                return None
+            if ent[0] != version:
+                self.invalidated += 1
+                self.misses += 1
+                del self.cache[request_key]
+                return None
+            self.hits += 1
+        return self._unpack(ent[1])
+
+    def set(self, key, ranks):
+        if key is None:
+            return
+        request_key, version = key
+        ranks, size = self._pack(ranks)
+        with self.lock:
+            try:
+                self.cache[request_key] = (version, ranks, size)
+            except ValueError:
+                # Larger than the whole cache.
+                self.skipped += 1
+
+    @classmethod
+    def _pack(cls, ranks):
+        """Copies the chunks with float32 vectors, and estimates the bytes they take."""
+        chunks = []
+        size = cls.CHUNK_OVERHEAD
+        for ck in ranks["chunks"]:
+            ck = dict(ck)
+            if ck.get("vector") is not None:
+                ck["vector"] = np.asarray(ck["vector"], dtype=np.float32)
+                size += ck["vector"].nbytes
+            size += cls.CHUNK_OVERHEAD + sum(len(v) for v in ck.values() if isinstance(v, str))
+            chunks.append(ck)
+        doc_aggs = [dict(agg) for agg in ranks["doc_aggs"]]
+        size += cls.CHUNK_OVERHEAD * len(doc_aggs)
+        return dict(ranks, chunks=chunks, doc_aggs=doc_aggs), size
+
+    @staticmethod
+    def _unpack(ranks):
+        # Callers add, drop and reorder chunks, or fields of a chunk, but don't modify the values in place.
+        chunks = []
+        for ck in ranks["chunks"]:
+            ck = dict(ck)
+            if isinstance(ck.get("vector"), np.ndarray):
+                ck["vector"] = ck["vector"].tolist()
+            chunks.append(ck)
+        return dict(ranks, chunks=chunks, doc_aggs=[dict(agg) for agg in ranks["doc_aggs"]])
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "bytes": self.cache.currsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "skipped": self.skipped,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+RETRIEVAL_CACHE = RetrievalCache()
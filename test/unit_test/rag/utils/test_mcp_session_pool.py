@@ -0,0 +1,206 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+import uvicorn
+from mcp.server.fastmcp import Context, FastMCP
+
+from api.db import MCPServerType
+from rag.utils import mcp_tool_call_conn
+from rag.utils.mcp_tool_call_conn import MCPSessionPool
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(cond, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return cond()
+
+
+@pytest.fixture(scope="module")
+def stub_server():
+    """An in-process MCP server over SSE."""
+    app = FastMCP("stub")
+    state = {"running": 0, "max_running": 0}
+
+    @app.tool()
+    def echo(text: str) -> str:
+        return text
+
+    @app.tool()
+    def whoami(ctx: Context) -> str:
+        return str(id(ctx.session))
+
+    @app.tool()
+    async def nap(seconds: float) -> str:
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            state["running"] -= 1
+        return "done"
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app.sse_app(), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    assert _wait_until(lambda: server.started), "stub MCP server didn't start"
+    yield SimpleNamespace(url=f"http://127.0.0.1:{port}/sse", state=state)
+    server.should_exit = True
+    thread.join(timeout=10)
+
+
+def _mcp_server(url, id="stub"):
+    return SimpleNamespace(id=id, url=url, headers={"X-Api-Key": "${api_key}"}, server_type=MCPServerType.SSE)
+
+
+@pytest.fixture
+def pool():
+    pool = MCPSessionPool(idle_timeout=60, health_interval=60)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.p1
+def test_sessions_are_reused(pool, stub_server):
+    server = _mcp_server(stub_server.url)
+    first = pool.session(server, {"api_key": "a"})
+    second = pool.session(server, {"api_key": "a"})
+    assert first.tool_call("echo", {"text": "hi"}) == "hi"
+    assert first.tool_call("whoami", {}) == second.tool_call("whoami", {})
+    assert [t.name for t in second.get_tools()] == ["echo", "whoami", "nap"]
+    assert pool.stats() == {"sessions": 1, "in_use": 0}
+
+    # Other variables resolve to other headers, hence another connection.
+    other = pool.session(server, {"api_key": "b"})
+    assert other.tool_call("whoami", {}) != first.tool_call("whoami", {})
+    assert pool.stats()["sessions"] == 2
+
+
+@pytest.mark.p1
+def test_concurrent_calls_are_limited(pool, stub_server, monkeypatch):
+    monkeypatch.setattr(mcp_tool_call_conn, "MCP_MAX_CONCURRENT_CALLS", 2)
+    stub_server.state["max_running"] = 0
+    session = pool.session(_mcp_server(stub_server.url, "limited"))
+    session.tool_call("echo", {"text": "warm up"})
+
+    st = time.time()
+    with ThreadPoolExecutor(max_workers=6) as exe:
+        results = list(exe.map(lambda _: session.tool_call("nap", {"seconds": 0.3}), range(6)))
+    assert results == ["done"] * 6
+    assert stub_server.state["max_running"] == 2
+    assert time.time() - st >= 0.8
+
+
+@pytest.mark.p2
+def test_idle_sessions_are_evicted(stub_server):
+    pool = MCPSessionPool(idle_timeout=0.5, health_interval=0.2)
+    try:
+        session = pool.session(_mcp_server(stub_server.url))
+        assert session.tool_call("echo", {"text": "hi"}) == "hi"
+        with pool.checkout(_mcp_server(stub_server.url)) as pooled:
+            pass
+        assert _wait_until(lambda: pool.stats()["sessions"] == 0)
+        assert not pooled.healthy()
+        # Taken again on the next call.
+        assert session.tool_call("echo", {"text": "again"}) == "again"
+        assert pool.stats()["sessions"] == 1
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.p2
+def test_checked_out_session_is_not_evicted(stub_server):
+    pool = MCPSessionPool(idle_timeout=0.2, health_interval=0.1)
+    try:
+        server = _mcp_server(stub_server.url)
+        with pool.checkout(server) as session:
+            time.sleep(0.6)
+            assert pool.stats() == {"sessions": 1, "in_use": 1}
+            assert session.tool_call("echo", {"text": "still here"}) == "still here"
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.p2
+def test_broken_session_is_replaced(pool, stub_server):
+    broken = _mcp_server(f"http://127.0.0.1:{_free_port()}/sse", "broken")
+    with pool.checkout(broken) as first:
+        assert "Error calling tool" in first.tool_call("echo", {"text": "hi"}, 5)
+    assert not first.healthy()
+    with pool.checkout(broken) as second:
+        assert second is not first
+    assert pool.stats()["sessions"] == 1
+
+    # The same server id once it's reachable again.
+    healed = _mcp_server(stub_server.url, "broken")
+    assert pool.session(healed).tool_call("echo", {"text": "hi"}) == "hi"
+
+
+@pytest.mark.p2
+def test_broken_session_is_evicted_by_the_reaper(stub_server):
+    pool = MCPSessionPool(idle_timeout=60, health_interval=0.2)
+    try:
+        broken = _mcp_server(f"http://127.0.0.1:{_free_port()}/sse", "broken")
+        pool.session(broken).tool_call("echo", {"text": "hi"}, 5)
+        assert _wait_until(lambda: pool.stats()["sessions"] == 0)
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.p2
+def test_evict_server(pool, stub_server):
+    a, b = _mcp_server(stub_server.url, "a"), _mcp_server(stub_server.url, "b")
+    for server in [a, b]:
+        assert pool.session(server).tool_call("echo", {"text": "hi"}) == "hi"
+    with pool.checkout(a) as session_a:
+        pass
+    pool.evict("a")
+    assert pool.stats()["sessions"] == 1
+    assert _wait_until(lambda: not session_a.healthy())
+    with pool.checkout(b) as session_b:
+        assert session_b.healthy()
+
+
+@pytest.mark.p2
+def test_shutdown(stub_server):
+    pool = MCPSessionPool(idle_timeout=60, health_interval=0.2)
+    sessions = []
+    for server_id in ["a", "b"]:
+        with pool.checkout(_mcp_server(stub_server.url, server_id)) as session:
+            assert session.tool_call("echo", {"text": "hi"}) == "hi"
+            sessions.append(session)
+    reaper = pool._reaper
+    pool.shutdown()
+    assert pool.stats()["sessions"] == 0
+    assert all(not s.healthy() for s in sessions)
+    reaper.join(timeout=5)
+    assert not reaper.is_alive()